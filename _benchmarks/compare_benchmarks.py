@@ -0,0 +1,63 @@
+import argparse
+import sys
+from pathlib import Path
+
+from _benchmarks.hot_path_benchmark import BenchmarkReport, BenchmarkResult
+
+_METRICS = ('min_us', 'median_us', 'mean_us', 'p95_us')
+
+
+def load_report(path: Path) -> BenchmarkReport:
+    return BenchmarkReport.model_validate_json(path.read_text(encoding='utf-8'))
+
+
+def compare_reports(
+        baseline: BenchmarkReport,
+        current: BenchmarkReport,
+        threshold: float = 0.15,
+        metric: str = 'median_us',
+) -> list[tuple[BenchmarkResult, BenchmarkResult]]:
+    """
+    Prints the benchmarks both reports ran, side by side, flagging those which got slower (or faster) by more than
+        `threshold` (a fraction of the baseline). Returns the regressions, as (baseline, current) result pairs.
+    """
+    baseline_results = {(result.name, result.size): result for result in baseline.results}
+    regressions = []
+    print(f'{baseline.git_commit or "baseline"} -> {current.git_commit or "current"}, {metric}, '
+          f'threshold {threshold:.0%}')
+    print(f'{"benchmark":>55} | {"size":>6} | {"baseline":>12} | {"current":>12} | {"ratio":>6} |')
+    for result in current.results:
+        baseline_result = baseline_results.pop((result.name, result.size), None)
+        if baseline_result is None:
+            continue
+        baseline_value, value = getattr(baseline_result, metric), getattr(result, metric)
+        ratio = value / baseline_value if baseline_value else float('inf')
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append((baseline_result, result))
+        elif ratio < 1 - threshold:
+            flag = 'improvement'
+        else:
+            flag = ''
+        size = '-' if result.size is None else result.size
+        print(f'{result.name:>55} | {size:>6} | {baseline_value:12.1f} | {value:12.1f} | {ratio:6.2f} | {flag}')
+
+    if baseline_results:
+        print(f'{len(baseline_results)} baseline benchmarks were not run: '
+              + ', '.join(f'{name}[{size}]' for name, size in baseline_results))
+    print(f'{len(regressions)} regressions')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compares two hot_path_benchmark JSON reports, exits with 1 if any benchmark regressed.'
+    )
+    parser.add_argument('baseline', type=Path)
+    parser.add_argument('current', type=Path)
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='the slowdown (as a fraction) which counts as a regression, mind the noise of short runs')
+    parser.add_argument('--metric', choices=_METRICS, default='median_us')
+    args = parser.parse_args()
+    if compare_reports(load_report(args.baseline), load_report(args.current), args.threshold, args.metric):
+        sys.exit(1)
@@ -0,0 +1,106 @@
+import argparse
+import itertools
+import time
+from typing import Callable
+
+import numpy as np
+
+from text_similarity import vector_utils
+from text_similarity.text_embedder import sbert_embedder, onnx_embedder
+
+_TOPICS = ['the capital of France', 'a good pasta recipe', 'how vaccines work', 'the rules of chess',
+           'the weather in London', 'learning Python', 'black holes', 'saving for retirement']
+# paraphrase templates -- pairs of the same template family are near duplicates, across families they aren't
+_TEMPLATES = ['What is {}?', 'Tell me about {}.', 'Can you explain {} to me?', 'I want to know about {}',
+              'Give me a short summary of {}', 'Write a poem about {}']
+
+
+def make_prompts() -> list[str]:
+    return [template.format(topic) for topic in _TOPICS for template in _TEMPLATES]
+
+
+def measure_latency(embed: Callable[[str], np.ndarray], prompts: list[str], repetitions: int) -> dict:
+    embed(prompts[0])  # warm up (model loading, allocations)
+    latencies = []
+    for prompt in itertools.islice(itertools.cycle(prompts), repetitions):
+        start_time = time.perf_counter()
+        embed(prompt)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'throughput': 1000 * len(latencies) / sum(latencies),  # prompts per second, one at a time
+    }
+
+
+def hit_agreement(
+        vectors1: np.ndarray,
+        vectors2: np.ndarray,
+        thresholds: list[float],
+        pairwise_distances: Callable[[np.ndarray, np.ndarray], np.ndarray] = vector_utils.pairwise_cosine_distances,
+) -> dict[float, float]:
+    """The share of prompt pairs whose hit decision (distance <= threshold) is the same with both backends."""
+    distances1 = pairwise_distances(vectors1, vectors1)
+    distances2 = pairwise_distances(vectors2, vectors2)
+    pairs = np.triu_indices(len(vectors1), k=1)
+    return {
+        threshold: float(np.mean((distances1[pairs] <= threshold) == (distances2[pairs] <= threshold)))
+        for threshold in thresholds
+    }
+
+
+def run_embedder_benchmark(
+        model: str = 'sentence-transformers/all-MiniLM-L6-v2',
+        onnx_files: tuple[str, ...] = ('onnx/model.onnx', 'onnx/model_qint8_avx512.onnx'),
+        threads: int = 4,
+        repetitions: int = 200,
+        thresholds: tuple[float, ...] = (0.1, 0.2, 0.3),
+        euclidean_thresholds: tuple[float, ...] = (0.45, 0.63, 0.77),
+        onnx_model: str | None = None,
+):
+    """
+    Compares the torch backend with the ONNX ones on the same model, with the same amount of threads: their latency,
+        the largest difference of their raw vectors from torch's, and how often they agree with torch on a hit, by
+        cosine and by Euclidean distance (the latter is sensitive to the vectors' scale, e.g. a missed normalization).
+        `onnx_model` is where the ONNX files are, if not in the model's own repo (e.g. made by `export_onnx_model`).
+    """
+    import torch
+    torch.set_num_threads(threads)
+
+    prompts = make_prompts()
+    # the embedders memoize their results, time the underlying functions
+    backends = {'torch': lambda text: sbert_embedder.__wrapped__(text, model)}
+    for file_name in onnx_files:
+        backends[file_name] = lambda text, file_name=file_name: onnx_embedder.__wrapped__(
+            text, onnx_model or model, file_name, intra_op_threads=threads
+        )
+
+    reference = np.stack([backends['torch'](prompt) for prompt in prompts])
+    print(f'{len(prompts)} prompts, {threads} threads, agreement of hit decisions with torch at cosine thresholds '
+          f'{", ".join(map(str, thresholds))} and Euclidean thresholds {", ".join(map(str, euclidean_thresholds))}')
+    print(f'{"backend":>30} | {"p50 (ms)":>8} | {"p95 (ms)":>8} | {"prompts/s":>9} | {"max diff":>8} | '
+          f'cosine agreement | Euclidean agreement')
+    for name, embed in backends.items():
+        latency = measure_latency(embed, prompts, repetitions)
+        vectors = np.stack([embed(prompt) for prompt in prompts])
+        max_diff = float(np.max(np.abs(vectors - reference)))
+        cosine_agreement = hit_agreement(reference, vectors, list(thresholds))
+        euclidean_agreement = hit_agreement(
+            reference, vectors, list(euclidean_thresholds), vector_utils.pairwise_euclidean_distances
+        )
+        print(f'{name:>30} | {latency["p50_ms"]:8.2f} | {latency["p95_ms"]:8.2f} | {latency["throughput"]:9.0f} | '
+              f'{max_diff:8.2e} | ' + ' '.join(f'{share:.1%}' for share in cosine_agreement.values()) + ' | '
+              + ' '.join(f'{share:.1%}' for share in euclidean_agreement.values()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=run_embedder_benchmark.__doc__)
+    parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2')
+    parser.add_argument('--onnx-model', help='a directory made by `export_onnx_model`, if the model has no ONNX files')
+    parser.add_argument('--onnx-files', nargs='+', default=['onnx/model.onnx', 'onnx/model_qint8_avx512.onnx'])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--repetitions', type=int, default=200)
+    args = parser.parse_args()
+    run_embedder_benchmark(
+        args.model, tuple(args.onnx_files), args.threads, args.repetitions, onnx_model=args.onnx_model
+    )
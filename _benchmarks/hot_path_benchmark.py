@@ -0,0 +1,326 @@
+import argparse
+import itertools
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, NamedTuple
+from unittest import mock
+
+import numpy as np
+from pydantic import BaseModel
+
+from _benchmarks.stubs import stub_embedder
+from cache.similarity_cache.db_handlers import RequestsDB, ResponsesDB, LogStructuredResponsesDB
+from cache.similarity_cache.db_handlers.hashable_lru_cache import hashable_lru_cache
+from cache.similarity_cache.ranking_distance_method import RankingDistanceMethod
+from cache.storage_client import SQLiteClient
+from cache.storage_client.faiss_client import FaissClient, FaissDistanceMethod
+from cache.storage_client.records import ResponseRecord
+from text_similarity import vector_utils
+
+_REPO_ROOT = Path(__file__).parent.parent
+_QUERIES_NUMBER = 1024  # distinct inputs cycled through, more than the memoized functions' cache sizes
+_WORDS = ('alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi omicron pi rho sigma tau upsilon '
+          'phi chi psi omega python cache vector index latency prompt model token stream').split()
+
+
+class BenchmarkResult(BaseModel):
+    name: str
+    size: int | None = None  # the amount of entries the measured structure holds, if it matters
+    iterations: int
+    min_us: float
+    median_us: float
+    mean_us: float
+    p95_us: float
+
+
+class BenchmarkReport(BaseModel):
+    created_at: float
+    git_commit: str | None
+    python: str
+    numpy: str
+    platform: str
+    results: list[BenchmarkResult]
+
+
+class _Case(NamedTuple):
+    name: str
+    size: int | None
+    call: Callable[[int], Any]  # called with the iteration number, to vary its input
+    max_iterations: int = 1000
+
+
+class _Context(NamedTuple):
+    sizes: tuple[int, ...]
+    dim: int
+    storage_dir: Path
+    rng: np.random.Generator
+
+
+def _prompt(i: int) -> str:
+    rng = np.random.default_rng(i)
+    return ' '.join(rng.choice(_WORDS, size=12))
+
+
+def _vectors(context: _Context, amount: int) -> np.ndarray:
+    return context.rng.standard_normal((amount, context.dim), dtype=np.float32)
+
+
+def _populated_faiss_client(context: _Context, path: Path, size: int) -> FaissClient:
+    client = FaissClient(FaissDistanceMethod.L2, path)
+    with mock.patch.object(client, '_persist'):  # persisted once, rather than on each of the inserts
+        for i, vector in enumerate(_vectors(context, size)):
+            client.save(vector, f'key-{i}')
+    client._persist()
+    return client
+
+
+def faiss_client_cases(context: _Context) -> Iterator[_Case]:
+    for size in context.sizes:
+        path = context.storage_dir / f'faiss-{size}' / 'requests.db'
+        client = _populated_faiss_client(context, path, size)
+        queries = _vectors(context, _QUERIES_NUMBER)
+        new_vectors = _vectors(context, 1000)
+        yield _Case('faiss_client.fetch_nearest_k', size, lambda i: client.fetch_nearest_k(queries[i % len(queries)]))
+        yield _Case('faiss_client.save', size, lambda i: client.save(new_vectors[i], f'new-{i}'), len(new_vectors))
+        yield _Case('faiss_client.remove', size, lambda i: client.remove(f'key-{i}'), size // 2)
+        client.close()
+        yield _Case('faiss_client._load', size, lambda i: FaissClient(FaissDistanceMethod.L2, path), 50)
+
+
+def requests_db_cases(context: _Context) -> Iterator[_Case]:
+    for size in context.sizes:
+        client = _populated_faiss_client(context, context.storage_dir / f'requests-{size}' / 'requests.db', size)
+        queries = _vectors(context, _QUERIES_NUMBER)
+        for method in RankingDistanceMethod:
+            requests_db = RequestsDB(method, vector_client=client)
+            yield _Case(
+                f'requests_db.most_similar_request[{method.name.lower()}]',
+                size,
+                lambda i, requests_db=requests_db: requests_db.most_similar_request(queries[i % len(queries)]),
+            )
+
+
+def sqlite_client_cases(context: _Context) -> Iterator[_Case]:
+    for size in context.sizes:
+        client = SQLiteClient(context.storage_dir / f'sqlite-{size}' / 'responses.sql')
+        client.execute('CREATE TABLE responses (key TEXT PRIMARY KEY, request_key TEXT NOT NULL, response TEXT NOT NULL)')
+        client._connection.executemany(
+            'INSERT INTO responses VALUES (?, ?, ?)',
+            ((f'key-{i}', f'request-{i}', _prompt(i) * 20) for i in range(size)),
+        )
+        client._connection.commit()
+
+        responses = [_prompt(i) for i in range(1000)]
+
+        def save(i: int):
+            client.save({'key': f'new-{i}', 'request_key': f'new-request-{i}', 'response': responses[i]}, 'responses')
+
+        yield _Case('sqlite_client.save', size, save, len(responses))
+        yield _Case(
+            'sqlite_client.fetch_by_column', size,
+            lambda i: client.fetch_by_column('request_key', f'request-{i % size}', 'responses'),
+        )
+        yield _Case(
+            'sqlite_client.remove_by_column', size,
+            lambda i: client.remove_by_column('request_key', f'request-{i}', 'responses'), size // 2,
+        )
+        client.disconnect()
+
+
+def responses_db_cases(context: _Context) -> Iterator[_Case]:
+    """The SQLite backend and the log-structured one, side by side."""
+    for size in context.sizes:
+        for name, db_class, file_name in [
+            ('responses_db', ResponsesDB, 'responses.sql'),
+            ('log_structured_responses_db', LogStructuredResponsesDB, 'responses_log'),
+        ]:
+            db = db_class(context.storage_dir / f'{name}-{size}' / file_name)
+            for i in range(size):
+                db.save(ResponseRecord(key=f'key-{i}', request_key=f'request-{i}', response=_prompt(i) * 20))
+            responses = [ResponseRecord(key=f'new-{i}', request_key=f'new-request-{i}', response=_prompt(i) * 20)
+                         for i in range(1000)]
+            yield _Case(f'{name}.fetch_by_request', size, lambda i, db=db: db.fetch_by_request(f'request-{i % size}'))
+            yield _Case(f'{name}.save', size, lambda i, db=db, responses=responses: db.save(responses[i]), 1000)
+            yield _Case(f'{name}.remove_by_request', size,
+                        lambda i, db=db: db.remove_by_request(f'request-{i}'), size // 2)
+            db.close()
+
+
+def _cache_factories() -> dict[str, Callable[..., Any]]:
+    """The policies, imported here so a missing optional dependency only skips its own policy."""
+    factories = {}
+    for name, module, class_name in [
+        ('lru', 'cache.lru_similarity_cache', 'LRUSimilarityCache'),
+        ('lfu', 'cache.lfu_similarity_cache', 'LFUSimilarityCache'),
+        ('fifo', 'cache.fifo_similarity_cache', 'FIFOSimilarityCache'),
+        ('rr', 'cache.rr_similarity_cache', 'RRSimilarityCache'),
+        ('shared_lru', 'cache.shared_lru_similarity_cache', 'SharedLRUSimilarityCache'),
+        ('prefix_lru', 'cache.prefix_based.prefix_lru_similarity_cache', 'PrefixLRUSimilarityCache'),
+        ('adaptive_pipeline', 'cache.adaptive_pipeline_similarity_cache', 'AdaptivePipelineSimilarityCache'),
+    ]:
+        try:
+            factories[name] = getattr(__import__(module, fromlist=[class_name]), class_name)
+        except ImportError as e:
+            print(f'skipping the {name} cache: {e}')
+    return factories
+
+
+def similarity_cache_cases(context: _Context) -> Iterator[_Case]:
+    # the kwargs the policies which need them expect, the others ignore them
+    kwargs = {'llm_delay': 200.0, 'llm_latency': 200.0}
+    for size in context.sizes:
+        for name, cache_class in _cache_factories().items():
+            try:
+                cache = cache_class(
+                    max_size=size,
+                    hit_distance_threshold=0.5,
+                    candidates_number=10,
+                    ranking_distance_method=RankingDistanceMethod.COSINE,
+                    db_distance_method=FaissDistanceMethod.L2,
+                    prompt_embedder=stub_embedder,
+                    storage_dir=context.storage_dir / f'{name}-{size}',
+                )
+            except (TypeError, ValueError) as e:  # e.g. an installed adaptive_pipeline with a different API
+                print(f'skipping the {name} cache: {e}')
+                continue
+            prompts = [_prompt(i) for i in range(size + 200)]
+            with mock.patch.object(FaissClient, '_persist'):  # filled to capacity, without persisting every insert
+                for prompt in prompts[:size]:
+                    cache.on_miss(prompt, prompt * 20, **kwargs)
+            # hits on the prefilled prompts, before the misses evict some of them
+            yield _Case(f'{name}_similarity_cache.on_hit', size,
+                        lambda i, cache=cache, prompts=prompts: cache.on_hit(prompts[i % size], **kwargs))
+            # misses at full capacity, i.e. each one evicts
+            yield _Case(f'{name}_similarity_cache.on_miss', size,
+                        lambda i, cache=cache, prompts=prompts: cache.on_miss(prompts[size + i], prompts[i], **kwargs),
+                        200)
+            cache.close()
+
+
+def hashable_lru_cache_cases(context: _Context) -> Iterator[_Case]:
+    @hashable_lru_cache
+    def memoized(vector):
+        return None
+
+    vectors = _vectors(context, _QUERIES_NUMBER)
+    vector_lists = [vector.tolist() for vector in vectors[:8]]
+    memoized(vectors[0])
+    for vector_list in vector_lists:
+        memoized(vector_list)
+    yield _Case('hashable_lru_cache.hit[ndarray]', None, lambda i: memoized(vectors[0]))
+    yield _Case('hashable_lru_cache.miss[ndarray]', None, lambda i: memoized(vectors[i % len(vectors)]))
+    yield _Case('hashable_lru_cache.hit[list]', None, lambda i: memoized(vector_lists[i % len(vector_lists)]))
+
+
+def vector_utils_cases(context: _Context) -> Iterator[_Case]:
+    queries = _vectors(context, _QUERIES_NUMBER)
+    query_tuples = [tuple(query.tolist()) for query in queries]
+    candidates = _vectors(context, 100)
+    candidate_tuple = tuple(candidates[0].tolist())
+    batch = _vectors(context, 16)
+    for name in ('euclidean', 'manhattan', 'cosine'):
+        scalar = getattr(vector_utils, f'{name}_distance')
+        kernel = getattr(vector_utils, f'{name}_distances')
+        pairwise_kernel = getattr(vector_utils, f'pairwise_{name}_distances')
+        yield _Case(f'vector_utils.{name}_distance', None,
+                    lambda i, scalar=scalar: scalar(query_tuples[i % len(query_tuples)], candidate_tuple))
+        yield _Case(f'vector_utils.{name}_distances[100]', None,
+                    lambda i, kernel=kernel: kernel(queries[i % len(queries)], candidates))
+        yield _Case(f'vector_utils.pairwise_{name}_distances[16x100]', None,
+                    lambda i, pairwise_kernel=pairwise_kernel: pairwise_kernel(batch, candidates))
+
+
+BENCHMARKS: dict[str, Callable[[_Context], Iterator[_Case]]] = {
+    'faiss_client': faiss_client_cases,
+    'requests_db': requests_db_cases,
+    'sqlite_client': sqlite_client_cases,
+    'responses_db': responses_db_cases,
+    'similarity_caches': similarity_cache_cases,
+    'hashable_lru_cache': hashable_lru_cache_cases,
+    'vector_utils': vector_utils_cases,
+}
+
+
+def measure(case: _Case, time_budget: float) -> BenchmarkResult:
+    """
+    Times single calls, as many as fit in `time_budget` seconds (at least 3, at most the case's maximum). Each call is
+        timed on its own, so the tail (e.g. an occasional compaction or eviction) shows in the p95.
+    """
+    timings = []
+    start_time = time.perf_counter()
+    for i in itertools.count():
+        if i >= case.max_iterations or (i >= 3 and time.perf_counter() - start_time >= time_budget):
+            break
+        call_start_time = time.perf_counter_ns()
+        case.call(i)
+        timings.append((time.perf_counter_ns() - call_start_time) / 1000)
+    timings = np.asarray(timings)
+    return BenchmarkResult(
+        name=case.name,
+        size=case.size,
+        iterations=timings.size,
+        min_us=float(timings.min()),
+        median_us=float(np.median(timings)),
+        mean_us=float(timings.mean()),
+        p95_us=float(np.percentile(timings, 95)),
+    )
+
+
+def run_hot_path_benchmark(
+        groups: list[str] | None = None,
+        sizes: tuple[int, ...] = (100, 1000),
+        dim: int = 384,
+        time_budget: float = 1.0,
+        seed: int = 0,
+) -> BenchmarkReport:
+    """
+    Runs the hot path microbenchmarks (all the groups by default) offline, on synthetic vectors and stub embeddings,
+        at each of the given sizes (entries in the measured index, table or cache).
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as storage_dir:
+        context = _Context(sizes, dim, Path(storage_dir), np.random.default_rng(seed))
+        for group in groups or BENCHMARKS:
+            for case in BENCHMARKS[group](context):
+                result = measure(case, time_budget)
+                results.append(result)
+                size = '-' if result.size is None else result.size
+                print(f'{result.name:>55} | {size:>6} | {result.median_us:12.1f} | {result.p95_us:12.1f} | '
+                      f'{result.iterations:>6}')
+    return BenchmarkReport(
+        created_at=time.time(),
+        git_commit=_git_commit(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        platform=platform.platform(),
+        results=results,
+    )
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=_REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=run_hot_path_benchmark.__doc__)
+    parser.add_argument('--groups', nargs='+', choices=list(BENCHMARKS), help='defaults to all of them')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000])
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--time-budget', type=float, default=1.0, help='seconds per benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, help='a JSON file to write the results to (see compare_benchmarks)')
+    args = parser.parse_args()
+
+    print(f'{"benchmark":>55} | {"size":>6} | {"median (µs)":>12} | {"p95 (µs)":>12} | {"calls":>6}')
+    report = run_hot_path_benchmark(args.groups, tuple(args.sizes), args.dim, args.time_budget, args.seed)
+    if args.output is not None:
+        args.output.write_text(report.model_dump_json(indent=2), encoding='utf-8')
+        print(f'results written to {args.output}')
@@ -0,0 +1,366 @@
+import argparse
+import functools
+import logging
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Literal, NamedTuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from _benchmarks.stubs import StubLLM, stub_embedder
+from cache.similarity_cache.ranking_distance_method import RankingDistanceMethod
+from cache.storage_client.faiss_client import FaissDistanceMethod
+from echollm import EchoLLM, PrefixEchoLLM
+from llm import ILLM
+
+Mode = Literal['ask', 'stream', 'prefix']
+Outcome = Literal['hit', 'prefix_hit', 'miss', 'error']
+
+_TEMPLATES = ['What is {}?', 'Tell me about {}.', 'Can you explain {} to me?', 'I want to know about {}',
+              'Give me a short summary of {}', 'Describe {} in simple terms']
+_POLICIES = {
+    'lru': ('cache.lru_similarity_cache', 'LRUSimilarityCache'),
+    'lfu': ('cache.lfu_similarity_cache', 'LFUSimilarityCache'),
+    'fifo': ('cache.fifo_similarity_cache', 'FIFOSimilarityCache'),
+    'rr': ('cache.rr_similarity_cache', 'RRSimilarityCache'),
+}
+
+
+class WorkloadMix(BaseModel):
+    """
+    Each request is about a topic drawn by a Zipf popularity (the k-th most popular topic is asked 1/k^s as often as
+        the most popular one). It's the topic's canonical prompt with probability `repeat_rate`, a paraphrase of it with
+        probability `paraphrase_rate`, and otherwise a novel prompt, unrelated to any other request.
+    """
+    repeat_rate: float = 0.5
+    paraphrase_rate: float = 0.3
+    zipf_exponent: float = 1.1
+    topics_number: int = 200
+    seed: int = 0
+
+
+class WorkloadRequest(NamedTuple):
+    prompt: str
+    kind: Literal['repeat', 'paraphrase', 'novel']
+
+
+class RequestSample(BaseModel):
+    start_s: float  # since the load test started
+    latency_ms: float  # until the response was fully received
+    ttft_ms: float | None = None  # until the first chunk was received, for streams
+    outcome: Outcome
+    kind: str
+    error: str | None = None
+
+
+class LatencySummary(BaseModel):
+    count: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+class HitRatioWindow(BaseModel):
+    end_s: float
+    requests: int
+    hit_ratio: float  # prefix hits included
+
+
+class LoadTestReport(BaseModel):
+    mode: Mode
+    concurrency: int
+    mix: WorkloadMix
+    duration_s: float
+    throughput: float  # completed requests per second
+    requests: int
+    errors: int
+    error_types: dict[str, int]  # e.g. races surfaced by the concurrency
+    hit_ratio: float
+    latency: dict[str, LatencySummary]  # per outcome, and 'all'
+    ttft: dict[str, LatencySummary]
+    hit_ratio_timeline: list[HitRatioWindow]
+    samples: list[RequestSample] | None = None
+
+
+class _OutcomeRecorder:
+    """Records, per thread, how the last request was served -- the target's `outcome_listener`."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def record(self, outcome: Outcome) -> None:
+        self._local.outcome = outcome
+
+    def pop(self) -> Outcome:
+        outcome, self._local.outcome = getattr(self._local, 'outcome', None), None
+        return outcome or 'miss'
+
+
+def make_workload(mix: WorkloadMix, requests_number: int) -> list[WorkloadRequest]:
+    if not 0 <= mix.repeat_rate + mix.paraphrase_rate <= 1:
+        raise ValueError('repeat_rate + paraphrase_rate must be between 0 and 1')
+    rng = np.random.default_rng(mix.seed)
+    topics = [' '.join(_pseudo_word(rng) for _ in range(3)) for _ in range(mix.topics_number)]
+    popularity = 1 / np.arange(1, mix.topics_number + 1) ** mix.zipf_exponent
+    topic_indices = rng.choice(mix.topics_number, size=requests_number, p=popularity / popularity.sum())
+    kinds = rng.random(requests_number)
+
+    workload = []
+    for topic_index, kind in zip(topic_indices, kinds):
+        topic = topics[topic_index]
+        if kind < mix.repeat_rate:
+            workload.append(WorkloadRequest(_TEMPLATES[0].format(topic), 'repeat'))
+        elif kind < mix.repeat_rate + mix.paraphrase_rate:
+            template = _TEMPLATES[rng.integers(1, len(_TEMPLATES))]
+            workload.append(WorkloadRequest(template.format(topic), 'paraphrase'))
+        else:
+            workload.append(WorkloadRequest(' '.join(_pseudo_word(rng) for _ in range(8)), 'novel'))
+    return workload
+
+
+def _pseudo_word(rng: np.random.Generator) -> str:
+    return ''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz'), size=rng.integers(4, 9)))
+
+
+def run_load_test(
+        target: EchoLLM | PrefixEchoLLM,
+        workload: list[WorkloadRequest],
+        mode: Mode = 'ask',
+        concurrency: int = 8,
+        window: float = 1.0,
+        mix: WorkloadMix | None = None,
+        include_samples: bool = False,
+) -> LoadTestReport:
+    """
+    Sends the workload's requests with `concurrency` threads, each sending its next request once the previous one is
+        fully received (a closed loop), and reports the throughput, the latency (and TTFT for streams) percentiles per
+        outcome, and the hit ratio in windows of `window` seconds.
+    """
+    if mode == 'prefix' and not isinstance(target, PrefixEchoLLM):
+        raise ValueError('the prefix mode requires a PrefixEchoLLM')
+    requests = iter(workload)
+    requests_lock = threading.Lock()
+    samples: list[RequestSample] = []
+    recorder = _OutcomeRecorder()
+
+    def next_request() -> WorkloadRequest | None:
+        with requests_lock:
+            return next(requests, None)
+
+    def worker():
+        while (request := next_request()) is not None:
+            request_start_time = time.perf_counter()
+            ttft, error = None, None
+            try:
+                if mode == 'ask':
+                    target.ask(request.prompt)
+                else:
+                    for i, _ in enumerate(target.stream_ask(request.prompt)):
+                        if i == 0:
+                            ttft = (time.perf_counter() - request_start_time) * 1000
+                outcome = recorder.pop()
+            except Exception as e:
+                recorder.pop()
+                outcome, error = 'error', type(e).__name__
+            samples.append(RequestSample(
+                start_s=request_start_time - start_time,
+                latency_ms=(time.perf_counter() - request_start_time) * 1000,
+                ttft_ms=ttft,
+                outcome=outcome,
+                kind=request.kind,
+                error=error,
+            ))
+
+    # the per-request info logs would dominate the measured time, warnings and errors are still logged
+    logger = logging.getLogger('EchoLLM')
+    level, outcome_listener = logger.level, target.outcome_listener
+    logger.setLevel(logging.WARNING)
+    target.outcome_listener = recorder.record
+    start_time = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load') as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+    finally:
+        duration = time.perf_counter() - start_time
+        logger.setLevel(level)
+        target.outcome_listener = outcome_listener
+
+    return _report(samples, duration, mode, concurrency, window, mix or WorkloadMix(), include_samples)
+
+
+def _report(
+        samples: list[RequestSample],
+        duration: float,
+        mode: Mode,
+        concurrency: int,
+        window: float,
+        mix: WorkloadMix,
+        include_samples: bool,
+) -> LoadTestReport:
+    samples.sort(key=lambda sample: sample.start_s)
+    served = [sample for sample in samples if sample.outcome != 'error']
+    outcomes = {'all': served, **{
+        outcome: [sample for sample in served if sample.outcome == outcome] for outcome in ('hit', 'prefix_hit', 'miss')
+    }}
+
+    timeline = []
+    end_times = np.asarray([sample.start_s + sample.latency_ms / 1000 for sample in served])
+    is_hit = np.asarray([sample.outcome != 'miss' for sample in served])
+    for window_end in np.arange(window, duration + window, window):
+        in_window = (end_times > window_end - window) & (end_times <= window_end)
+        if in_window.any():
+            timeline.append(HitRatioWindow(
+                end_s=float(window_end), requests=int(in_window.sum()), hit_ratio=float(is_hit[in_window].mean())
+            ))
+
+    return LoadTestReport(
+        mode=mode,
+        concurrency=concurrency,
+        mix=mix,
+        duration_s=duration,
+        throughput=len(served) / duration,
+        requests=len(samples),
+        errors=len(samples) - len(served),
+        error_types=dict(Counter(sample.error for sample in samples if sample.error is not None)),
+        hit_ratio=float(is_hit.mean()) if served else 0.0,
+        latency={
+            outcome: _summary([sample.latency_ms for sample in outcome_samples])
+            for outcome, outcome_samples in outcomes.items() if outcome_samples
+        },
+        ttft={
+            outcome: _summary(ttfts) for outcome, outcome_samples in outcomes.items()
+            # empty streams have no first chunk
+            if mode != 'ask' and (ttfts := [sample.ttft_ms for sample in outcome_samples if sample.ttft_ms is not None])
+        },
+        hit_ratio_timeline=timeline,
+        samples=samples if include_samples else None,
+    )
+
+
+def _summary(values: list[float]) -> LatencySummary:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return LatencySummary(
+        count=len(values), mean_ms=float(np.mean(values)), p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99)
+    )
+
+
+def build_target(
+        mode: Mode,
+        llm: ILLM,
+        prompt_embedder: Callable[[str], np.ndarray],
+        storage_dir: Path,
+        policy: str | None = 'lru',
+        max_size: int = 100,
+        hit_distance_threshold: float = 0.5,
+) -> EchoLLM | PrefixEchoLLM:
+    """An EchoLLM with the given policy's cache (no cache if None), or a PrefixEchoLLM for the prefix mode."""
+    cache_kwargs = dict(
+        max_size=max_size,
+        hit_distance_threshold=hit_distance_threshold,
+        candidates_number=10,
+        ranking_distance_method=RankingDistanceMethod.COSINE,
+        db_distance_method=FaissDistanceMethod.L2,
+        prompt_embedder=prompt_embedder,
+        storage_dir=storage_dir,
+    )
+    if mode == 'prefix':
+        from cache.prefix_based.prefix_lru_similarity_cache import PrefixLRUSimilarityCache
+        return PrefixEchoLLM(cache=PrefixLRUSimilarityCache(**cache_kwargs) if policy else None, llm=llm)
+    if policy is None:
+        return EchoLLM(cache=None, llm=llm)
+    module, class_name = _POLICIES[policy]
+    cache_class = getattr(__import__(module, fromlist=[class_name]), class_name)
+    return EchoLLM(cache=cache_class(**cache_kwargs), llm=llm)
+
+
+def print_report(report: LoadTestReport) -> None:
+    print(f'{report.requests} requests ({report.errors} errors) in {report.duration_s:.1f}s with {report.concurrency} '
+          f'threads: {report.throughput:.1f} requests/s, hit ratio {report.hit_ratio:.1%}')
+    print(f'{"":>12} | {"count":>6} | {"p50 (ms)":>9} | {"p95 (ms)":>9} | {"p99 (ms)":>9} | {"TTFT p50":>9} | '
+          f'{"TTFT p99":>9}')
+    for outcome, summary in report.latency.items():
+        ttft = report.ttft.get(outcome)
+        ttft_columns = f'{ttft.p50_ms:9.1f} | {ttft.p99_ms:9.1f}' if ttft else f'{"-":>9} | {"-":>9}'
+        print(f'{outcome:>12} | {summary.count:>6} | {summary.p50_ms:9.1f} | {summary.p95_ms:9.1f} | '
+              f'{summary.p99_ms:9.1f} | {ttft_columns}')
+    if report.error_types:
+        print('errors: ' + ', '.join(f'{error} x{count}' for error, count in report.error_types.items()))
+    print('hit ratio over time: ' + ' '.join(f'{window.hit_ratio:.0%}' for window in report.hit_ratio_timeline))
+
+
+def _embedder(name: str) -> Callable[[str], np.ndarray]:
+    if name == 'stub':
+        return functools.partial(stub_embedder, dim=256)
+    from text_similarity import text_embedder
+    return getattr(text_embedder, f'{name}_embedder')
+
+
+def _llm(args: argparse.Namespace) -> ILLM:
+    if args.ollama_model is None:
+        return StubLLM(args.first_token_delay, args.chunk_delay, args.chunks_number)
+    from llm import Ollama
+    from llm.ollama_llm import OllamaModel
+    return Ollama(model=OllamaModel(args.ollama_model), host=args.ollama_host)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=run_load_test.__doc__)
+    parser.add_argument('--mode', choices=['ask', 'stream', 'prefix'], default='ask')
+    parser.add_argument('--policy', choices=[*_POLICIES, 'none'], default='lru', help='the prefix mode uses LRU')
+    parser.add_argument('--max-size', type=int, default=100)
+    parser.add_argument('--threshold', type=float, default=0.5, help='the hit distance threshold')
+    parser.add_argument('--embedder', default='stub', help='stub, or a text_embedder backend, e.g. sbert or onnx')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--repeat-rate', type=float, default=0.5)
+    parser.add_argument('--paraphrase-rate', type=float, default=0.3)
+    parser.add_argument('--zipf-exponent', type=float, default=1.1)
+    parser.add_argument('--topics', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--window', type=float, default=1.0, help='seconds, for the hit ratio over time')
+    parser.add_argument('--first-token-delay', type=float, default=0.2, help='seconds, of the stub LLM')
+    parser.add_argument('--chunk-delay', type=float, default=0.005, help='seconds, of the stub LLM')
+    parser.add_argument('--chunks-number', type=int, default=40, help='of the stub LLM')
+    parser.add_argument('--ollama-model', help='asks a real Ollama model instead of the stub LLM')
+    parser.add_argument('--ollama-host', default='http://localhost:11434')
+    parser.add_argument('--output', type=Path, help='a JSON file to write the report to')
+    parser.add_argument('--include-samples', action='store_true', help='adds every request\'s sample to the report')
+    args = parser.parse_args()
+
+    workload_mix = WorkloadMix(
+        repeat_rate=args.repeat_rate,
+        paraphrase_rate=args.paraphrase_rate,
+        zipf_exponent=args.zipf_exponent,
+        topics_number=args.topics,
+        seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        load_target = build_target(
+            args.mode,
+            _llm(args),
+            _embedder(args.embedder),
+            Path(temp_dir),
+            None if args.policy == 'none' else args.policy,
+            args.max_size,
+            args.threshold,
+        )
+        load_report = run_load_test(
+            load_target,
+            make_workload(workload_mix, args.requests),
+            args.mode,
+            args.concurrency,
+            args.window,
+            workload_mix,
+            args.include_samples,
+        )
+    print_report(load_report)
+    if args.output is not None:
+        args.output.write_text(load_report.model_dump_json(indent=2, exclude_none=True), encoding='utf-8')
+        print(f'report written to {args.output}')
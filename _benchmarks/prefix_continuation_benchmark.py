@@ -0,0 +1,78 @@
+import tempfile
+import time
+from pathlib import Path
+from statistics import mean
+from typing import Iterator
+from unittest import mock
+
+from _benchmarks.stubs import StubLLM, stub_embedder
+from cache.prefix_based.prefix_lru_similarity_cache import PrefixLRUSimilarityCache
+from cache.similarity_cache.ranking_distance_method import RankingDistanceMethod
+from cache.storage_client.faiss_client import FaissDistanceMethod
+from echollm.prefix_echollm import PrefixEchoLLM
+
+
+class _LazyStream:
+    """The previous behaviour: the continuation request is sent only when the chunk after the prefix is asked for."""
+
+    def __init__(self, iterator: Iterator[str]):
+        self._iterator = iterator
+
+    def __iter__(self):
+        return self._iterator
+
+    def close(self):
+        pass
+
+
+def _measure(echo_llm: PrefixEchoLLM, prompt: str, prefix_render_delay: float) -> tuple[float, float]:
+    """Returns the first-byte and full-response latencies (ms) of a hit, for a caller rendering the prefix slowly."""
+    start_time = time.perf_counter()
+    stream = echo_llm.stream_ask(prompt)
+    first_byte_latency = None
+    for i, _ in enumerate(stream):
+        if i == 0:
+            first_byte_latency = (time.perf_counter() - start_time) * 1000
+            time.sleep(prefix_render_delay)  # the caller is busy sending/rendering the prefix
+    return first_byte_latency, (time.perf_counter() - start_time) * 1000
+
+
+def run_prefix_continuation_benchmark(
+        first_token_delay: float = 0.3, prefix_render_delay: float = 0.2, repetitions: int = 5
+):
+    llm = StubLLM(first_token_delay=first_token_delay, chunk_delay=0.002, chunks_number=50)
+    with tempfile.TemporaryDirectory() as storage_dir:
+        echo_llm = PrefixEchoLLM(
+            cache=PrefixLRUSimilarityCache(
+                max_size=10,
+                hit_distance_threshold=0.5,
+                candidates_number=10,
+                ranking_distance_method=RankingDistanceMethod.COSINE,
+                db_distance_method=FaissDistanceMethod.L2,
+                prompt_embedder=stub_embedder,
+                storage_dir=Path(storage_dir),
+            ),
+            llm=llm,
+        )
+        for _ in echo_llm.stream_ask('Show me 2 ways to sort a list of numbers in python'):
+            pass  # populate the cache
+
+        hit_prompt = 'Show me two ways to sort a list of numbers in python'
+        results = {}
+        with mock.patch('echollm.prefix_echollm.PrefetchedStream', _LazyStream):
+            results['lazy continuation (previous)'] = [
+                _measure(echo_llm, hit_prompt, prefix_render_delay) for _ in range(repetitions)
+            ]
+        results['prefetched continuation'] = [
+            _measure(echo_llm, hit_prompt, prefix_render_delay) for _ in range(repetitions)
+        ]
+
+    print(f'LLM TTFT={first_token_delay * 1000:.0f}ms, prefix render time={prefix_render_delay * 1000:.0f}ms')
+    for name, measurements in results.items():
+        first_byte = mean(m[0] for m in measurements)
+        full_response = mean(m[1] for m in measurements)
+        print(f'{name:>30}: first byte {first_byte:8.2f}ms | full response {full_response:8.2f}ms')
+
+
+if __name__ == '__main__':
+    run_prefix_continuation_benchmark()
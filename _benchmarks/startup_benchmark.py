@@ -0,0 +1,62 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from statistics import median
+
+_REPO_ROOT = Path(__file__).parent.parent
+
+# what a process pays before doing any work, for each way into the package
+ENTRY_POINTS = [
+    'llm',
+    'llm.chatgpt_llm',
+    'llm.ollama_llm',
+    'text_similarity.text_embedder',
+    'cache.lru_similarity_cache',
+    'cache.shared_lru_similarity_cache',
+    'cache.remote',
+    'echollm',
+]
+
+# measured in a fresh interpreter, so modules imported by a previous entry point don't hide their cost
+_MEASURE_SCRIPT = '''
+import json, resource, sys, time
+baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start_time = time.perf_counter()
+import {module}
+import_time = (time.perf_counter() - start_time) * 1000
+heavy_modules = [m for m in ('faiss', 'torch', 'sentence_transformers', 'openai', 'ollama', 'adaptive_pipeline')
+                 if m in sys.modules]
+print(json.dumps({{
+    'import_ms': import_time,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'import_rss_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+    'heavy_modules': heavy_modules,
+}}))
+'''
+
+
+def measure_entry_point(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, '-c', _MEASURE_SCRIPT.format(module=module)],
+        cwd=_REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_startup_benchmark(entry_points: list[str] = ENTRY_POINTS, repetitions: int = 3):
+    print(f'{"entry point":>35} | {"import (ms)":>11} | {"peak RSS (MB)":>13} | {"by import (MB)":>14} | heavy modules')
+    for module in entry_points:
+        measurements = [measure_entry_point(module) for _ in range(repetitions)]
+        import_time = median(m['import_ms'] for m in measurements)
+        rss = median(m['rss_mb'] for m in measurements)
+        import_rss = median(m['import_rss_mb'] for m in measurements)
+        heavy_modules = ', '.join(measurements[-1]['heavy_modules']) or '-'
+        print(f'{module:>35} | {import_time:11.1f} | {rss:13.1f} | {import_rss:14.1f} | {heavy_modules}')
+
+
+if __name__ == '__main__':
+    run_startup_benchmark()
@@ -0,0 +1,64 @@
+import hashlib
+import time
+from typing import Iterator
+
+import numpy as np
+
+from llm import ILLM, LLMResponse
+from llm.illm import LLMResponseChunk
+
+
+class StubResponse(LLMResponse):
+    pass
+
+
+class StubLLM(ILLM):
+    """An offline LLM with a configurable time-to-first-token and streaming rate, for benchmarks."""
+
+    def __init__(
+            self,
+            first_token_delay: float = 0.2,  # seconds
+            chunk_delay: float = 0.005,  # seconds
+            chunks_number: int = 40,
+            chunk: str = 'lorem ipsum ',
+    ):
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunks_number = chunks_number
+        self.chunk = chunk
+        self.calls = 0
+
+    def ask(self, prompt: str, **kwargs) -> StubResponse:
+        self.calls += 1
+        start_time = time.perf_counter()
+        time.sleep(self.first_token_delay + self.chunk_delay * (self.chunks_number - 1))
+        return StubResponse(
+            response=self._response(prompt),
+            latency=(time.perf_counter() - start_time) * 1000,
+        )
+
+    def stream_ask(self, prompt: str, **kwargs) -> Iterator[LLMResponseChunk]:
+        self.calls += 1
+        start_time = time.perf_counter()
+        time.sleep(self.first_token_delay)
+        for i in range(1, self.chunks_number + 1):
+            if i > 1:
+                time.sleep(self.chunk_delay)
+            yield LLMResponseChunk(
+                response_chunk=self.chunk if i > 1 else f'[{hashlib.md5(prompt.encode()).hexdigest()[:8]}] ',
+                chunk_number=i,
+                delay=(time.perf_counter() - start_time) * 1000,
+            )
+
+    def _response(self, prompt: str) -> str:
+        return f'[{hashlib.md5(prompt.encode()).hexdigest()[:8]}] ' + self.chunk * (self.chunks_number - 1)
+
+
+def stub_embedder(text: str, dim: int = 64) -> np.ndarray:
+    """Bag of hashed words -- prompts sharing most of their words get close vectors, no model needed."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        word = word.strip('.,!?;:')
+        if word:
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+    return vector
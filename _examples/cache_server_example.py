@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from cache.lru_similarity_cache import LRUSimilarityCache
+from cache.remote import CacheServer
+from cache.similarity_cache.ranking_distance_method import RankingDistanceMethod
+from cache.storage_client.faiss_client import FaissDistanceMethod
+from text_similarity import text_embedder
+
+SOCKET_PATH = Path('/tmp/echollm-cache.sock')
+
+
+def run_cache_server():
+    """
+    Hosts one cache for every process on the host. Other processes use it through `RemoteCache`:
+        echo_llm = EchoLLM(cache=RemoteCache(SOCKET_PATH), llm=...)
+    """
+    server = CacheServer(
+        cache=LRUSimilarityCache(
+            max_size=1000,
+            hit_distance_threshold=0.2,
+            candidates_number=10,
+            ranking_distance_method=RankingDistanceMethod.COSINE,
+            db_distance_method=FaissDistanceMethod.L2,
+            prompt_embedder=text_embedder.sbert_embedder,
+        ),
+        socket_path=SOCKET_PATH,
+    )
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    run_cache_server()
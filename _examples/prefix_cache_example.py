@@ -18,9 +18,10 @@ def run_cache_example():
             ranking_distance_method=RankingDistanceMethod.COSINE,
             db_distance_method=FaissDistanceMethod.L2,
             prompt_embedder=text_embedder.sbert_embedder,
-            bandwidth=7_500,  # Mbps
+            bandwidth=0.2,  # characters per ms, until the LLM's streaming rate is measured
             delay_ewma_smoothing_factor=0.2,
-            prefix_size_confidence_factor=2
+            prefix_size_confidence_factor=2,
+            full_hit_distance_threshold=0.05,  # near-exact repeats are served whole, with no continuation call
         ),
         llm=Ollama(
             model=OllamaModel.QWEN3_4B,
@@ -1,12 +1,15 @@
 import logging
+from pathlib import Path
 from typing import Callable, Any
 
 from adaptive_pipeline import AdaptivePipelineCache
 
+from text_similarity.vector_utils import Vector
 from .similarity_cache import SimilarityCache
+from .similarity_cache.db_handlers import IResponsesDB
 from .similarity_cache.ranking_distance_method import RankingDistanceMethod
 from .storage_client.faiss_client import FaissDistanceMethod
-from .storage_client.records import EmbeddedRequestRecord, ResponseRecord
+from .storage_client.records import ResponseRecord
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('EchoLLM')
@@ -35,7 +38,9 @@ class AdaptivePipelineSimilarityCache(SimilarityCache):
             candidates_number: int,
             ranking_distance_method: RankingDistanceMethod,
             db_distance_method: FaissDistanceMethod,
-            prompt_embedder: Callable[[str], list[float]]
+            prompt_embedder: Callable[[str], Vector],
+            storage_dir: Path | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
     ):
         super().__init__(
             max_size,
@@ -44,7 +49,9 @@ class AdaptivePipelineSimilarityCache(SimilarityCache):
             ranking_distance_method,
             db_distance_method,
             prompt_embedder,
-            'Similarity Adaptive-Pipeline'
+            'Similarity Adaptive-Pipeline',
+            storage_dir,
+            responses_db_factory=responses_db_factory,
         )
         self._ap_cache = HookedAdaptivePipelineCache(max_size)
 
@@ -62,14 +69,11 @@ class AdaptivePipelineSimilarityCache(SimilarityCache):
 
         # if the last insert caused an eviction due to reaching maximum capacity
         if len(self._ap_cache) == self._max_size and self._ap_cache.last_evicted is not None:
-            prompt_key, _ = self._ap_cache.last_evicted
-            self._requests_db.remove(prompt_key)
-            self._responses_db.remove_by_request(prompt_key)
+            evicted_key, _ = self._ap_cache.last_evicted
+            self._remove_entry(evicted_key)
 
-        self._requests_db.save(
-            EmbeddedRequestRecord(key=prompt_key, vector=self._embedder(prompt))
-        )
+        self._save_request(prompt_key, prompt)
         response_key = self._generate_key(llm_response)
         self._responses_db.save(
-            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response)
+            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response, prompt=prompt)
         )
@@ -1,12 +1,16 @@
 import logging
+from pathlib import Path
 from typing import Callable, Any
 
 from cachetools import FIFOCache
 
+from text_similarity.vector_utils import Vector
 from .similarity_cache import SimilarityCache
+from .similarity_cache.db_handlers import IResponsesDB
+from .similarity_cache.near_duplicate_index import MinHashLSHIndex
 from .similarity_cache.ranking_distance_method import RankingDistanceMethod
 from .storage_client.faiss_client import FaissDistanceMethod
-from .storage_client.records import EmbeddedRequestRecord, ResponseRecord
+from .storage_client.records import ResponseRecord
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('EchoLLM')
@@ -31,7 +35,10 @@ class FIFOSimilarityCache(SimilarityCache):
             candidates_number: int,
             ranking_distance_method: RankingDistanceMethod,
             db_distance_method: FaissDistanceMethod,
-            prompt_embedder: Callable[[str], list[float]]
+            prompt_embedder: Callable[[str], Vector],
+            storage_dir: Path | None = None,
+            near_duplicate_index: MinHashLSHIndex | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
     ):
         super().__init__(
             max_size,
@@ -40,7 +47,10 @@ class FIFOSimilarityCache(SimilarityCache):
             ranking_distance_method,
             db_distance_method,
             prompt_embedder,
-            'Similarity FIFO'
+            'Similarity FIFO',
+            storage_dir,
+            near_duplicate_index=near_duplicate_index,
+            responses_db_factory=responses_db_factory,
         )
         self._fifo_cache = HookedFIFOCache(max_size)
 
@@ -50,14 +60,14 @@ class FIFOSimilarityCache(SimilarityCache):
 
         # if the last insert caused an eviction due to reaching maximum capacity
         if len(self._fifo_cache) == self._max_size and self._fifo_cache.last_evicted is not None:
-            prompt_key, _ = self._fifo_cache.last_evicted
-            self._requests_db.remove(prompt_key)
-            self._responses_db.remove_by_request(prompt_key)
+            evicted_key, _ = self._fifo_cache.last_evicted
+            self._remove_entry(evicted_key)
 
-        self._requests_db.save(
-            EmbeddedRequestRecord(key=prompt_key, vector=self._embedder(prompt))
-        )
+        self._save_request(prompt_key, prompt)
         response_key = self._generate_key(llm_response)
         self._responses_db.save(
-            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response)
+            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response, prompt=prompt)
         )
+
+    def _forget(self, prompt_key: str) -> None:
+        self._fifo_cache.pop(prompt_key, None)
@@ -7,8 +7,12 @@ class ICache(ABC):
         self._max_size = max_size
         self.policy_name = policy_name
 
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
     @abstractmethod
-    def is_hit(self, request: Any) -> bool:
+    def is_hit(self, request: Any, **kwargs) -> bool:
         raise NotImplementedError
 
     @abstractmethod
@@ -23,3 +27,29 @@ class ICache(ABC):
     @abstractmethod
     def current_size(self) -> int:
         raise NotImplementedError
+
+    def nearest_response(self, request: Any, max_distance: float, **kwargs) -> tuple[Any, float] | None:
+        """
+        The response cached for the request most similar to this one, and its distance, if at most `max_distance`.
+            Unlike `on_hit`, it's not counted as a hit (the policy state is untouched). None for caches which don't
+            measure similarity.
+        """
+        return None
+
+    def stale_request(self, request: Any, **kwargs) -> Any | None:
+        """
+        The key of the cached request this (hit) request is served from, if its response is due for a refresh
+            (see `refresh`). None if it isn't, or if the cache doesn't refresh entries.
+        """
+        return None
+
+    def request_prompt(self, request_key: Any, **kwargs) -> Any | None:
+        """
+        The request a cached entry was stored for (e.g. to refresh the entry by asking it again). None if the cache
+            doesn't keep it, or the entry isn't cached.
+        """
+        return None
+
+    def refresh(self, request_key: Any, response: Any, **kwargs) -> bool:
+        """Replaces a cached request's response, resetting its age. Returns whether the request is still cached."""
+        return False
@@ -1,12 +1,17 @@
 import logging
+from pathlib import Path
 from typing import Callable, Any
 
 from cachetools import LFUCache
 
+from text_similarity.vector_utils import Vector
 from .similarity_cache import SimilarityCache
+from .similarity_cache.db_handlers import IResponsesDB
+from .similarity_cache.near_duplicate_index import MinHashLSHIndex
 from .similarity_cache.ranking_distance_method import RankingDistanceMethod
+from .similarity_cache.refresh_policy import RefreshPolicy
 from .storage_client.faiss_client import FaissDistanceMethod
-from .storage_client.records import EmbeddedRequestRecord, ResponseRecord
+from .storage_client.records import ResponseRecord
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('EchoLLM')
@@ -16,6 +21,20 @@ class HookedLFUCache(LFUCache):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.last_evicted = None
+        self.uses: dict[Any, int] = {}  # the frequencies LFU ranks by
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.uses[key] += 1
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.uses[key] = self.uses.get(key, 0) + 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        del self.uses[key]
 
     def popitem(self) -> tuple[Any, Any]:
         k, v = super().popitem()  # this is called when the cache evicts
@@ -31,7 +50,11 @@ class LFUSimilarityCache(SimilarityCache):
             candidates_number: int,
             ranking_distance_method: RankingDistanceMethod,
             db_distance_method: FaissDistanceMethod,
-            prompt_embedder: Callable[[str], list[float]]
+            prompt_embedder: Callable[[str], Vector],
+            storage_dir: Path | None = None,
+            refresh_policy: RefreshPolicy | None = None,
+            near_duplicate_index: MinHashLSHIndex | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
     ):
         super().__init__(
             max_size,
@@ -40,32 +63,34 @@ class LFUSimilarityCache(SimilarityCache):
             ranking_distance_method,
             db_distance_method,
             prompt_embedder,
-            'Similarity LFU'
+            'Similarity LFU',
+            storage_dir,
+            refresh_policy,
+            near_duplicate_index,
+            responses_db_factory=responses_db_factory,
         )
         self._lfu_cache = HookedLFUCache(max_size)
 
-    def on_hit(self, prompt: str, **kwargs) -> str:
-        hit_request, _ = self._requests_db.most_similar_request(
-            self._embedder(prompt),
-            self._candidates_number
-        )
-        self._lfu_cache.get(hit_request.key)  # update frequency
-        return super().on_hit(prompt, **kwargs)
-
     def on_miss(self, prompt: str, llm_response: str, **kwargs):
         prompt_key = self._generate_key(prompt)
         self._lfu_cache[prompt_key] = True
 
         # if the last insert caused an eviction due to reaching maximum capacity
         if len(self._lfu_cache) == self._max_size and self._lfu_cache.last_evicted is not None:
-            prompt_key, _ = self._lfu_cache.last_evicted
-            self._requests_db.remove(prompt_key)
-            self._responses_db.remove_by_request(prompt_key)
+            evicted_key, _ = self._lfu_cache.last_evicted
+            self._remove_entry(evicted_key)
 
-        self._requests_db.save(
-            EmbeddedRequestRecord(key=prompt_key, vector=self._embedder(prompt))
-        )
+        self._save_request(prompt_key, prompt)
         response_key = self._generate_key(llm_response)
         self._responses_db.save(
-            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response)
+            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response, prompt=prompt)
         )
+
+    def _forget(self, prompt_key: str) -> None:
+        self._lfu_cache.pop(prompt_key, None)
+
+    def _touch(self, prompt_key: str) -> None:
+        self._lfu_cache.get(prompt_key)  # update frequency
+
+    def _is_hot(self, prompt_key: str) -> bool:
+        return self._lfu_cache.uses.get(prompt_key, 0) >= self.refresh_policy.min_uses
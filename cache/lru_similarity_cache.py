@@ -1,12 +1,18 @@
 import logging
+import time
+from pathlib import Path
 from typing import Callable, Any
 
 from cachetools import LRUCache
 
+from text_similarity.vector_utils import Vector
 from .similarity_cache import SimilarityCache
+from .similarity_cache.db_handlers import IResponsesDB
+from .similarity_cache.near_duplicate_index import MinHashLSHIndex
 from .similarity_cache.ranking_distance_method import RankingDistanceMethod
+from .similarity_cache.refresh_policy import RefreshPolicy
 from .storage_client.faiss_client import FaissDistanceMethod
-from .storage_client.records import EmbeddedRequestRecord, ResponseRecord
+from .storage_client.records import ResponseRecord
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('EchoLLM')
@@ -31,7 +37,11 @@ class LRUSimilarityCache(SimilarityCache):
             candidates_number: int,
             ranking_distance_method: RankingDistanceMethod,
             db_distance_method: FaissDistanceMethod,
-            prompt_embedder: Callable[[str], list[float]]
+            prompt_embedder: Callable[[str], Vector],
+            storage_dir: Path | None = None,
+            refresh_policy: RefreshPolicy | None = None,
+            near_duplicate_index: MinHashLSHIndex | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
     ):
         super().__init__(
             max_size,
@@ -40,32 +50,40 @@ class LRUSimilarityCache(SimilarityCache):
             ranking_distance_method,
             db_distance_method,
             prompt_embedder,
-            'Similarity LRU'
+            'Similarity LRU',
+            storage_dir,
+            refresh_policy,
+            near_duplicate_index,
+            responses_db_factory=responses_db_factory,
         )
         self._lru_cache = HookedLRUCache(max_size)
 
-    def on_hit(self, prompt: str, **kwargs) -> str:
-        hit_request, _ = self._requests_db.most_similar_request(
-            self._embedder(prompt),
-            self._candidates_number
-        )
-        self._lru_cache.get(hit_request.key)  # update recency
-        return super().on_hit(prompt, **kwargs)
-
     def on_miss(self, prompt: str, llm_response: str, **kwargs):
         prompt_key = self._generate_key(prompt)
-        self._lru_cache[prompt_key] = True
+        now = time.time()
+        self._lru_cache[prompt_key] = (now, now)  # (last use, the use before it)
 
         # if the last insert caused an eviction due to reaching maximum capacity
         if len(self._lru_cache) == self._max_size and self._lru_cache.last_evicted is not None:
-            prompt_key, _ = self._lru_cache.last_evicted
-            self._requests_db.remove(prompt_key)
-            self._responses_db.remove_by_request(prompt_key)
+            evicted_key, _ = self._lru_cache.last_evicted
+            self._remove_entry(evicted_key)
 
-        self._requests_db.save(
-            EmbeddedRequestRecord(key=prompt_key, vector=self._embedder(prompt))
-        )
+        self._save_request(prompt_key, prompt)
         response_key = self._generate_key(llm_response)
         self._responses_db.save(
-            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response)
+            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response, prompt=prompt)
         )
+
+    def _forget(self, prompt_key: str) -> None:
+        self._lru_cache.pop(prompt_key, None)
+
+    def _touch(self, prompt_key: str) -> None:
+        if prompt_key in self._lru_cache:
+            last_use, _ = self._lru_cache[prompt_key]
+            # update recency, and keep the use before this hit -- hotness is judged by it, not by the hit itself
+            self._lru_cache[prompt_key] = (time.time(), last_use)
+
+    def _is_hot(self, prompt_key: str) -> bool:
+        """Whether the entry was used within `recent_use_window` before its last use (i.e. the hit being served)."""
+        uses = self._lru_cache.get(prompt_key)
+        return uses is not None and uses[0] - uses[1] <= self.refresh_policy.recent_use_window
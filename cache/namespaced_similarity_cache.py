@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import math
+import shutil
+from pathlib import Path
+from typing import Any, Callable
+
+from pydantic import BaseModel, ConfigDict
+
+from . import ICache
+from .similarity_cache import SimilarityCache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
+
+_CWD = Path(__file__).parent
+
+
+class Namespace(BaseModel):
+    """
+    What a cached response depends on besides the prompt: the model which generated it, its generation options, and
+        the tenant it belongs to. Responses are only served within their own namespace.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    model: str
+    options: dict[str, Any] = {}
+    tenant: str | None = None
+
+    @property
+    def key(self) -> str:
+        options_hash = hashlib.md5(json.dumps(self.options, sort_keys=True, default=str).encode()).hexdigest()[:12]
+        return f'{self.tenant or "-"}/{self.model}/{options_hash}'
+
+
+class NamespaceStats(BaseModel):
+    max_size: int
+    size: int = 0
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+    inserts: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class NamespacedSimilarityCache(ICache):
+    """
+    Partitions the cache by namespace (see `Namespace.key`): each namespace gets its own similarity cache, with its
+        own index, responses store and capacity, so a lookup searches only its namespace's entries, and is never served
+        a response generated by another model, other options or for another tenant.
+
+    Every operation takes the namespace as the `namespace` kwarg (EchoLLM passes it). Partitions are created at
+        their namespace's first insert, with their share of the total capacity -- a lookup or an invalidation of a
+        namespace without a partition is a miss. The namespaces of `namespace_shares` have
+        their capacity reserved, the others share what's left: once it's taken, a new namespace evicts the least used
+        of them (fewest lookups) until its partition fits, so the partitions never exceed the total capacity.
+    """
+
+    def __init__(
+            self,
+            max_size: int,
+            partition_factory: Callable[[int, Path], SimilarityCache],
+            storage_dir: Path = _CWD / 'storage_client/resources/namespaces',
+            namespace_shares: dict[str, float] | None = None,
+            default_share: float = 0.1,
+    ):
+        """
+        :param max_size: The total capacity, shared by the namespaces.
+        :param partition_factory: Builds a namespace's partition given its capacity and its own storage directory, e.g.
+            `lambda max_size, storage_dir: LRUSimilarityCache(max_size, ..., storage_dir=storage_dir)`.
+        :param storage_dir: The parent directory of the partitions' storage directories.
+        :param namespace_shares: The share of the total capacity of specific namespaces (by key), summing to at most 1.
+        :param default_share: The share of the total capacity of any other namespace.
+        """
+        namespace_shares = namespace_shares or {}
+        if not all(0 < share <= 1 for share in namespace_shares.values()):
+            raise ValueError('namespace_shares must be between 0 and 1')
+        if sum(namespace_shares.values()) > 1:
+            raise ValueError('namespace_shares must sum to at most 1')
+        if not 0 < default_share <= 1:
+            raise ValueError('default_share must be between 0 and 1')
+
+        self._partition_factory = partition_factory
+        self._storage_dir = storage_dir
+        self._namespace_shares = namespace_shares
+        self._default_share = default_share
+        self._partitions: dict[str, SimilarityCache] = {}
+        self._stats: dict[str, NamespaceStats] = {}
+        self._default_threshold: float | None = None
+        self._namespace_thresholds: dict[str | None, float] = {}
+        super().__init__(max_size, 'Namespaced Similarity Cache')
+        # the capacity left to the namespaces without a share of their own
+        self._default_capacity = max_size - sum(self._reserved_size(namespace) for namespace in namespace_shares)
+
+    @property
+    def namespaces(self) -> list[str]:
+        return list(self._partitions)
+
+    def partition(self, namespace: str | None) -> SimilarityCache | None:
+        """The namespace's partition, None if nothing was inserted into the namespace (or it was evicted) since."""
+        return self._partitions.get(namespace)
+
+    def is_hit(self, prompt: str, namespace: str | None = None) -> bool:
+        partition = self.partition(namespace)
+        if partition is None:
+            return False
+        is_hit = partition.is_hit(prompt)
+        stats = self._stats[namespace]
+        stats.lookups += 1
+        if is_hit:
+            stats.hits += 1
+        else:
+            stats.misses += 1
+        return is_hit
+
+    def on_hit(self, prompt: str, namespace: str | None = None, **kwargs) -> str:
+        partition = self.partition(namespace)
+        if partition is None:
+            raise KeyError(f'Namespace `{namespace}` has no cached requests!')
+        return partition.on_hit(prompt, **kwargs)
+
+    def on_miss(self, prompt: str, llm_response: str, namespace: str | None = None, **kwargs) -> None:
+        # only inserts create partitions, a lookup of an unknown namespace mustn't evict another namespace
+        partition = self.partition(namespace) or self._create_partition(namespace)
+        partition.on_miss(prompt, llm_response, **kwargs)
+        self._stats[namespace].inserts += 1
+
+    def current_size(self) -> int:
+        return sum(partition.current_size() for partition in self._partitions.values())
+
+    def nearest_response(
+            self, prompt: str, max_distance: float, namespace: str | None = None, **kwargs
+    ) -> tuple[str, float] | None:
+        partition = self.partition(namespace)
+        return None if partition is None else partition.nearest_response(prompt, max_distance)
+
+    def stale_request(self, prompt: str, namespace: str | None = None, **kwargs) -> str | None:
+        partition = self.partition(namespace)
+        return None if partition is None else partition.stale_request(prompt)
+
+    def request_prompt(self, request_key: str, namespace: str | None = None, **kwargs) -> str | None:
+        partition = self.partition(namespace)
+        return None if partition is None else partition.request_prompt(request_key)
+
+    def refresh(self, request_key: str, response: str, namespace: str | None = None, **kwargs) -> bool:
+        partition = self.partition(namespace)
+        return partition is not None and partition.refresh(request_key, response)
+
+    def invalidate(self, prompt: str, namespace: str | None = None) -> bool:
+        partition = self.partition(namespace)
+        return partition is not None and partition.invalidate(prompt)
+
+    def invalidate_namespace(self, namespace: str | None) -> int:
+        """Drops a namespace's whole partition (including its files). Returns the amount of entries it had."""
+        partition = self._partitions.pop(namespace, None)
+        self._stats.pop(namespace, None)
+        if partition is None:
+            return 0
+        size = partition.current_size()
+        partition.close()
+        shutil.rmtree(self._partition_dir(namespace), ignore_errors=True)
+        logger.info(f'Invalidated namespace `{namespace}` ({size} entries)')
+        return size
+
+    def set_hit_distance_threshold(self, threshold: float, namespace: str | None = None) -> None:
+        """
+        With a namespace, sets that namespace's threshold (kept for its partition, if it's created later). Without one,
+            sets every namespace's threshold.
+        """
+        if namespace is not None:
+            self._namespace_thresholds[namespace] = threshold
+            partition = self.partition(namespace)
+            if partition is not None:
+                partition.set_hit_distance_threshold(threshold)
+            return
+        self._default_threshold = threshold
+        self._namespace_thresholds.clear()
+        for partition in self._partitions.values():
+            partition.set_hit_distance_threshold(threshold)
+
+    def stats(self) -> dict[str, NamespaceStats]:
+        return {
+            namespace: stats.model_copy(update={'size': self._partitions[namespace].current_size()})
+            for namespace, stats in self._stats.items()
+        }
+
+    def _create_partition(self, namespace: str | None) -> SimilarityCache:
+        if namespace in self._namespace_shares:
+            partition_max_size = self._reserved_size(namespace)
+        else:
+            partition_max_size = self._make_room(namespace)
+        partition = self._partition_factory(partition_max_size, self._partition_dir(namespace))
+        threshold = self._namespace_thresholds.get(namespace, self._default_threshold)
+        if threshold is not None:
+            partition.set_hit_distance_threshold(threshold)
+        self._partitions[namespace] = partition
+        self._stats[namespace] = NamespaceStats(max_size=partition_max_size)
+        logger.info(f'Created a partition of {partition_max_size} entries for namespace `{namespace}`')
+        return partition
+
+    def _reserved_size(self, namespace: str) -> int:
+        return max(math.floor(self._max_size * self._namespace_shares[namespace]), 1)
+
+    def _make_room(self, namespace: str | None) -> int:
+        """Evicts the least used namespaces without a share of their own, until a new one fits. Returns its size."""
+        if self._default_capacity <= 0:
+            raise ValueError(f'No capacity is left for namespace `{namespace}`, namespace_shares take all of it')
+        partition_max_size = min(max(math.ceil(self._max_size * self._default_share), 1), self._default_capacity)
+        evictable = sorted(
+            (ns for ns in self._partitions if ns not in self._namespace_shares),
+            key=lambda ns: self._stats[ns].lookups,
+        )
+        used = sum(self._stats[ns].max_size for ns in evictable)
+        for evicted in evictable:
+            if used + partition_max_size <= self._default_capacity:
+                break
+            used -= self._stats[evicted].max_size
+            logger.info(f'Evicting namespace `{evicted}` to make room for namespace `{namespace}`')
+            self.invalidate_namespace(evicted)
+        return partition_max_size
+
+    def _partition_dir(self, namespace: str | None) -> Path:
+        # namespace keys aren't valid directory names, their hash is stable across restarts
+        return self._storage_dir / hashlib.md5(str(namespace).encode()).hexdigest()[:16]
@@ -0,0 +1,120 @@
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+from pydantic import BaseModel
+
+_CWD = Path(__file__).parent.parent
+
+
+class DelayStats(BaseModel):
+    mean: float  # E[x]
+    m2: float  # E[x^2]
+    observations: int = 1
+
+    @property
+    def std(self) -> float:
+        # Var(x) = E[x^2] - E[x]^2 -> Std(x) = sqrt(Var(x))
+        # max is used to handle floating point drift
+        return math.sqrt(max(self.m2 - self.mean ** 2, 0))
+
+
+class DelayStatsStore:
+    """
+    Per-item delay statistics (EWMA of the delay and of its square, and the observations count), held in flat arrays
+        with one slot per cached item. A key's slot is freed when it leaves the cache (see `remove`), and reused by
+        the next new key, so the memory is bounded by the cache capacity rather than by every prompt ever seen.
+    """
+
+    def __init__(self, capacity: int, path: Path = _CWD / 'storage_client/resources/delay_stats.npz'):
+        """
+        :param capacity: The initial amount of slots, e.g. the cache's max size (+1 for the insert before eviction).
+            The arrays grow if more keys are ever tracked at once.
+        :param path: Where the stats are persisted (see `save`), loaded from on creation if it exists.
+        """
+        self.path = path
+        self._means = np.zeros(capacity, dtype=np.float64)
+        self._m2s = np.zeros(capacity, dtype=np.float64)
+        self._observations = np.zeros(capacity, dtype=np.int64)
+        self._slots: dict[str, int] = {}
+        self._free_slots = list(range(capacity - 1, -1, -1))  # popped from the end, so slots fill in order
+        if self.path.exists():
+            self._load()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def get(self, key: str) -> DelayStats | None:
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return DelayStats(
+            mean=float(self._means[slot]),
+            m2=float(self._m2s[slot]),
+            observations=int(self._observations[slot]),
+        )
+
+    def update(self, key: str, delay: float, smoothing_factor: float) -> None:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key)
+            self._means[slot] = delay
+            self._m2s[slot] = delay ** 2  # m2 as x^2 -> std starts at 0
+            self._observations[slot] = 1
+            return
+        self._means[slot] = (1 - smoothing_factor) * self._means[slot] + smoothing_factor * delay
+        self._m2s[slot] = (1 - smoothing_factor) * self._m2s[slot] + smoothing_factor * (delay ** 2)
+        self._observations[slot] += 1
+
+    def remove(self, key: str) -> bool:
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return False
+        self._free_slots.append(slot)
+        return True
+
+    def save(self) -> None:
+        """Writes the tracked stats to `path`, atomically (a crash mid-write leaves the previous file intact)."""
+        keys = list(self._slots)
+        slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(keys))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with tmp_path.open('wb') as f:
+            np.savez(
+                f,
+                keys=np.asarray(keys, dtype=str),
+                means=self._means[slots],
+                m2s=self._m2s[slots],
+                observations=self._observations[slots],
+            )
+        os.replace(tmp_path, self.path)
+
+    def _allocate(self, key: str) -> int:
+        if not self._free_slots:
+            self._grow()
+        slot = self._free_slots.pop()
+        self._slots[key] = slot
+        return slot
+
+    def _grow(self) -> None:
+        capacity = self._means.size
+        new_capacity = max(2 * capacity, 1)
+        self._means = np.resize(self._means, new_capacity)
+        self._m2s = np.resize(self._m2s, new_capacity)
+        self._observations = np.resize(self._observations, new_capacity)
+        self._free_slots[:0] = range(new_capacity - 1, capacity - 1, -1)  # after the already free ones
+
+    def _load(self) -> None:
+        with np.load(self.path) as data:
+            keys, means, m2s, observations = data['keys'], data['means'], data['m2s'], data['observations']
+        while len(self._free_slots) < keys.size:
+            self._grow()
+        for key, mean, m2, observations_number in zip(keys.tolist(), means, m2s, observations):
+            slot = self._allocate(key)
+            self._means[slot] = mean
+            self._m2s[slot] = m2
+            self._observations[slot] = observations_number
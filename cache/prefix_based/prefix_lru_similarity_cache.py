@@ -1,11 +1,14 @@
+from pathlib import Path
 from typing import Callable, Any
 
 from cachetools import LRUCache
 
 from cache.prefix_based.prefix_similarity_cache import IPrefixSimilarityCache
+from cache.similarity_cache.db_handlers import IResponsesDB
 from cache.similarity_cache.ranking_distance_method import RankingDistanceMethod
 from cache.storage_client.faiss_client import FaissDistanceMethod
-from cache.storage_client.records import EmbeddedRequestRecord, ResponseRecord
+from cache.storage_client.records import ResponseRecord
+from text_similarity.vector_utils import Vector
 
 
 class HookedLRUCache(LRUCache):
@@ -27,10 +30,14 @@ class PrefixLRUSimilarityCache(IPrefixSimilarityCache):
             candidates_number: int,
             ranking_distance_method: RankingDistanceMethod,
             db_distance_method: FaissDistanceMethod,
-            prompt_embedder: Callable[[str], list[float]],
-            bandwidth: float = 1000,  # Mbps
+            prompt_embedder: Callable[[str], Vector],
+            bandwidth: float = 0.2,  # characters per ms, until the LLM's streaming rate is measured
             delay_ewma_smoothing_factor: float = 0.2,
             prefix_size_confidence_factor: float = 2,
+            storage_dir: Path | None = None,
+            full_hit_distance_threshold: float | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
+            stats_save_interval: float = 60.0,
     ):
         super().__init__(
             max_size,
@@ -43,17 +50,13 @@ class PrefixLRUSimilarityCache(IPrefixSimilarityCache):
             bandwidth,
             delay_ewma_smoothing_factor,
             prefix_size_confidence_factor,
+            storage_dir,
+            full_hit_distance_threshold,
+            responses_db_factory=responses_db_factory,
+            stats_save_interval=stats_save_interval,
         )
         self._lru_cache = HookedLRUCache(max_size)
 
-    def on_hit(self, prompt: str, **kwargs) -> str:
-        hit_request, _ = self._requests_db.most_similar_request(
-            self._embedder(prompt),
-            self._candidates_number
-        )
-        self._lru_cache.get(hit_request.key)  # update recency
-        return super().on_hit(prompt, **kwargs)
-
     def on_miss(self, prompt: str, llm_response: str, **kwargs):
         prompt_key = self._generate_key(prompt)
         self.update_item_stats(prompt_key, **kwargs)
@@ -61,18 +64,19 @@ class PrefixLRUSimilarityCache(IPrefixSimilarityCache):
 
         # if the last insert caused an eviction due to reaching maximum capacity
         if len(self._lru_cache) == self._max_size and self._lru_cache.last_evicted is not None:
-            prompt_key, _ = self._lru_cache.last_evicted
-            self._requests_db.remove(prompt_key)
-            self._responses_db.remove_by_request(prompt_key)
+            evicted_key, _ = self._lru_cache.last_evicted
+            self._remove_entry(evicted_key)
 
-        self._requests_db.save(
-            EmbeddedRequestRecord(key=prompt_key, vector=self._embedder(prompt))
-        )
-        item_stats = self.itemwise_stats[prompt_key]
-        prefix_size = round(self.bandwidth * (
-                item_stats.delay.mean + self.prefix_size_confidence_factor * item_stats.delay.std))
-        prefix_llm_response = llm_response[:prefix_size]
+        self._save_request(prompt_key, prompt)
+        # the full response is stored, the prefix is sliced on hit
         response_key = self._generate_key(llm_response)
         self._responses_db.save(
-            ResponseRecord(key=response_key, request_key=prompt_key, response=prefix_llm_response)
+            ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response, prompt=prompt)
         )
+        self._save_item_stats_if_due()
+
+    def _forget(self, prompt_key: str) -> None:
+        self._lru_cache.pop(prompt_key, None)
+
+    def _touch(self, prompt_key: str) -> None:
+        self._lru_cache.get(prompt_key)  # update recency
@@ -1,31 +1,23 @@
-import math
+import time
 from abc import ABC
+from pathlib import Path
 from typing import Callable
 
 from pydantic import BaseModel
 
+from cache.prefix_based.delay_stats_store import DelayStatsStore
 from cache.prefix_based.errors import MissingKwargError
 from cache.similarity_cache import SimilarityCache
+from cache.similarity_cache.db_handlers import IResponsesDB
 from cache.similarity_cache.ranking_distance_method import RankingDistanceMethod
 from cache.storage_client.faiss_client import FaissDistanceMethod
+from text_similarity.vector_utils import Vector
 
 
-class DelayStats(BaseModel):
-    mean: float  # E[x]
-    m2: float  # E[x^2]
+class ThroughputStats(BaseModel):
+    chars_per_ms: float  # streaming rate after the first token
     observations: int = 1
 
-    @property
-    def std(self) -> float:
-        # Var(x) = E[x^2] - E[x]^2 -> Std(x) = sqrt(Var(x))
-        # max is used to handle floating point drift
-        return math.sqrt(max(self.m2 - self.mean ** 2, 0))
-
-
-class ItemStats(BaseModel):
-    key: str
-    delay: DelayStats
-
 
 class IPrefixSimilarityCache(SimilarityCache, ABC):
     def __init__(
@@ -35,12 +27,26 @@ class IPrefixSimilarityCache(SimilarityCache, ABC):
             candidates_number: int,
             ranking_distance_method: RankingDistanceMethod,
             db_distance_method: FaissDistanceMethod,
-            prompt_embedder: Callable[[str], list[float]],
+            prompt_embedder: Callable[[str], Vector],
             policy_name: str,
             bandwidth: float,
             delay_ewma_smoothing_factor: float = 0.2,
             prefix_size_confidence_factor: float = 2,
+            storage_dir: Path | None = None,
+            full_hit_distance_threshold: float | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
+            stats_save_interval: float = 60.0,
     ):
+        """
+        Full responses are stored, and the served prefix is sliced at hit time from the current delay statistics.
+
+        :param bandwidth: The streaming rate (characters per ms) used to size prefixes until the LLM's actual rate is
+            measured (see `update_throughput_stats`).
+        :param full_hit_distance_threshold: Hits at most this far are served the whole stored response,
+            with no continuation from the LLM (see `is_full_hit`). None disables full hits.
+        :param stats_save_interval: The minimal time (seconds) between persists of the items' delay stats by inserts
+            (see `save_item_stats`).
+        """
         if not 0 < delay_ewma_smoothing_factor <= 1:
             raise ValueError('delay_ewma_smoothing_factor must be between 0 and 1')
 
@@ -51,55 +57,116 @@ class IPrefixSimilarityCache(SimilarityCache, ABC):
             ranking_distance_method,
             db_distance_method,
             prompt_embedder,
-            policy_name
+            policy_name,
+            storage_dir,
+            responses_db_factory=responses_db_factory,
         )
         self.delay_ewma_smoothing_factor = delay_ewma_smoothing_factor
         self.bandwidth = bandwidth
         self.prefix_size_confidence_factor = prefix_size_confidence_factor
-        self.itemwise_stats: dict[str, ItemStats] = {}
+        # +1 slot for the item inserted right before the evicted one is removed
+        if storage_dir is None:
+            self.itemwise_stats = DelayStatsStore(max_size + 1)
+        else:
+            self.itemwise_stats = DelayStatsStore(max_size + 1, storage_dir / 'delay_stats.npz')
+        self.model_throughput_stats: dict[str, ThroughputStats] = {}
+        self.full_hit_distance_threshold = full_hit_distance_threshold
+        self.stats_save_interval = stats_save_interval
+        self._stats_saved_at = time.monotonic()
 
     def _update_delay_stats(self, prompt_key: str, llm_delay: float):
-        if prompt_key in self.itemwise_stats:
-            item_stats = self.itemwise_stats[prompt_key]
-            item_stats.delay.observations += 1
-
-            alpha = self.delay_ewma_smoothing_factor
-            old_mean = item_stats.delay.mean
-            old_m2 = item_stats.delay.m2
-            item_stats.delay.mean = (1 - alpha) * old_mean + alpha * llm_delay
-            item_stats.delay.m2 = (1 - alpha) * old_m2 + alpha * (llm_delay ** 2)
-        else:
-            self.itemwise_stats[prompt_key] = ItemStats(
-                key=prompt_key,
-                delay=DelayStats(
-                    mean=llm_delay,
-                    m2=llm_delay ** 2,  # m2 as x^2 -> std starts at 0
-                ),
-            )
+        self.itemwise_stats.update(prompt_key, llm_delay, self.delay_ewma_smoothing_factor)
 
     def update_item_stats(self, prompt_key: str, **kwargs):
         if 'llm_delay' not in kwargs:
             raise MissingKwargError('llm_delay')
         self._update_delay_stats(prompt_key, kwargs['llm_delay'])
 
-    def is_hit(self, prompt: str) -> bool:
-        most_similar_request = self._requests_db.most_similar_request(
-            self._embedder(prompt),
-            self._candidates_number
-        )
-        if most_similar_request is None:
+    def hit_request_key(self, prompt: str) -> str | None:
+        """The key of the cached item a (hit) prompt is served from, e.g. to `update_item_stats` it later."""
+        return self._hit_request_key(prompt)
+
+    def update_throughput_stats(self, model: str, characters: int, duration: float):
+        """
+        Tracks a model's streaming rate (EWMA), from a stream of `characters` (after the first chunk)
+            which took `duration` ms (from the first chunk to the last).
+        """
+        if characters <= 0 or duration <= 0:
+            return
+        chars_per_ms = characters / duration
+        if model in self.model_throughput_stats:
+            throughput_stats = self.model_throughput_stats[model]
+            throughput_stats.observations += 1
+            alpha = self.delay_ewma_smoothing_factor
+            throughput_stats.chars_per_ms = (1 - alpha) * throughput_stats.chars_per_ms + alpha * chars_per_ms
+        else:
+            self.model_throughput_stats[model] = ThroughputStats(chars_per_ms=chars_per_ms)
+
+    def is_full_hit(self, prompt: str, distance: float | None = None) -> bool:
+        """
+        Whether the prompt is close enough to a cached one to be served its whole response, without continuation.
+
+        :param distance: The hit's distance, if already known (see `lookup`), so the prompt isn't searched again.
+        """
+        if self.full_hit_distance_threshold is None:
             return False
-        _, distance = most_similar_request
-        return distance <= self._hit_distance_threshold
+        if distance is None:
+            most_similar_request = self.most_similar_request(self._embedder(prompt))
+            if most_similar_request is None:
+                return False
+            _, distance = most_similar_request
+        return distance <= self.full_hit_distance_threshold
+
+    def _prefix_size(self, prompt_key: str, model: str | None = None) -> int | None:
+        """
+        The amount of characters the LLM streams during the item's expected time-to-first-token (with a confidence
+            margin), i.e. a prefix just long enough for the continuation's first token to arrive before it runs out.
+            None if the item's delay is unknown.
+        """
+        delay_stats = self.itemwise_stats.get(prompt_key)
+        if delay_stats is None:
+            return None
+        throughput_stats = self.model_throughput_stats.get(model)
+        chars_per_ms = throughput_stats.chars_per_ms if throughput_stats is not None else self.bandwidth
+        return round(chars_per_ms * (
+                delay_stats.mean + self.prefix_size_confidence_factor * delay_stats.std))
+
+    def save_item_stats(self) -> None:
+        """
+        Persists the items' delay stats, so the estimates survive restarts. Done by inserts once every
+            `stats_save_interval` seconds (it rewrites every item's stats), and on close.
+        """
+        self.itemwise_stats.save()
+        self._stats_saved_at = time.monotonic()
+
+    def _save_item_stats_if_due(self) -> None:
+        if time.monotonic() - self._stats_saved_at >= self.stats_save_interval:
+            self.save_item_stats()
+
+    def close(self) -> None:
+        self.save_item_stats()
+        super().close()
+
+    def _remove_entry(self, prompt_key: str) -> bool:
+        self.itemwise_stats.remove(prompt_key)
+        return super()._remove_entry(prompt_key)
 
     def on_hit(self, prompt: str, **kwargs) -> str:
-        hit_request, _ = self._requests_db.most_similar_request(
-            self._embedder(prompt),
-            self._candidates_number
-        )
+        """
+        Returns the prefix of the cached response to serve while the LLM generates its continuation.
+            Accepted kwargs: `retrieve_only` (don't update the item's delay stats), `llm_model` (size the prefix by
+            this model's streaming rate), `full` (return the whole cached response) and `request_key` (the hit's key,
+            from `lookup`). Raises KeyError if the prompt no longer hits.
+        """
+        hit_request_key = kwargs.get('request_key') or self._hit_request_key(prompt, kwargs.get('namespace'))
+        if hit_request_key is None:
+            raise KeyError(f'No cached request matches prompt `{prompt}`!')
+        response = self._responses_db.fetch_by_request(hit_request_key)
+        self._touch(hit_request_key)
         if not kwargs.get('retrieve_only'):
-            self.update_item_stats(hit_request.key, **kwargs)
-        response = self._responses_db.fetch_by_request(hit_request.key)
-        if response is None:
-            raise KeyError(f'Response with request_key=`{hit_request.key}` was not found!')
-        return response.response
+            self.update_item_stats(hit_request_key, **kwargs)
+        if kwargs.get('full'):
+            return response.response
+        # sliced now rather than at insert time, so it follows the latest delay and streaming rate estimates
+        prefix_size = self._prefix_size(hit_request_key, kwargs.get('llm_model'))
+        return response.response if prefix_size is None else response.response[:prefix_size]
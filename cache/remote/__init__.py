@@ -0,0 +1,2 @@
+from .cache_server import CacheServer
+from .remote_cache import RemoteCache
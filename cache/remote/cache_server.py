@@ -0,0 +1,158 @@
+import logging
+import os
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from .protocol import send_message, receive_message
+from .. import ICache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
+
+
+class CacheServer:
+    """
+    Hosts a single cache (e.g. a SimilarityCache or a ShardedSimilarityCache) for every process on the host,
+        over a Unix domain socket, so they all share one warm cache and one embedding model in memory.
+
+    Each client connection is served by its own thread, but all cache operations run on one dedicated thread,
+        since caches are not thread-safe.
+
+    Operations (see `RemoteCache` for the client side):
+        lookup         -- {'prompts': [...], 'namespace': ..., 'kwargs': {...}} -> {'responses': [response or None]}
+        insert         -- {'items': [[prompt, response, kwargs], ...]} -> {'inserted': count}
+        invalidate     -- {'prompts': [...], 'namespace': ...} -> {'invalidated': count}
+        nearest        -- {'prompt', 'max_distance', 'namespace': ...} -> {'response': response or None, 'distance'}
+        stale          -- {'prompt', 'namespace': ...} -> {'request_key': key or None}
+        request_prompt -- {'request_key', 'namespace': ...} -> {'prompt': prompt or None}
+        refresh        -- {'request_key', 'response', 'namespace': ...} -> {'refreshed': bool}
+        stats          -- {} -> {'policy_name', 'max_size', 'size', 'lookups', 'hits', 'misses', 'inserts', ...}
+    """
+
+    def __init__(self, cache: ICache, socket_path: Path):
+        self._cache = cache
+        self.socket_path = socket_path
+        self._cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-server')
+        self._stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'inserts': 0, 'invalidations': 0}
+        self._operations = {
+            'lookup': self._lookup,
+            'insert': self._insert,
+            'invalidate': self._invalidate,
+            'nearest': self._nearest,
+            'stale': self._stale,
+            'request_prompt': self._request_prompt,
+            'refresh': self._refresh,
+            'stats': self._get_stats,
+        }
+        self._server: socketserver.ThreadingUnixStreamServer | None = None
+
+    def serve_forever(self) -> None:
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)  # leftover of a previous run
+        self._server = _UnixServer(self.socket_path.__fspath__(), _ConnectionHandler)
+        self._server.cache_server = self
+        logger.info(f'Cache server for `{self._cache.policy_name}` is listening on {self.socket_path}')
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+
+    def serve_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='cache-server', daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+        self._cache_executor.shutdown(wait=True)
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        operation = self._operations.get(request.get('op'))
+        if operation is None:
+            return {'ok': False, 'error': f'Unknown operation `{request.get("op")}`'}
+        try:
+            result = self._cache_executor.submit(operation, request).result()
+        except Exception as e:
+            logger.exception('Cache server operation failed')
+            return {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        return {'ok': True, **result}
+
+    def _lookup(self, request: dict[str, Any]) -> dict[str, Any]:
+        kwargs = request.get('kwargs') or {}
+        is_hit_kwargs = {'namespace': request['namespace']} if request.get('namespace') is not None else {}
+        responses = []
+        for prompt in request['prompts']:
+            self._stats['lookups'] += 1
+            response = None
+            if self._cache.is_hit(prompt, **is_hit_kwargs):
+                try:
+                    response = self._cache.on_hit(prompt, **is_hit_kwargs, **kwargs)
+                except KeyError:
+                    pass  # evicted since `is_hit` by another process sharing the cache
+            self._stats['hits' if response is not None else 'misses'] += 1
+            responses.append(response)
+        return {'responses': responses}
+
+    def _insert(self, request: dict[str, Any]) -> dict[str, Any]:
+        for prompt, response, kwargs in request['items']:
+            self._cache.on_miss(prompt, response, **(kwargs or {}))
+            self._stats['inserts'] += 1
+        return {'inserted': len(request['items'])}
+
+    def _invalidate(self, request: dict[str, Any]) -> dict[str, Any]:
+        invalidate_kwargs = {'namespace': request['namespace']} if request.get('namespace') is not None else {}
+        invalidated = sum(bool(self._cache.invalidate(prompt, **invalidate_kwargs)) for prompt in request['prompts'])
+        self._stats['invalidations'] += invalidated
+        return {'invalidated': invalidated}
+
+    def _nearest(self, request: dict[str, Any]) -> dict[str, Any]:
+        nearest_kwargs = {'namespace': request['namespace']} if request.get('namespace') is not None else {}
+        nearest_response = self._cache.nearest_response(request['prompt'], request['max_distance'], **nearest_kwargs)
+        response, distance = nearest_response if nearest_response is not None else (None, None)
+        return {'response': response, 'distance': distance}
+
+    def _stale(self, request: dict[str, Any]) -> dict[str, Any]:
+        stale_kwargs = {'namespace': request['namespace']} if request.get('namespace') is not None else {}
+        return {'request_key': self._cache.stale_request(request['prompt'], **stale_kwargs)}
+
+    def _request_prompt(self, request: dict[str, Any]) -> dict[str, Any]:
+        prompt_kwargs = {'namespace': request['namespace']} if request.get('namespace') is not None else {}
+        return {'prompt': self._cache.request_prompt(request['request_key'], **prompt_kwargs)}
+
+    def _refresh(self, request: dict[str, Any]) -> dict[str, Any]:
+        refresh_kwargs = {'namespace': request['namespace']} if request.get('namespace') is not None else {}
+        return {'refreshed': self._cache.refresh(request['request_key'], request['response'], **refresh_kwargs)}
+
+    def _get_stats(self, _: dict[str, Any]) -> dict[str, Any]:
+        return {
+            'policy_name': self._cache.policy_name,
+            'max_size': self._cache.max_size,
+            'size': self._cache.current_size(),
+            **self._stats,
+        }
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    cache_server: CacheServer
+
+    def server_bind(self) -> None:
+        super().server_bind()
+        # the socket is created with the process umask -- restricted to its owner before it accepts connections
+        os.chmod(self.server_address, 0o600)
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    server: _UnixServer
+
+    def handle(self) -> None:
+        while True:
+            request = receive_message(self.request)
+            if request is None:
+                return  # client disconnected
+            send_message(self.request, self.server.cache_server.handle(request))
@@ -0,0 +1,41 @@
+import socket
+import struct
+from typing import Any
+
+import msgpack
+
+# every message is a msgpack-encoded map, prefixed by its length as a 4-byte big-endian unsigned int
+_HEADER = struct.Struct('>I')
+
+
+class RemoteCacheError(Exception):
+    pass
+
+
+def send_message(sock: socket.socket, message: dict[str, Any]) -> None:
+    payload = msgpack.packb(message, use_bin_type=True)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def receive_message(sock: socket.socket) -> dict[str, Any] | None:
+    """Returns the next message, or None if the peer closed the connection."""
+    header = _receive_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    payload = _receive_exactly(sock, length)
+    if payload is None:
+        raise RemoteCacheError('Connection closed in the middle of a message')
+    return msgpack.unpackb(payload, raw=False)
+
+
+def _receive_exactly(sock: socket.socket, size: int) -> bytes | None:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            return None
+        received += n
+    return bytes(buffer)
@@ -0,0 +1,114 @@
+import socket
+import threading
+from pathlib import Path
+from typing import Any
+
+from .protocol import RemoteCacheError, send_message, receive_message
+from .. import ICache
+
+
+class RemoteCache(ICache):
+    """
+    An ICache backed by a `CacheServer` on the same host, so EchoLLM can use a shared cache unchanged.
+
+    `is_hit` already fetches the response of a hit, and `on_hit` serves it without a second round trip
+        (as long as it is called by the same thread, for the same prompt, right after `is_hit`).
+    """
+
+    def __init__(self, socket_path: Path, timeout: float | None = 30.0):
+        self.socket_path = socket_path
+        self._timeout = timeout
+        self._socket: socket.socket | None = None
+        self._socket_lock = threading.Lock()
+        self._last_lookup = threading.local()
+
+        stats = self.stats()
+        super().__init__(stats['max_size'], f'Remote {stats["policy_name"]}')
+
+    def is_hit(self, prompt: str, namespace: str | None = None) -> bool:
+        (response,) = self.lookup_many([prompt], namespace)
+        self._last_lookup.value = (prompt, response)
+        return response is not None
+
+    def on_hit(self, prompt: str, namespace: str | None = None, **kwargs) -> str:
+        last_prompt, response = getattr(self._last_lookup, 'value', (None, None))
+        self._last_lookup.value = (None, None)
+        if last_prompt != prompt or kwargs:
+            (response,) = self.lookup_many([prompt], namespace, **kwargs)
+        if response is None:
+            raise KeyError(f'No cached request matches prompt `{prompt}`!')
+        return response
+
+    def on_miss(self, prompt: str, response: str, **kwargs) -> None:
+        self.insert_many([(prompt, response, kwargs)])
+
+    def current_size(self) -> int:
+        return self.stats()['size']
+
+    def nearest_response(
+            self, prompt: str, max_distance: float, namespace: str | None = None, **kwargs
+    ) -> tuple[str, float] | None:
+        nearest = self._call('nearest', prompt=prompt, max_distance=max_distance, namespace=namespace)
+        return None if nearest['response'] is None else (nearest['response'], nearest['distance'])
+
+    def stale_request(self, prompt: str, namespace: str | None = None, **kwargs) -> str | None:
+        return self._call('stale', prompt=prompt, namespace=namespace)['request_key']
+
+    def request_prompt(self, request_key: str, namespace: str | None = None, **kwargs) -> str | None:
+        return self._call('request_prompt', request_key=request_key, namespace=namespace)['prompt']
+
+    def refresh(self, request_key: str, response: str, namespace: str | None = None, **kwargs) -> bool:
+        return self._call('refresh', request_key=request_key, response=response, namespace=namespace)['refreshed']
+
+    def invalidate(self, prompt: str, namespace: str | None = None) -> bool:
+        return self.invalidate_many([prompt], namespace) > 0
+
+    def lookup_many(self, prompts: list[str], namespace: str | None = None, **kwargs) -> list[str | None]:
+        """Returns the cached response of every prompt, None for misses. `kwargs` are passed to the hits' `on_hit`."""
+        return self._call('lookup', prompts=prompts, namespace=namespace, kwargs=kwargs)['responses']
+
+    def insert_many(self, items: list[tuple[str, str, dict[str, Any]]]) -> int:
+        """Inserts (prompt, response, on_miss kwargs) items, returns the amount inserted."""
+        return self._call('insert', items=[list(item) for item in items])['inserted']
+
+    def invalidate_many(self, prompts: list[str], namespace: str | None = None) -> int:
+        """Removes the entries cached for exactly these prompts, returns the amount removed."""
+        return self._call('invalidate', prompts=prompts, namespace=namespace)['invalidated']
+
+    def stats(self) -> dict[str, Any]:
+        return self._call('stats')
+
+    def disconnect(self):
+        with self._socket_lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    def _call(self, op: str, **request) -> dict[str, Any]:
+        with self._socket_lock:
+            if self._socket is None:
+                self._socket = self._connect()
+            try:
+                send_message(self._socket, {'op': op, **request})
+                response = receive_message(self._socket)
+            except OSError:
+                self._socket.close()
+                self._socket = None
+                raise
+            if response is None:
+                self._socket.close()
+                self._socket = None
+                raise RemoteCacheError('Cache server closed the connection')
+
+        if not response.pop('ok'):
+            raise RemoteCacheError(response['error'])
+        return response
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        sock.connect(self.socket_path.__fspath__())
+        return sock
+
+    def __del__(self):
+        self.disconnect()
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from . import ICache
+from .similarity_cache import SimilarityCache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
+
+_CWD = Path(__file__).parent
+
+
+class ShardedSimilarityCache(ICache):
+    """
+    Spreads cache entries over N independent similarity caches (shards) by prompt key hash.
+
+    Each shard owns its index, responses store and policy state, so index size and write load are split N ways.
+        Lookups embed the prompt once and search all shards in parallel (scatter); each shard re-ranks its own
+        top-k candidates and the best of the shards' winners is the hit (gather). This is the same request the final
+        re-rank would pick over the merged candidates, as the ranking distance doesn't depend on the shard.
+        `is_hit` keeps the hit's shard and key, and `on_hit` serves them without searching again (as long as it is
+        called by the same thread, for the same prompt, right after `is_hit`).
+    """
+
+    def __init__(
+            self,
+            max_size: int,
+            shards_number: int,
+            shard_factory: Callable[[int, Path], SimilarityCache],
+            storage_dir: Path = _CWD / 'storage_client/resources/shards',
+            max_workers: int | None = None,
+    ):
+        """
+        :param max_size: The total capacity, split evenly between the shards.
+        :param shards_number: The amount of shards.
+        :param shard_factory: Builds a shard given its capacity and its own storage directory, e.g.
+            `lambda max_size, storage_dir: LRUSimilarityCache(max_size, ..., storage_dir=storage_dir)`.
+            All shards must share the same embedder and ranking distance method.
+        :param storage_dir: The parent directory of the shards' storage directories.
+        :param max_workers: The amount of threads searching the shards. Defaults to one per shard.
+        """
+        if shards_number <= 0:
+            raise ValueError('shards_number must be greater than 0!')
+
+        shard_max_size = math.ceil(max_size / shards_number)
+        self._shards = [shard_factory(shard_max_size, storage_dir / f'shard_{i}') for i in range(shards_number)]
+        super().__init__(max_size, f'Sharded ({shards_number}) {self._shards[0].policy_name}')
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or shards_number)
+        self._last_lookup = threading.local()
+
+    @property
+    def shards(self) -> list[SimilarityCache]:
+        return self._shards
+
+    def is_hit(self, prompt: str, namespace: str | None = None) -> bool:
+        hit = self._hit(prompt, namespace)
+        self._last_lookup.value = (prompt, namespace, hit)
+        return hit is not None
+
+    def on_hit(self, prompt: str, **kwargs) -> str:
+        last_prompt, last_namespace, hit = getattr(self._last_lookup, 'value', (None, None, None))
+        self._last_lookup.value = (None, None, None)
+        if last_prompt != prompt or last_namespace != kwargs.get('namespace'):
+            hit = self._hit(prompt, kwargs.get('namespace'))
+        if hit is None:
+            raise KeyError(f'No cached request matches prompt `{prompt}`!')
+        shard, request_key = hit
+        return shard.on_hit(prompt, request_key=request_key, **kwargs)
+
+    def on_miss(self, prompt: str, llm_response: str, **kwargs) -> None:
+        self._shard_of(prompt).on_miss(prompt, llm_response, **kwargs)
+
+    def current_size(self) -> int:
+        return sum(shard.current_size() for shard in self._shards)
+
+    def nearest_response(self, prompt: str, max_distance: float, **kwargs) -> tuple[str, float] | None:
+        best_match = self._best_match(prompt)
+        if best_match is None or best_match[2] > max_distance:
+            return None
+        shard, _, _ = best_match
+        return shard.nearest_response(prompt, max_distance)
+
+    def stale_request(self, prompt: str, **kwargs) -> str | None:
+        hit = self._hit(prompt, kwargs.get('namespace'))
+        return None if hit is None else hit[0].stale_request(prompt, **kwargs)
+
+    def request_prompt(self, request_key: str, **kwargs) -> str | None:
+        return self._shard_of_key(request_key).request_prompt(request_key, **kwargs)
+
+    def refresh(self, request_key: str, llm_response: str, **kwargs) -> bool:
+        return self._shard_of_key(request_key).refresh(request_key, llm_response, **kwargs)
+
+    def invalidate(self, prompt: str, namespace: str | None = None) -> bool:
+        return self._shard_of(prompt).invalidate(prompt)
+
+    def close(self) -> None:
+        """Releases the shards' storage. The cache can't be used afterwards."""
+        self._executor.shutdown(wait=True)
+        for shard in self._shards:
+            shard.close()
+
+    def set_hit_distance_threshold(self, threshold: float, namespace: str | None = None) -> None:
+        for shard in self._shards:
+            shard.set_hit_distance_threshold(threshold, namespace)
+
+    def _best_match(self, prompt: str) -> tuple[SimilarityCache, str, float] | None:
+        """The shard holding the most similar request to the prompt, the request's key and its ranking distance."""
+        embedded_prompt = self._shards[0].embed(prompt)
+        results = self._executor.map(lambda shard: shard.most_similar_request(embedded_prompt), self._shards)
+        matches = [
+            (shard, result[0].key, result[1]) for shard, result in zip(self._shards, results) if result is not None
+        ]
+        if not matches:
+            return None
+        return min(matches, key=lambda match: match[2])
+
+    def _hit(self, prompt: str, namespace: str | None = None) -> tuple[SimilarityCache, str] | None:
+        """
+        The shard and the key of the request a prompt hits: its near duplicate's, else the most similar's, if within
+            the hit threshold. None if the prompt doesn't hit.
+        """
+        near_duplicate = self._near_duplicate(prompt)
+        if near_duplicate is not None:
+            return near_duplicate
+        best_match = self._best_match(prompt)
+        if best_match is None:
+            return None
+        shard, request_key, distance = best_match
+        return (shard, request_key) if distance <= shard.get_hit_distance_threshold(namespace) else None
+
+    def _near_duplicate(self, prompt: str) -> tuple[SimilarityCache, str] | None:
+        """The shard holding a near duplicate of the prompt, if any (shards are picked by exact prompt, not by text)."""
+        for shard in self._shards:
+            near_duplicate_key = shard.near_duplicate(prompt)
+            if near_duplicate_key is not None:
+                return shard, near_duplicate_key
+        return None
+
+    def _shard_of(self, prompt: str) -> SimilarityCache:
+        # same key the shards derive from the prompt, so an entry always lands in the same shard
+        return self._shard_of_key(hashlib.md5(prompt.encode()).hexdigest())
+
+    def _shard_of_key(self, request_key: str) -> SimilarityCache:
+        return self._shards[int(request_key, 16) % len(self._shards)]
@@ -0,0 +1,93 @@
+import logging
+from pathlib import Path
+from typing import Callable
+
+from text_similarity.vector_utils import Vector
+from .similarity_cache import SimilarityCache
+from .similarity_cache.db_handlers import IResponsesDB, RequestsDB, ResponsesDB
+from .similarity_cache.near_duplicate_index import MinHashLSHIndex
+from .similarity_cache.ranking_distance_method import RankingDistanceMethod
+from .storage_client.faiss_client import FaissDistanceMethod
+from .storage_client.records import ResponseRecord
+from .storage_client.shared_vector_client import SharedVectorClient
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
+
+_CWD = Path(__file__).parent
+
+
+class SharedLRUSimilarityCache(SimilarityCache):
+    """
+    An LRU similarity cache shared by all processes on a host (e.g. pre-forked gunicorn/uvicorn workers).
+
+    The embedded requests live in a SharedVectorClient, so every worker searches the same memory-mapped vectors and
+        sees the others' inserts immediately. The LRU state (last-access times) lives in the same shared file, and
+        inserts, evictions and their responses' removal are serialized by the client's inter-process lock.
+        Responses are stored in a SQLite file, which is already safe for concurrent access by several processes.
+        So `responses_db_factory` must build a SQLite `ResponsesDB` too -- e.g. `LogStructuredResponsesDB` keeps its
+        request index in each process's memory, and the workers wouldn't see each other's responses.
+
+    Every worker must be created with the same `storage_dir`, `max_size` and `db_distance_method`.
+    """
+
+    def __init__(
+            self,
+            max_size: int,
+            hit_distance_threshold: float,
+            candidates_number: int,
+            ranking_distance_method: RankingDistanceMethod,
+            db_distance_method: FaissDistanceMethod,
+            prompt_embedder: Callable[[str], Vector],
+            storage_dir: Path = _CWD / 'storage_client/resources/shared',
+            near_duplicate_index: MinHashLSHIndex | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
+    ):
+        super().__init__(
+            max_size,
+            hit_distance_threshold,
+            candidates_number,
+            ranking_distance_method,
+            db_distance_method,
+            prompt_embedder,
+            'Shared-Memory Similarity LRU',
+            storage_dir,
+            near_duplicate_index=near_duplicate_index,
+            responses_db_factory=responses_db_factory,
+        )
+        if not isinstance(self._responses_db, ResponsesDB):
+            self.close()
+            raise ValueError(
+                f'{type(self._responses_db).__name__} is not shared by processes, '
+                f'SharedLRUSimilarityCache requires a SQLite ResponsesDB'
+            )
+
+    def _create_requests_db(
+            self,
+            ranking_distance_method: RankingDistanceMethod,
+            db_distance_method: FaissDistanceMethod,
+            storage_dir: Path | None,
+    ) -> RequestsDB:
+        self._shared_client = SharedVectorClient(db_distance_method, self._max_size, storage_dir / 'requests.shm')
+        return RequestsDB(ranking_distance_method, db_distance_method, vector_client=self._shared_client)
+
+    def _touch(self, prompt_key: str) -> None:
+        self._shared_client.touch(prompt_key)  # update recency
+
+    def on_miss(self, prompt: str, llm_response: str, **kwargs):
+        prompt_key = self._generate_key(prompt)
+        embedded_prompt = self._embedder(prompt)
+
+        with self._shared_client.lock():
+            self._save_request(prompt_key, prompt, embedded_prompt)
+
+            # if the last insert caused an eviction due to reaching maximum capacity
+            if self._shared_client.last_evicted is not None:
+                self._responses_db.remove_by_request(self._shared_client.last_evicted)
+                if self.near_duplicate_index is not None:
+                    self.near_duplicate_index.remove(self._shared_client.last_evicted)
+
+            response_key = self._generate_key(llm_response)
+            self._responses_db.save(
+                ResponseRecord(key=response_key, request_key=prompt_key, response=llm_response, prompt=prompt)
+            )
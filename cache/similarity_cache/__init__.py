@@ -1 +1,3 @@
 from .similarity_cache import SimilarityCache
+from .refresh_policy import RefreshPolicy
+from .near_duplicate_index import MinHashLSHIndex, NearDuplicateStats
@@ -1,2 +1,4 @@
+from .iresponses_db import IResponsesDB
+from .log_structured_responses_db import LogStructuredResponsesDB
 from .requests_db import RequestsDB
 from .responses_db import ResponsesDB
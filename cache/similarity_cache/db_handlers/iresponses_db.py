@@ -0,0 +1,37 @@
+from typing import Protocol
+
+from ...storage_client.records import ResponseRecord
+
+
+class IResponsesDB(Protocol):
+    """What a similarity cache needs of its responses store, e.g. `ResponsesDB` or `LogStructuredResponsesDB`."""
+
+    def fetch(self, key: str) -> ResponseRecord:
+        """Raises KeyError if there's no response with this key."""
+        ...
+
+    def fetch_by_request(self, request_key: str) -> ResponseRecord:
+        """Raises KeyError if the request has no response. If it has several, returns one of them."""
+        ...
+
+    def save(self, response: ResponseRecord) -> str:
+        ...
+
+    def replace_by_request(self, response: ResponseRecord) -> bool:
+        """Replaces the response of `response.request_key`, if it still has one. Returns whether it did."""
+        ...
+
+    def remove(self, key: str) -> bool:
+        ...
+
+    def remove_by_request(self, request_key: str) -> bool:
+        ...
+
+    def exists(self, key: str) -> bool:
+        ...
+
+    def size(self) -> int:
+        ...
+
+    def close(self) -> None:
+        ...
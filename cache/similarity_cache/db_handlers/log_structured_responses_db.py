@@ -0,0 +1,110 @@
+import struct
+from pathlib import Path
+
+from ...storage_client.records import ResponseRecord
+from ...storage_client.segment_log_client import SegmentLogClient
+
+# created_at, request key size, prompt size (-1 if unknown) -- followed by the request key, the prompt and the response
+_HEADER = struct.Struct('<dHi')
+
+
+class LogStructuredResponsesDB:
+    """
+    ResponsesDB's interface, over a `SegmentLogClient` rather than SQLite: a hit's response is fetched with a dict
+        lookup and a slice of a memory-mapped segment, without running a query or validating a record.
+
+    The request key -> response keys index is kept in memory, and rebuilt from the log when it's loaded.
+        A cache is backed by it through its `responses_db_factory`, e.g.
+        `lambda storage_dir: LogStructuredResponsesDB(storage_dir / 'responses_log')`.
+    """
+
+    def __init__(self, db_path: Path | None = None, log_client: SegmentLogClient | None = None):
+        """
+        :param db_path: The log's directory. Defaults to SegmentLogClient's default directory.
+        :param log_client: An already built log client, used instead of creating one.
+        """
+        if log_client is not None:
+            self._log_client = log_client
+        elif db_path is None:
+            self._log_client = SegmentLogClient()
+        else:
+            self._log_client = SegmentLogClient(db_path)
+        # like the responses table, a request may have several responses -- the first saved is the one fetched
+        self._request_keys: dict[str, list[str]] = {}
+        for key, value in self._log_client.items():
+            self._request_keys.setdefault(self._decode(key, value).request_key, []).append(key)
+
+    def fetch(self, key: str) -> ResponseRecord:
+        value = self._log_client.fetch(key)
+        if value is None:
+            raise KeyError(f'Response with key=`{key}` was not found!')
+        return self._decode(key, value)
+
+    def fetch_by_request(self, request_key: str) -> ResponseRecord:
+        keys = self._request_keys.get(request_key)
+        if not keys:
+            raise KeyError(f'Key {request_key} not found')
+        return self.fetch(keys[0])
+
+    def save(self, response: ResponseRecord) -> str:
+        self._unindex(response.key)  # a response saved again is moved to its (possibly new) request
+        encoded_request_key = response.request_key.encode()
+        encoded_prompt = b'' if response.prompt is None else response.prompt.encode()
+        prompt_size = -1 if response.prompt is None else len(encoded_prompt)
+        self._log_client.save(
+            response.key,
+            _HEADER.pack(response.created_at, len(encoded_request_key), prompt_size)
+            + encoded_request_key + encoded_prompt + response.response.encode(),
+        )
+        self._request_keys.setdefault(response.request_key, []).append(response.key)
+        return response.key
+
+    def replace_by_request(self, response: ResponseRecord) -> bool:
+        """Replaces the response of `response.request_key`, if it still has one. Returns whether it did."""
+        if not self.remove_by_request(response.request_key):
+            return False
+        self.save(response)
+        return True
+
+    def remove(self, key: str) -> bool:
+        self._unindex(key)
+        return self._log_client.remove(key)
+
+    def remove_by_request(self, request_key: str) -> bool:
+        keys = self._request_keys.pop(request_key, [])
+        removed = [self._log_client.remove(key) for key in keys]
+        return any(removed)
+
+    def exists(self, key: str) -> bool:
+        return self._log_client.exists(key)
+
+    def size(self) -> int:
+        return self._log_client.size()
+
+    def close(self):
+        self._log_client.close()
+
+    def _unindex(self, key: str) -> None:
+        value = self._log_client.fetch(key)
+        if value is None:
+            return
+        request_key = self._decode(key, value).request_key
+        keys = self._request_keys.get(request_key, [])
+        if key in keys:
+            keys.remove(key)
+        if not keys:
+            self._request_keys.pop(request_key, None)
+
+    @staticmethod
+    def _decode(key: str, value: memoryview) -> ResponseRecord:
+        created_at, request_key_size, prompt_size = _HEADER.unpack_from(value)
+        request_key_end = _HEADER.size + request_key_size
+        prompt_end = request_key_end + max(prompt_size, 0)
+        # built as is, it's been validated when it was saved
+        return ResponseRecord.model_construct(
+            key=key,
+            request_key=str(value[_HEADER.size:request_key_end], 'utf-8'),
+            response=str(value[prompt_end:], 'utf-8'),
+            created_at=created_at,
+            prompt=None if prompt_size < 0 else str(value[request_key_end:prompt_end], 'utf-8'),
+        )
@@ -1,4 +1,6 @@
-from text_similarity import vector_utils
+from pathlib import Path
+
+from text_similarity.vector_utils import Vector
 from .hashable_lru_cache import hashable_lru_cache
 from ..ranking_distance_method import RankingDistanceMethod
 from ...storage_client.faiss_client import FaissClient, FaissDistanceMethod
@@ -6,56 +8,67 @@ from ...storage_client.records import EmbeddedRequestRecord
 
 
 class RequestsDB:
-    _RANKING_METHODS_MAP = {
-        RankingDistanceMethod.EUCLIDEAN: vector_utils.euclidean_distance,
-        RankingDistanceMethod.MANHATTAN: vector_utils.manhattan_distance,
-        RankingDistanceMethod.COSINE: vector_utils.cosine_distance,
-    }
-
     def __init__(
             self,
             ranking_distance_method=RankingDistanceMethod.EUCLIDEAN,
-            db_distance_method=FaissDistanceMethod.L2
+            db_distance_method=FaissDistanceMethod.L2,
+            index_path: Path | None = None,
+            vector_client: FaissClient | None = None,
     ):
         """
         :param db_distance_method: The distance method to use for handling the inner vector DB of the embedded requests.
             Defaults to DistanceMethod.L2, which is an Euclidean distance.
         :param ranking_distance_method: The distance method to use for picking the most similar request.
             The inner DB returns K most similar requests, and out of those K we pick the most similar based on this distance method.
+        :param index_path: Where the inner vector DB persists its index. Defaults to FaissClient's default path.
+        :param vector_client: An already built inner vector DB, used instead of creating a FaissClient.
+            Must expose FaissClient's interface (e.g. SharedVectorClient).
         """
-        self._faiss_client = FaissClient(db_distance_method)
+        if vector_client is not None:
+            self._vector_client = vector_client
+        elif index_path is None:
+            self._vector_client = FaissClient(db_distance_method)
+        else:
+            self._vector_client = FaissClient(db_distance_method, index_path)
         self._ranking_distance_method = ranking_distance_method
 
-    @hashable_lru_cache
-    def most_similar_request(self, embedded_request: list[float], k=100) -> tuple[EmbeddedRequestRecord, float] | None:
+    def most_similar_request(self, embedded_request: Vector, k=100) -> tuple[EmbeddedRequestRecord, float] | None:
         """
         Returns the most similar (embedded, i.e. vectorized) question in the DB which were previously asked.
             None indicates that no previous questions were asked before.
         """
-        candidates = self._faiss_client.fetch_nearest_k(embedded_request, k)
+        # the DB version is part of the memoization key, so a memoized answer never outlives an insert or a removal
+        return self._most_similar_request(embedded_request, k, self._vector_client.version)
+
+    @hashable_lru_cache
+    def _most_similar_request(
+            self, embedded_request: Vector, k: int, version: int
+    ) -> tuple[EmbeddedRequestRecord, float] | None:
+        candidates = self._vector_client.fetch_nearest_k(embedded_request, k)
         if not candidates:
             return None
-        distance = self._RANKING_METHODS_MAP[self._ranking_distance_method]
-        best_candidate, best_distance = min(
-            [
-                [
-                    candidate,
-                    distance(tuple(embedded_request), tuple(candidate.vector))
-                ]
-                for candidate in candidates
-            ],
-            key=lambda item: item[1],
+        # all the candidates are ranked in one vectorized call
+        distances = self._ranking_distance_method.distances(
+            embedded_request, [candidate.vector for candidate in candidates]
         )
-        return EmbeddedRequestRecord(key=best_candidate.key, vector=best_candidate.vector), best_distance
+        best_index = int(distances.argmin())
+        best_candidate = candidates[best_index]
+        return EmbeddedRequestRecord(key=best_candidate.key, vector=best_candidate.vector), float(distances[best_index])
 
     def save(self, request: EmbeddedRequestRecord) -> str:
-        key = self._faiss_client.save(request.vector, request.key)
+        key = self._vector_client.save(request.vector, request.key)
         assert request.key == key
         return key
 
     def remove(self, key: str) -> bool:
-        return self._faiss_client.remove(key)
+        return self._vector_client.remove(key)
+
+    def contains(self, key: str) -> bool:
+        return self._vector_client.contains(key)
 
     def size(self) -> int:
         """Returns the amount of records in the DB."""
-        return self._faiss_client.size()
+        return self._vector_client.size()
+
+    def close(self) -> None:
+        self._vector_client.close()
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 from ...storage_client import SQLiteClient
 from ...storage_client.records import ResponseRecord
 
@@ -5,15 +7,18 @@ from ...storage_client.records import ResponseRecord
 class ResponsesDB:
     _TABLE = 'responses'
 
-    def __init__(self):
-        self._sqlite_client = SQLiteClient()
+    def __init__(self, db_path: Path | None = None):
+        self._sqlite_client = SQLiteClient() if db_path is None else SQLiteClient(db_path)
         self._sqlite_client.execute(
             f'CREATE TABLE IF NOT EXISTS {self._TABLE} ('
             'key TEXT PRIMARY KEY,'
             'request_key TEXT NOT NULL,'
-            'response TEXT NOT NULL'
+            'response TEXT NOT NULL,'
+            'created_at REAL NOT NULL DEFAULT 0,'
+            'prompt TEXT'
             ');'
         )
+        self._migrate()
 
     def fetch(self, key: str) -> ResponseRecord:
         record = self._sqlite_client.fetch(key, self._TABLE)
@@ -33,6 +38,13 @@ class ResponsesDB:
         assert response.key == key
         return key
 
+    def replace_by_request(self, response: ResponseRecord) -> bool:
+        """Replaces the response of `response.request_key`, if it still has one. Returns whether it did."""
+        if not self.remove_by_request(response.request_key):
+            return False
+        self.save(response)
+        return True
+
     def remove(self, key: str) -> bool:
         return self._sqlite_client.remove(key, self._TABLE)
 
@@ -44,3 +56,15 @@ class ResponsesDB:
 
     def size(self) -> int:
         return self._sqlite_client.size(self._TABLE)
+
+    def close(self):
+        self._sqlite_client.disconnect()
+
+    def _migrate(self):
+        columns = [row[1] for row in self._sqlite_client.execute(f'PRAGMA table_info({self._TABLE})').fetchall()]
+        if 'created_at' not in columns:
+            # responses stored before ages were tracked count as old
+            self._sqlite_client.execute(f'ALTER TABLE {self._TABLE} ADD COLUMN created_at REAL NOT NULL DEFAULT 0')
+        if 'prompt' not in columns:
+            # responses stored before their prompts were kept aren't refreshed
+            self._sqlite_client.execute(f'ALTER TABLE {self._TABLE} ADD COLUMN prompt TEXT')
@@ -0,0 +1,197 @@
+import re
+import threading
+import unicodedata
+
+import numpy as np
+from pydantic import BaseModel
+
+_NOT_WORD = re.compile(r'[^\w\s]')
+_NUMBER = re.compile(r'\d+')
+
+
+class NearDuplicateStats(BaseModel):
+    size: int = 0
+    lookups: int = 0
+    hits: int = 0  # lookups answered by a near duplicate, without embedding the prompt
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class _Entry:
+    __slots__ = ('signature', 'shingles', 'tokens', 'numbers')
+
+    def __init__(self, signature: np.ndarray, shingles: np.ndarray, tokens: tuple[str, ...], numbers: tuple[str, ...]):
+        self.signature = signature
+        self.shingles = shingles
+        self.tokens = tokens
+        self.numbers = numbers
+
+
+class MinHashLSHIndex:
+    """
+    A lexical near-duplicate index of the cached prompts, consulted before embedding: a prompt which differs from a
+        cached one only by case, punctuation, whitespace or a typo is found here in microseconds, without a forward
+        pass of the embedding model.
+
+    Lexical similarity can't tell a typo from a changed word: a long prompt with "not" added, or "enable" changed to
+        "disable", is as similar as one with a typo. Matches aren't checked against the embeddings (nor the hit
+        threshold), so a candidate is only a near duplicate if it has the same words, except for typos -- each differing
+        word is a single edit away from its counterpart (see `_is_typo`), and no word is added or removed.
+
+    Prompts are normalized (case, punctuation, whitespace) and broken into byte shingles. MinHash signatures of the
+        shingles are banded into an LSH index, whose buckets give the candidates, and a candidate is a near duplicate if
+        the exact Jaccard similarity of the shingles is at least `jaccard_threshold`, its words differ by typos only,
+        and it has the same numbers (which change a prompt's meaning while barely changing its text, e.g. "convert 100
+        dollars" vs "convert 300 dollars").
+
+    Thread-safe. A similarity cache keeps it in sync with its inserts and removals (see `SimilarityCache`).
+    """
+
+    def __init__(
+            self,
+            jaccard_threshold: float = 0.9,
+            num_perm: int = 64,
+            bands: int = 16,
+            shingle_size: int = 3,
+            seed: int = 0,
+    ):
+        """
+        :param num_perm: The signature length. With `bands` bands of `num_perm / bands` rows, a pair of Jaccard
+            similarity s becomes a candidate with probability 1 - (1 - s^rows)^bands (~1 for the defaults and s >= 0.8).
+        :param shingle_size: In bytes (at most 8). Shorter shingles make a typo cost less similarity.
+        """
+        if not 0 < jaccard_threshold <= 1:
+            raise ValueError('jaccard_threshold must be in (0, 1]')
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        if not 1 <= shingle_size <= 8:
+            raise ValueError('shingle_size must be between 1 and 8')
+        self.jaccard_threshold = jaccard_threshold
+        self._rows = num_perm // bands
+        self._shingle_size = shingle_size
+        # multiply-shift hash functions, one per permutation
+        rng = np.random.default_rng(seed)
+        self._multipliers = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._increments = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+        self._entries: dict[str, _Entry] = {}
+        self._buckets: list[dict[bytes, set[str]]] = [{} for _ in range(bands)]
+        self._stats = NearDuplicateStats()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: str, text: str) -> None:
+        entry = self._entry(text)
+        if entry is None:
+            return  # nothing lexical to match on, e.g. only punctuation
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            for band, band_key in enumerate(self._band_keys(entry.signature)):
+                self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def query(self, text: str) -> tuple[str, float] | None:
+        """Returns the key of the most similar near duplicate of the text, and their Jaccard similarity."""
+        entry = self._entry(text)
+        if entry is None:
+            return None
+        with self._lock:
+            candidates = set().union(*(
+                self._buckets[band].get(band_key, ()) for band, band_key in enumerate(self._band_keys(entry.signature))
+            ))
+            best = None
+            for key in candidates:
+                candidate = self._entries[key]
+                if candidate.numbers != entry.numbers or not _differ_by_typos(entry.tokens, candidate.tokens):
+                    continue
+                similarity = _jaccard(entry.shingles, candidate.shingles)
+                if similarity >= self.jaccard_threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+            return best
+
+    def record_lookup(self, is_hit: bool) -> None:
+        with self._lock:
+            self._stats.lookups += 1
+            if is_hit:
+                self._stats.hits += 1
+
+    def stats(self) -> NearDuplicateStats:
+        with self._lock:
+            return self._stats.model_copy(update={'size': len(self._entries)})
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for band, band_key in enumerate(self._band_keys(entry.signature)):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+        return True
+
+    def _entry(self, text: str) -> _Entry | None:
+        normalized = ' '.join(_NOT_WORD.sub(' ', unicodedata.normalize('NFKC', text).lower()).split())
+        if not normalized:
+            return None
+        shingles = self._shingles(normalized.encode())
+        # (a * x + b) mod 2^64, keeping the high bits -- numpy's uint64 arithmetic wraps around as needed
+        hashes = (np.outer(self._multipliers, shingles) + self._increments[:, np.newaxis]) >> np.uint64(32)
+        return _Entry(hashes.min(axis=1), shingles, tuple(normalized.split()), tuple(_NUMBER.findall(normalized)))
+
+    def _shingles(self, data: bytes) -> np.ndarray:
+        """The text's distinct byte shingles, each packed as is into an integer (no hashing needed, they're short)."""
+        values = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+        size = min(self._shingle_size, values.size)
+        windows = values.size - size + 1
+        packed = np.zeros(windows, dtype=np.uint64)
+        for offset in range(size):
+            packed = (packed << np.uint64(8)) | values[offset:offset + windows]
+        return np.unique(packed)
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [signature[start:start + self._rows].tobytes() for start in range(0, signature.size, self._rows)]
+
+
+def _differ_by_typos(tokens1: tuple[str, ...], tokens2: tuple[str, ...]) -> bool:
+    return len(tokens1) == len(tokens2) and all(
+        token1 == token2 or _is_typo(token1, token2) for token1, token2 in zip(tokens1, tokens2)
+    )
+
+
+def _is_typo(word1: str, word2: str) -> bool:
+    """
+    Whether the words are a single edit (an insertion, deletion, substitution or transposition) apart, and at least 4
+        letters long -- two edits already turn words into their opposites ("increase" vs "decrease", "maximum" vs
+        "minimum"), and short words differing by a letter are often different words ("cat" vs "car").
+    """
+    if max(len(word1), len(word2)) < 4 or abs(len(word1) - len(word2)) > 1:
+        return False
+    # optimal string alignment distance
+    previous2, previous = None, list(range(len(word2) + 1))
+    for i, char1 in enumerate(word1, 1):
+        current = [i]
+        for j, char2 in enumerate(word2, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char1 != char2))
+            if i > 1 and j > 1 and char1 == word2[j - 2] and word1[i - 2] == char2:
+                distance = min(distance, previous2[j - 2] + 1)
+            current.append(distance)
+        previous2, previous = previous, current
+    return previous[-1] <= 1
+
+
+def _jaccard(shingles1: np.ndarray, shingles2: np.ndarray) -> float:
+    intersection = np.intersect1d(shingles1, shingles2, assume_unique=True).size
+    return intersection / (shingles1.size + shingles2.size - intersection)
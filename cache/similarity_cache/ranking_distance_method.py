@@ -1,7 +1,23 @@
 from enum import Enum, auto
 
+import numpy as np
+
+from text_similarity import vector_utils
+
 
 class RankingDistanceMethod(Enum):
     EUCLIDEAN = auto()
     MANHATTAN = auto()
     COSINE = auto() # Note: Max distance is 1
+
+    def distances(self, query, vectors) -> np.ndarray:
+        """The distances of `query` to each of `vectors`, all of them computed in one vectorized call."""
+        return _KERNELS[self](query, vectors)
+
+
+# one-vs-many kernels
+_KERNELS = {
+    RankingDistanceMethod.EUCLIDEAN: vector_utils.euclidean_distances,
+    RankingDistanceMethod.MANHATTAN: vector_utils.manhattan_distances,
+    RankingDistanceMethod.COSINE: vector_utils.cosine_distances,
+}
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+
+
+class RefreshPolicy(BaseModel):
+    """
+    When a cached response is refreshed: once it's older than `soft_ttl`, if its entry is hot. It's still served as
+        is, and the caller (e.g. EchoLLM) replaces it with a fresh LLM response in the background.
+
+    What's hot depends on the policy's own state -- for LFU, entries used at least `min_uses` times, for LRU, entries
+        used within `recent_use_window` seconds before the current hit. Other policies keep no usage state, and never
+        refresh.
+    """
+    soft_ttl: float  # seconds
+    min_uses: int = 3
+    recent_use_window: float = 300  # seconds
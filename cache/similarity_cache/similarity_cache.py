@@ -1,11 +1,17 @@
 import hashlib
+import time
 from abc import ABC
+from pathlib import Path
 from typing import Callable
 
 from cache import ICache
-from .db_handlers import RequestsDB, ResponsesDB
+from text_similarity.vector_utils import Vector
+from .db_handlers import IResponsesDB, RequestsDB, ResponsesDB
+from .near_duplicate_index import MinHashLSHIndex
 from .ranking_distance_method import RankingDistanceMethod
+from .refresh_policy import RefreshPolicy
 from ..storage_client.faiss_client import FaissDistanceMethod
+from ..storage_client.records import EmbeddedRequestRecord, ResponseRecord
 
 
 class SimilarityCache(ICache, ABC):
@@ -16,39 +22,221 @@ class SimilarityCache(ICache, ABC):
             candidates_number: int,
             ranking_distance_method: RankingDistanceMethod,
             db_distance_method: FaissDistanceMethod,
-            prompt_embedder: Callable[[str], list[float]],
-            policy_name: str
+            prompt_embedder: Callable[[str], Vector],
+            policy_name: str,
+            storage_dir: Path | None = None,
+            refresh_policy: RefreshPolicy | None = None,
+            near_duplicate_index: MinHashLSHIndex | None = None,
+            responses_db_factory: Callable[[Path | None], IResponsesDB] | None = None,
     ):
+        """
+        :param storage_dir: A directory for this cache's own index and responses files.
+            Defaults to the storage clients' default files (shared by every cache that doesn't set it).
+        :param refresh_policy: When hot entries are refreshed (see `stale_request`). None disables refreshes.
+        :param near_duplicate_index: A lexical tier consulted before embedding -- lookups of near duplicates of cached
+            prompts are answered by it, without embedding them. It's kept in memory, and in sync with the cache's
+            inserts and removals from then on. None disables it.
+        :param responses_db_factory: Builds the responses store given `storage_dir`, e.g.
+            `lambda storage_dir: LogStructuredResponsesDB(storage_dir / 'responses_log')`. Defaults to a SQLite
+            `ResponsesDB`.
+        """
         super().__init__(max_size, policy_name)
         self._hit_distance_threshold = hit_distance_threshold
+        self._namespace_thresholds: dict[str, float] = {}
         self._candidates_number = candidates_number
-        self._requests_db = RequestsDB(ranking_distance_method, db_distance_method)
-        self._responses_db = ResponsesDB()
+        self._storage_dir = storage_dir
+        self._requests_db = self._create_requests_db(ranking_distance_method, db_distance_method, storage_dir)
+        self._responses_db = (responses_db_factory or self._create_responses_db)(storage_dir)
         self._embedder = prompt_embedder
+        self.refresh_policy = refresh_policy
+        self.near_duplicate_index = near_duplicate_index
 
-    def is_hit(self, prompt: str) -> bool:
-        most_similar_request = self._requests_db.most_similar_request(
-            self._embedder(prompt),
-            self._candidates_number
-        )
-        if most_similar_request is None:
-            return False
-        _, distance = most_similar_request
-        return distance <= self._hit_distance_threshold
+    def get_hit_distance_threshold(self, namespace: str | None = None) -> float:
+        return self._namespace_thresholds.get(namespace, self._hit_distance_threshold)
+
+    def set_hit_distance_threshold(self, threshold: float, namespace: str | None = None) -> None:
+        """
+        Sets the hit threshold at runtime (e.g. to a calibrated one, see `ThresholdCalibrator`).
+            With a namespace, it applies only to lookups of that namespace, and the others keep the default.
+        """
+        if namespace is None:
+            self._hit_distance_threshold = threshold
+        else:
+            self._namespace_thresholds[namespace] = threshold
+
+    def embed(self, prompt: str) -> Vector:
+        return self._embedder(prompt)
+
+    def most_similar_request(self, embedded_prompt: Vector) -> tuple[EmbeddedRequestRecord, float] | None:
+        """Returns the most similar cached request to an already embedded prompt, and its ranking distance."""
+        return self._requests_db.most_similar_request(embedded_prompt, self._candidates_number)
+
+    def near_duplicate(self, prompt: str) -> str | None:
+        """Returns the key of a cached near duplicate of the prompt (see `near_duplicate_index`), if there's one."""
+        if self.near_duplicate_index is None:
+            return None
+        near_duplicate = self.near_duplicate_index.query(prompt)
+        if near_duplicate is None:
+            return None
+        key, _ = near_duplicate
+        if not self._requests_db.contains(key):
+            # removed without this cache knowing, e.g. evicted by another process sharing the requests DB
+            self.near_duplicate_index.remove(key)
+            return None
+        return key
+
+    def is_hit(self, prompt: str, namespace: str | None = None) -> bool:
+        return self.lookup(prompt, namespace) is not None
+
+    def lookup(self, prompt: str, namespace: str | None = None) -> tuple[str, float] | None:
+        """
+        The key of the cached request a prompt hits and its ranking distance (0 for a near duplicate), None on a miss.
+            Like `is_hit`, but the key can be passed on to `on_hit` (as `request_key`), which then doesn't search again.
+        """
+        return self._hit(prompt, namespace, record_lookup=True)
 
     def on_hit(self, prompt: str, **kwargs) -> str:
-        hit_request, _ = self._requests_db.most_similar_request(
-            self._embedder(prompt),
-            self._candidates_number
-        )
-        response = self._responses_db.fetch_by_request(hit_request.key)
-        if response is None:
-            raise KeyError(f'Response with request_key=`{hit_request.key}` was not found!')
+        """
+        Accepted kwargs: `request_key` (the hit's key, from `lookup`) and `namespace` (picks the hit threshold).
+            Raises KeyError if the prompt no longer hits, e.g. its entry was evicted since `is_hit` by another process
+            sharing the cache.
+        """
+        hit_request_key = kwargs.get('request_key') or self._hit_request_key(prompt, kwargs.get('namespace'))
+        if hit_request_key is None:
+            raise KeyError(f'No cached request matches prompt `{prompt}`!')
+        response = self._responses_db.fetch_by_request(hit_request_key)
+        self._touch(hit_request_key)
         return response.response
 
     def current_size(self) -> int:
         return self._responses_db.size()
 
+    def nearest_response(self, prompt: str, max_distance: float, **kwargs) -> tuple[str, float] | None:
+        most_similar_request = self.most_similar_request(self._embedder(prompt))
+        if most_similar_request is None:
+            return None
+        request, distance = most_similar_request
+        if distance > max_distance:
+            return None
+        try:
+            return self._responses_db.fetch_by_request(request.key).response, distance
+        except KeyError:
+            return None
+
+    def stale_request(self, prompt: str, **kwargs) -> str | None:
+        if self.refresh_policy is None:
+            return None
+        request_key = self._hit_request_key(prompt, kwargs.get('namespace'))
+        if request_key is None:
+            return None
+        try:
+            response = self._responses_db.fetch_by_request(request_key)
+        except KeyError:
+            return None
+        if time.time() - response.created_at < self.refresh_policy.soft_ttl or not self._is_hot(request_key):
+            return None
+        return request_key
+
+    def request_prompt(self, request_key: str, **kwargs) -> str | None:
+        try:
+            return self._responses_db.fetch_by_request(request_key).prompt
+        except KeyError:
+            return None
+
+    def refresh(self, request_key: str, llm_response: str, **kwargs) -> bool:
+        return self._responses_db.replace_by_request(
+            ResponseRecord(
+                key=self._generate_key(llm_response),
+                request_key=request_key,
+                response=llm_response,
+                prompt=self.request_prompt(request_key),
+            )
+        )
+
+    def invalidate(self, prompt: str, namespace: str | None = None) -> bool:
+        """
+        Removes the entry cached for exactly this prompt (not for similar ones). Returns whether one existed.
+            Entries aren't kept per namespace, it only picks the hit threshold of lookups.
+        """
+        prompt_key = self._generate_key(prompt)
+        self._forget(prompt_key)
+        return self._remove_entry(prompt_key)
+
+    def close(self) -> None:
+        """Releases the cache's storage (e.g. before deleting its files). The cache can't be used afterwards."""
+        self._requests_db.close()
+        self._responses_db.close()
+
+    def _hit_request_key(self, prompt: str, namespace: str | None = None) -> str | None:
+        hit = self._hit(prompt, namespace)
+        return None if hit is None else hit[0]
+
+    def _hit(self, prompt: str, namespace: str | None = None, record_lookup: bool = False) -> tuple[str, float] | None:
+        """
+        The cached request a prompt hits, and its distance: its near duplicate if there's one, else the most similar,
+            if it's within the hit threshold. None if the prompt doesn't hit.
+
+        :param record_lookup: Whether to count the lookup in the near-duplicate index's stats.
+        """
+        if self.near_duplicate_index is not None:
+            near_duplicate_key = self.near_duplicate(prompt)
+            if record_lookup:
+                self.near_duplicate_index.record_lookup(near_duplicate_key is not None)
+            if near_duplicate_key is not None:
+                return near_duplicate_key, 0.0
+        most_similar_request = self.most_similar_request(self._embedder(prompt))
+        if most_similar_request is None:
+            return None
+        request, distance = most_similar_request
+        return (request.key, distance) if distance <= self.get_hit_distance_threshold(namespace) else None
+
+    def _save_request(self, prompt_key: str, prompt: str, embedded_prompt: Vector | None = None) -> None:
+        """Saves a new request to the requests DB (and the near-duplicate index)."""
+        self._requests_db.save(
+            EmbeddedRequestRecord(
+                key=prompt_key, vector=self._embedder(prompt) if embedded_prompt is None else embedded_prompt
+            )
+        )
+        if self.near_duplicate_index is not None:
+            self.near_duplicate_index.add(prompt_key, prompt)
+
+    def _remove_entry(self, prompt_key: str) -> bool:
+        """Removes a request and its response from the DBs, the policy state is left to the caller."""
+        if self.near_duplicate_index is not None:
+            self.near_duplicate_index.remove(prompt_key)
+        removed_request = self._requests_db.remove(prompt_key)
+        removed_response = self._responses_db.remove_by_request(prompt_key)
+        return removed_request or removed_response
+
+    def _forget(self, prompt_key: str) -> None:
+        """Drops a key from the policy state. The base cache keeps none, policies override it."""
+        pass
+
+    def _touch(self, prompt_key: str) -> None:
+        """Records a hit of a key in the policy state (e.g. its recency). The base cache keeps none."""
+        pass
+
+    def _is_hot(self, prompt_key: str) -> bool:
+        """Whether an entry is popular enough to be refreshed, by the policy state. The base cache keeps none."""
+        return False
+
+    def _create_requests_db(
+            self,
+            ranking_distance_method: RankingDistanceMethod,
+            db_distance_method: FaissDistanceMethod,
+            storage_dir: Path | None,
+    ) -> RequestsDB:
+        """Builds the embedded requests DB. Override to back the cache with a different vector client."""
+        if storage_dir is None:
+            return RequestsDB(ranking_distance_method, db_distance_method)
+        return RequestsDB(ranking_distance_method, db_distance_method, storage_dir / 'requests.db')
+
+    def _create_responses_db(self, storage_dir: Path | None) -> IResponsesDB:
+        """Builds the default responses DB, unless a `responses_db_factory` is given."""
+        if storage_dir is None:
+            return ResponsesDB()
+        return ResponsesDB(storage_dir / 'responses.sql')
+
     @staticmethod
     def _generate_key(text: str) -> str:
         return hashlib.md5(text.encode()).hexdigest()
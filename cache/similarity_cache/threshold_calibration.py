@@ -0,0 +1,161 @@
+import argparse
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Iterable
+
+import numpy as np
+from pydantic import BaseModel
+
+from text_similarity.vector_utils import Vector
+from .ranking_distance_method import RankingDistanceMethod
+
+
+class PromptPair(BaseModel):
+    """
+    One trace entry: a prompt looked up against a previously cached prompt.
+        Either labelled (`is_equivalent`), or judged by the similarity of both prompts' responses.
+    """
+    prompt: str
+    cached_prompt: str
+    is_equivalent: bool | None = None
+    response: str | None = None
+    cached_response: str | None = None
+    namespace: str | None = None
+
+
+class ThresholdRecommendation(BaseModel):
+    target_false_hit_rate: float
+    threshold: float | None  # None when no threshold meets the target
+    false_hit_rate: float  # share of hits which serve a non-equivalent response
+    hit_ratio: float  # share of lookups which are hits
+    recall: float  # share of equivalent pairs which are hits
+
+
+class ThresholdCalibrator:
+    """
+    Recommends `hit_distance_threshold` values from a trace of prompt pairs.
+
+    The pairs' ranking distances are computed with the same embedder and ranking distance method the cache uses
+        (their scales differ a lot, e.g. COSINE is bounded by 2 while EUCLIDEAN isn't), and for each target
+        false-hit rate the largest threshold meeting it is picked, as it maximizes the hit ratio.
+
+    Usage:
+        calibrator = ThresholdCalibrator(text_embedder.sbert_embedder, RankingDistanceMethod.COSINE)
+        for namespace, recommendations in calibrator.calibrate_by_namespace(pairs, [0.01, 0.05]).items():
+            cache.set_hit_distance_threshold(recommendations[0].threshold, namespace)
+    """
+
+    def __init__(
+            self,
+            prompt_embedder: Callable[[str], Vector],
+            ranking_distance_method: RankingDistanceMethod,
+            response_distance_threshold: float | None = None,
+    ):
+        """
+        :param response_distance_threshold: Judges unlabelled pairs -- they're equivalent if their responses'
+            ranking distance is at most this. Unlabelled pairs are rejected if it isn't set.
+        """
+        self._embedder = prompt_embedder
+        self._distance = ranking_distance_method.distances
+        self._response_distance_threshold = response_distance_threshold
+
+    def distances(self, pairs: Iterable[PromptPair]) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the pairs' ranking distances and their equivalence labels."""
+        distances, labels = [], []
+        for pair in pairs:
+            distances.append(self._pair_distance(pair.prompt, pair.cached_prompt))
+            labels.append(self._is_equivalent(pair))
+        return np.asarray(distances, dtype=np.float64), np.asarray(labels, dtype=bool)
+
+    def calibrate(
+            self, pairs: Iterable[PromptPair], target_false_hit_rates: Iterable[float] = (0.01, 0.05, 0.1)
+    ) -> list[ThresholdRecommendation]:
+        distances, labels = self.distances(pairs)
+        return self.recommend(distances, labels, target_false_hit_rates)
+
+    def calibrate_by_namespace(
+            self, pairs: Iterable[PromptPair], target_false_hit_rates: Iterable[float] = (0.01, 0.05, 0.1)
+    ) -> dict[str | None, list[ThresholdRecommendation]]:
+        by_namespace: dict[str | None, list[PromptPair]] = defaultdict(list)
+        for pair in pairs:
+            by_namespace[pair.namespace].append(pair)
+        target_false_hit_rates = list(target_false_hit_rates)
+        return {
+            namespace: self.calibrate(namespace_pairs, target_false_hit_rates)
+            for namespace, namespace_pairs in by_namespace.items()
+        }
+
+    @staticmethod
+    def recommend(
+            distances: np.ndarray, labels: np.ndarray, target_false_hit_rates: Iterable[float]
+    ) -> list[ThresholdRecommendation]:
+        if distances.size == 0:
+            raise ValueError('Cannot calibrate on an empty trace!')
+
+        order = np.argsort(distances, kind='stable')
+        sorted_distances, sorted_labels = distances[order], labels[order]
+        true_hits = np.cumsum(sorted_labels)
+        hits = np.arange(1, sorted_distances.size + 1)
+        # a threshold admits every pair up to its distance, so only the last pair of each distance tie is a candidate
+        candidates = np.flatnonzero(np.append(np.diff(sorted_distances) > 0, True))
+        false_hit_rates = (hits[candidates] - true_hits[candidates]) / hits[candidates]
+        equivalent = max(int(labels.sum()), 1)
+
+        recommendations = []
+        for target in target_false_hit_rates:
+            meeting = np.flatnonzero(false_hit_rates <= target)
+            if meeting.size == 0:
+                recommendations.append(ThresholdRecommendation(
+                    target_false_hit_rate=target, threshold=None, false_hit_rate=0.0, hit_ratio=0.0, recall=0.0,
+                ))
+                continue
+            best = candidates[meeting[-1]]
+            recommendations.append(ThresholdRecommendation(
+                target_false_hit_rate=target,
+                threshold=float(sorted_distances[best]),
+                false_hit_rate=float(false_hit_rates[meeting[-1]]),
+                hit_ratio=float(hits[best] / sorted_distances.size),
+                recall=float(true_hits[best] / equivalent),
+            ))
+        return recommendations
+
+    def _pair_distance(self, text1: str, text2: str) -> float:
+        return float(self._distance(self._embedder(text1), [self._embedder(text2)])[0])
+
+    def _is_equivalent(self, pair: PromptPair) -> bool:
+        if pair.is_equivalent is not None:
+            return pair.is_equivalent
+        if self._response_distance_threshold is None or pair.response is None or pair.cached_response is None:
+            raise ValueError(
+                'Unlabelled pairs need both responses and a `response_distance_threshold` to be judged!'
+            )
+        return self._pair_distance(pair.response, pair.cached_response) <= self._response_distance_threshold
+
+
+def main():
+    from text_similarity import text_embedder
+
+    parser = argparse.ArgumentParser(description='Recommends hit distance thresholds from a trace of prompt pairs.')
+    parser.add_argument('trace', type=Path, help='A JSON-lines file of `PromptPair`s')
+    parser.add_argument('--embedder', choices=['sbert', 'openai'], default='sbert')
+    parser.add_argument('--ranking', choices=[m.name for m in RankingDistanceMethod], default='COSINE')
+    parser.add_argument('--targets', type=float, nargs='+', default=[0.01, 0.05, 0.1])
+    parser.add_argument('--response-distance-threshold', type=float, default=None)
+    args = parser.parse_args()
+
+    embedders = {'sbert': text_embedder.sbert_embedder, 'openai': text_embedder.openai_embedder}
+    calibrator = ThresholdCalibrator(
+        embedders[args.embedder], RankingDistanceMethod[args.ranking], args.response_distance_threshold
+    )
+    with args.trace.open(encoding='utf-8') as f:
+        pairs = [PromptPair.model_validate(json.loads(line)) for line in f if line.strip()]
+
+    for namespace, recommendations in calibrator.calibrate_by_namespace(pairs, args.targets).items():
+        print(f'namespace={namespace}')
+        for recommendation in recommendations:
+            print(f'  {recommendation.model_dump_json()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,3 @@
 from .faiss_client import FaissClient
+from .segment_log_client import SegmentLogClient
 from .sqlite_client import SQLiteClient
@@ -1,18 +1,27 @@
 import hashlib
 import json
+import logging
+import threading
 from enum import Enum
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import faiss
 import numpy as np
 from pydantic import BaseModel
 
 from text_similarity import vector_utils
+from text_similarity.vector_utils import Vector
+
+if TYPE_CHECKING:
+    import faiss  # imported at first use, it's slow to import
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
 
 
 class StoredVector(BaseModel):
     key: str
-    vector: list[float]  # index-space vector (normalized for COSINE; raw otherwise)
+    vector: Vector  # index-space vector (normalized for COSINE; raw otherwise)
 
 
 class FaissVector(StoredVector):
@@ -30,18 +39,59 @@ _CWD = Path(__file__).parent
 
 
 class FaissClient:
-    def __init__(self, distance_method: FaissDistanceMethod, index_path=_CWD / 'resources/requests.db'):
+    """
+    Removals are tombstoned: the removed vector stays in the index, and searches filter it out. Removing from a flat
+        index shifts its whole storage, and the index would have to be rewritten to disk every time, so an eviction would
+        cost O(N) twice. Once tombstones are `compaction_threshold` of the index, a background thread rebuilds the
+        index from the live vectors, and swaps it in (along with the changes made meanwhile). Searches don't wait for
+        it, they keep using the previous index until the swap.
+
+    Saves are persisted in batches: rewriting the index and its metadata is O(N), so it's done once every
+        `persist_interval` saves, and by `flush` and `close`. Saves since the last persist are lost if the process
+        dies -- for a cache, they are only missed hits.
+    """
+
+    def __init__(
+            self,
+            distance_method: FaissDistanceMethod,
+            index_path=_CWD / 'resources/requests.db',
+            compaction_threshold: float = 0.2,
+            background_compaction: bool = True,
+            persist_interval: int = 64,
+    ):
+        """
+        :param compaction_threshold: The share of tombstoned vectors in the index which triggers a compaction.
+        :param background_compaction: Whether to compact on a background thread, or within the removal itself.
+        :param persist_interval: The amount of saves between writes of the index to disk. 1 persists every save.
+        """
+        if not 0 < compaction_threshold <= 1:
+            raise ValueError('compaction_threshold must be in (0, 1]')
+        if persist_interval <= 0:
+            raise ValueError('persist_interval must be greater than 0!')
         self.index_path = index_path
         self.index_path.parent.mkdir(parents=True, exist_ok=True)
 
         self.distance_method = distance_method
+        self.compaction_threshold = compaction_threshold
+        self.background_compaction = background_compaction
+        self.persist_interval = persist_interval
 
         # lazy-initialized attributes
-        self.index: faiss.Index | None = None
+        self.index: 'faiss.Index | None' = None
         self.dim: int | None = None
         self.meta_path = self.index_path.with_suffix('.meta.json')
+        self.tombstones_path = self.index_path.with_suffix('.tombstones.json')
         self._items: dict[str, FaissVector] = {}  # key -> FaissVector
         self._id_to_key: dict[int, str] = {}  # id -> key
+        self._tombstones: set[int] = set()  # ids of removed vectors which are still in the index
+        # excludes the tombstones from searches, rebuilt whenever they change
+        self._search_parameters: 'faiss.SearchParameters | None' = None
+        self._unpersisted_saves = 0
+        self.version = 0  # bumped on every change, lets callers tell whether previous search results are still valid
+
+        # serializes changes (including the compaction's swap), searches don't take it
+        self._lock = threading.RLock()
+        self._compaction: threading.Thread | None = None
 
         # ensure dirs exist
         self.index_path.parent.mkdir(parents=True, exist_ok=True)
@@ -49,43 +99,48 @@ class FaissClient:
 
         self._load()
 
-    def fetch_nearest_k(self, vector: list[float], k: int = 100) -> list[StoredVector]:
+    def fetch_nearest_k(self, vector: Vector, k: int = 100) -> list[StoredVector]:
         if k <= 0:
             raise ValueError('k must be greater than 0!')
-        if self.index is None or self.index.ntotal == 0:
+        index = self.index  # a compaction may swap it meanwhile, the previous one stays valid for this search
+        if index is None or index.ntotal == 0:
             return []
 
         # query in index-space (normalize only for cosine)
-        q_vec = vector_utils.normalize(vector) if self.distance_method == FaissDistanceMethod.COSINE else vector
-        xq = np.ascontiguousarray([np.asarray(q_vec, dtype=np.float32)], dtype=np.float32)
+        q_vec = vector_utils.normalized(vector) if self.distance_method == FaissDistanceMethod.COSINE else vector
+        xq = vector_utils.as_vector(q_vec)[np.newaxis, :]
 
-        k_eff = min(k, self.index.ntotal)
-        _, ids = self.index.search(xq, k_eff)  # type: ignore[call-arg]
+        # tombstones are excluded by the search itself, so k live vectors are found without over-fetching
+        _, ids = index.search(xq, min(k, index.ntotal), params=self._search_parameters)  # type: ignore[call-arg]
 
         results: list[StoredVector] = []
         for lid in ids[0]:
             if lid == -1:
                 continue
             key = self._id_to_key.get(int(lid))
-            if not key:
-                continue
-            faiss_vector = self._items[key]
+            faiss_vector = self._items.get(key) if key else None
+            if faiss_vector is None:
+                continue  # removed since the search started
             original_vector = StoredVector(key=key, vector=self._reconstruct_original_vector(faiss_vector))
             results.append(original_vector)  # return original vector for flexible re-ranking
+            if len(results) == k:
+                break
         return results
 
-    def save(self, vector: list[float], key: str) -> str:
+    def save(self, vector: Vector, key: str) -> str:
+        with self._lock:
+            return self._save(vector, key)
+
+    def _save(self, vector: Vector, key: str) -> str:
         if key in self._items:
             return key
 
+        vec = vector_utils.as_vector(vector)
         if self.distance_method == FaissDistanceMethod.COSINE:
             # store normalized vector in index; keep original norm to reconstruct raw later
-            arr_raw = np.asarray(vector, dtype=np.float32)
-            norm = float(np.linalg.norm(arr_raw))
-            vec = (arr_raw / norm).astype(np.float32).tolist() if norm != 0.0 else arr_raw.astype(np.float32).tolist()
-            original_norm = norm
+            original_norm = float(np.linalg.norm(vec))
+            vec = vector_utils.normalized(vec)
         else:
-            vec = list(np.asarray(vector, dtype=np.float32))
             original_norm = None
 
         # init index if needed
@@ -97,44 +152,132 @@ class FaissClient:
 
         # stable int64 id from key
         id_int = int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big") & ((1 << 63) - 1)
+        while id_int in self._tombstones or id_int in self._id_to_key:
+            id_int = (id_int + 1) & ((1 << 63) - 1)  # a re-added key's previous vector may still be in the index
 
-        xb = np.ascontiguousarray([np.asarray(vec, dtype=np.float32)], dtype=np.float32)
+        xb = vec[np.newaxis, :]
         xids = np.asarray([id_int], dtype=np.int64)
         self.index.add_with_ids(xb, xids)  # type: ignore[call-arg]
 
         self._items[key] = FaissVector(key=key, id=id_int, vector=vec, original_norm=original_norm)
         self._id_to_key[id_int] = key
+        self.version += 1
 
-        self._persist()
+        self._unpersisted_saves += 1
+        if self._unpersisted_saves >= self.persist_interval:
+            self._persist()
         return key
 
     def remove(self, key: str) -> bool:
-        fv = self._items.pop(key, None)
-        if fv is None:
-            return False  # nothing to remove
-
-        vid = int(fv.id)
-        self._id_to_key.pop(vid, None)
-
-        if self.index is not None and self.index.ntotal > 0:
-            ids = np.asarray([vid], dtype=np.int64)
-            self.index.remove_ids(ids)
-
-        self._persist()
-        return True
+        with self._lock:
+            fv = self._items.pop(key, None)
+            if fv is None:
+                return False  # nothing to remove
+
+            vid = int(fv.id)
+            self._id_to_key.pop(vid, None)
+            self._tombstones.add(vid)
+            self._update_search_parameters()
+            self.version += 1
+
+            # the index itself is unchanged, only the (small) tombstones file is rewritten
+            self._persist_tombstones()
+            if self.tombstone_ratio() >= self.compaction_threshold:
+                self._start_compaction()
+            return True
+
+    def contains(self, key: str) -> bool:
+        return key in self._items
 
     def size(self) -> int:
         return len(self._items)
 
+    def tombstone_ratio(self) -> float:
+        """The share of the index's vectors which were removed, and are only filtered out by searches."""
+        index = self.index
+        return len(self._tombstones) / index.ntotal if index is not None and index.ntotal else 0.0
+
+    def compact(self) -> None:
+        """Rebuilds the index from the live vectors, dropping the tombstones. Searches continue meanwhile."""
+        with self._lock:
+            if self.index is None or not self._tombstones:
+                return
+            snapshot = list(self._items.values())
+            snapshot_ids = {fv.id for fv in snapshot}
+            removed_before = set(self._tombstones)
+
+        new_index = self._build_index(snapshot)  # the slow part, done without holding the lock
+
+        with self._lock:
+            # catch up with the changes made during the build
+            added = [fv for fv in self._items.values() if fv.id not in snapshot_ids]
+            if added:
+                new_index.add_with_ids(  # type: ignore[call-arg]
+                    vector_utils.as_matrix([fv.vector for fv in added]), np.asarray([fv.id for fv in added], np.int64)
+                )
+            # vectors removed during the build are in the new index too, they stay tombstoned
+            self._tombstones = {vid for vid in self._tombstones - removed_before if vid in snapshot_ids}
+            self._update_search_parameters()
+            self.index = new_index
+            self._persist()
+            logger.info(f'Compacted {self.index_path.name}: {len(removed_before)} tombstones dropped')
+
+    def flush(self) -> None:
+        """Persists the saves made since the last persist."""
+        with self._lock:
+            if self._unpersisted_saves:
+                self._persist()
+
+    def close(self) -> None:
+        """Waits for an ongoing compaction and persists the pending saves. The files aren't written to afterwards."""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+        self.flush()
+
+    def _start_compaction(self) -> None:
+        if not self.background_compaction:
+            self.compact()
+            return
+        if self._compaction is not None and self._compaction.is_alive():
+            return  # it'll be triggered again by a later removal, if still needed
+        self._compaction = threading.Thread(target=self._compact_in_background, name='faiss-compaction', daemon=True)
+        self._compaction.start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception:
+            logger.exception(f'Compacting {self.index_path.name} failed, it keeps filtering tombstones')
+
+    def _update_search_parameters(self) -> None:
+        import faiss
+        if not self._tombstones:
+            self._search_parameters = None
+            return
+        tombstones = faiss.IDSelectorBatch(np.fromiter(self._tombstones, dtype=np.int64, count=len(self._tombstones)))
+        search_parameters = faiss.SearchParameters(sel=faiss.IDSelectorNot(tombstones))
+        search_parameters.tombstones = tombstones  # the selectors don't own each other, keep them alive together
+        self._search_parameters = search_parameters
+
+    def _build_index(self, items: list[FaissVector]) -> 'faiss.Index':
+        index = self._make_index(int(self.dim))
+        if items:
+            xb = vector_utils.as_matrix([fv.vector for fv in items])  # index-space vectors
+            if not index.is_trained:
+                index.train(xb)  # an ANN index (e.g. IVF) is retrained on the current vectors by every rebuild
+            index.add_with_ids(xb, np.asarray([fv.id for fv in items], dtype=np.int64))  # type: ignore[call-arg]
+        return index
+
     @staticmethod
-    def _reconstruct_original_vector(stored_vector: FaissVector) -> list[float]:
+    def _reconstruct_original_vector(stored_vector: FaissVector) -> np.ndarray:
         """Convert stored index-space vector back to raw/original space if possible (undo normalization, for Cosine case)."""
         if stored_vector.original_norm is not None and stored_vector.original_norm != 0.0:
-            arr = np.asarray(stored_vector.vector, dtype=np.float32)
-            return (arr * stored_vector.original_norm).astype(np.float32).tolist()
+            return stored_vector.vector * np.float32(stored_vector.original_norm)
         return stored_vector.vector
 
-    def _make_index(self, dim: int) -> faiss.Index:
+    def _make_index(self, dim: int) -> 'faiss.Index':
+        import faiss
         if self.distance_method in (FaissDistanceMethod.COSINE, FaissDistanceMethod.INNER_PRODUCT):
             base = faiss.IndexFlatIP(dim)  # cosine uses IP on normalized vectors
         elif self.distance_method == FaissDistanceMethod.L2:
@@ -146,6 +289,7 @@ class FaissClient:
     def _load(self) -> None:
         # load index if present
         if self.index_path.exists():
+            import faiss
             self.index = faiss.read_index(self.index_path.__fspath__())
             self.dim = getattr(self.index, "d", None)
 
@@ -155,9 +299,14 @@ class FaissClient:
             meta = json.loads(self.meta_path.read_text(encoding='utf-8'))
             self.dim = meta.get("dim", self.dim)
 
+            # removals only persist their tombstones, the metadata may still list the removed vectors
+            if self.tombstones_path.exists():
+                self._tombstones = set(json.loads(self.tombstones_path.read_text(encoding='utf-8')))
             raw_items = meta.get("items", {}) or {}
             self._items = {k: FaissVector.model_validate(v) for k, v in raw_items.items()}
+            self._items = {k: v for k, v in self._items.items() if v.id not in self._tombstones}
             self._id_to_key = {int(v.id): k for k, v in self._items.items()}
+            self._update_search_parameters()
 
             meta_method = meta.get("distance_method")
 
@@ -176,25 +325,23 @@ class FaissClient:
 
         # rebuild index from metadata if needed
         if self.index is None and self.dim is not None:
-            self.index = self._make_index(int(self.dim))
+            self.index = self._build_index(list(self._items.values()))
+            self._tombstones = set()
+            self._update_search_parameters()
             if self._items:
-                vecs = [fv.vector for fv in self._items.values()]  # index-space vectors
-                ids = [fv.id for fv in self._items.values()]
-                xb = np.asarray(vecs, dtype=np.float32)
-                xids = np.asarray(ids, dtype=np.int64)
-                if xb.size:
-                    self.index.add_with_ids(xb, xids)  # type: ignore[call-arg]
-                    faiss.write_index(self.index, self.index_path.__fspath__())
+                self._persist()
 
     def _persist(self) -> None:
+        self._unpersisted_saves = 0
         # persist index (temp then replace)
         if self.index is not None:
+            import faiss
             tmp_index = self.index_path.with_suffix(self.index_path.suffix + ".tmp")
             faiss.write_index(self.index, tmp_index.__fspath__())
             tmp_index.replace(self.index_path)
 
         # persist metadata (temp then replace)
-        items_dump = {k: v.model_dump() for k, v in self._items.items()}
+        items_dump = {k: v.model_dump(mode='json') for k, v in self._items.items()}
         meta = {
             "dim": int(self.dim) if self.dim is not None else None,
             "items": items_dump,
@@ -204,3 +351,11 @@ class FaissClient:
         tmp_meta = self.meta_path.with_suffix(self.meta_path.suffix + ".tmp")
         tmp_meta.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
         tmp_meta.replace(self.meta_path)
+
+        self._persist_tombstones()
+
+    def _persist_tombstones(self) -> None:
+        # written after the index, so the tombstones on disk always cover the removed vectors in the index on disk
+        tmp_tombstones = self.tombstones_path.with_suffix(self.tombstones_path.suffix + ".tmp")
+        tmp_tombstones.write_text(json.dumps(sorted(self._tombstones)), encoding="utf-8")
+        tmp_tombstones.replace(self.tombstones_path)
@@ -1,6 +1,9 @@
+import time
 from abc import ABC
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from text_similarity.vector_utils import Vector
 
 
 class IRecord(BaseModel, ABC):
@@ -10,7 +13,9 @@ class IRecord(BaseModel, ABC):
 class ResponseRecord(IRecord):
     request_key: str
     response: str
+    created_at: float = Field(default_factory=time.time)  # seconds since the epoch, resets when refreshed
+    prompt: str | None = None  # the request's own prompt, a refresh asks it again (None for older entries)
 
 
 class EmbeddedRequestRecord(IRecord):
-    vector: list[float]
+    vector: Vector
@@ -0,0 +1,245 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
+
+_CWD = Path(__file__).parent
+
+_HEADER = struct.Struct('<IBHI')  # crc32 (of the rest of the record), operation, key size, value size
+_CRC, _BODY_HEADER = struct.Struct('<I'), struct.Struct('<BHI')  # the same header, packed in two steps
+_SAVE, _REMOVE = 1, 0
+_SEGMENT_SUFFIX = '.log'
+_MIN_COMPACTION_GARBAGE = 1 << 20  # bytes, smaller logs aren't worth rewriting
+
+
+class _Location(NamedTuple):
+    segment: int
+    offset: int  # of the value, in the segment file
+    size: int  # of the value
+    record_size: int  # of the whole record, counted as garbage once the record is overwritten or removed
+
+
+class SegmentLogClient:
+    """
+    A log-structured key-value store of byte strings. Saves and removals are appended to the active segment file
+        (rolled over once it reaches `segment_size`), and an in-memory index maps every live key to its value's
+        location. A fetch is an index lookup and a slice of the segment's memory map, without copying the value.
+
+    Overwritten and removed values stay in their segments as garbage. Once garbage is `compaction_threshold` of the
+        log, a background thread seals the active segment, copies the live values of the sealed segments to a new one,
+        and deletes the sealed segments. Fetches and changes continue meanwhile.
+
+    Writes aren't fsynced: a crash of the machine may lose the last writes, a record torn by a crash is dropped when the
+        log is loaded. Thread-safe.
+    """
+
+    def __init__(
+            self,
+            directory: Path = _CWD / 'resources/responses_log',
+            segment_size: int = 64 << 20,
+            compaction_threshold: float = 0.5,
+            background_compaction: bool = True,
+    ):
+        """
+        :param segment_size: In bytes. The active segment is rolled over once it reaches it.
+        :param compaction_threshold: The share of garbage in the log which triggers a compaction.
+        :param background_compaction: Whether to compact on a background thread, or within the change itself.
+        """
+        if not 0 < compaction_threshold <= 1:
+            raise ValueError('compaction_threshold must be in (0, 1]')
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.compaction_threshold = compaction_threshold
+        self.background_compaction = background_compaction
+
+        self._index: dict[str, _Location] = {}
+        self._segment_sizes: dict[int, int] = {}  # segment -> bytes written to it
+        self._garbage = 0  # bytes of overwritten and removed records, and of the removal records themselves
+        self._maps: dict[int, mmap.mmap] = {}  # segment -> its latest memory map, remapped as the segment grows
+        self._lock = threading.RLock()
+        self._compaction: threading.Thread | None = None
+
+        self._load()
+        self._active = max(self._segment_sizes, default=0)
+        if not self._segment_sizes:
+            self._active = self._roll()
+        self._active_fd = os.open(self._segment_path(self._active), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+
+    def fetch(self, key: str) -> memoryview | None:
+        """Returns a read-only view of the key's value in the segment's memory map, valid even after it's removed."""
+        with self._lock:
+            location = self._index.get(key)
+            if location is None:
+                return None
+            segment_map = self._maps.get(location.segment)
+            if segment_map is None or location.offset + location.size > len(segment_map):
+                segment_map = self._map(location.segment)
+            return memoryview(segment_map)[location.offset:location.offset + location.size]
+
+    def save(self, key: str, value: bytes) -> str:
+        with self._lock:
+            self._append(_SAVE, key, value)
+            self._compact_if_needed()
+        return key
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._index:
+                return False
+            self._append(_REMOVE, key, b'')
+            self._compact_if_needed()
+            return True
+
+    def exists(self, key: str) -> bool:
+        return key in self._index
+
+    def size(self) -> int:
+        return len(self._index)
+
+    def items(self) -> Iterator[tuple[str, memoryview]]:
+        """The live keys and their values, in no particular order."""
+        for key in list(self._index):
+            value = self.fetch(key)
+            if value is not None:
+                yield key, value
+
+    def garbage_ratio(self) -> float:
+        """The share of the log's bytes which are overwritten or removed records, reclaimed by a compaction."""
+        total = sum(self._segment_sizes.values())
+        return self._garbage / total if total else 0.0
+
+    def compact(self) -> None:
+        """Copies the live values out of every segment but a new active one, and deletes those segments."""
+        with self._lock:
+            sealed = sorted(self._segment_sizes)
+            self._switch_active(self._roll())
+            live = [(key, location) for key, location in self._index.items() if location.segment in sealed]
+
+        # sealed segments are immutable, their values are read without holding the lock
+        copied = 0
+        for key, location in live:
+            value = bytes(self._sealed_value(location))
+            with self._lock:
+                if self._index.get(key) == location:  # not overwritten or removed meanwhile
+                    self._append(_SAVE, key, value)
+                    copied += 1
+
+        with self._lock:
+            # every record left in the sealed segments is garbage by now, they are dropped with it
+            for segment in sealed:
+                self._garbage -= self._segment_sizes.pop(segment)
+                segment_map = self._maps.pop(segment, None)
+                if segment_map is not None:
+                    try:
+                        segment_map.close()
+                    except BufferError:
+                        pass  # a fetched view still uses it, it's closed once the view is released
+                self._segment_path(segment).unlink(missing_ok=True)
+            logger.info(f'Compacted {self.directory.name}: {len(sealed)} segments merged, {copied} values kept')
+
+    def close(self) -> None:
+        """Waits for an ongoing compaction and closes the active segment. The client can't be used afterwards."""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+        with self._lock:
+            if self._active_fd is not None:
+                os.close(self._active_fd)
+                self._active_fd = None
+
+    def _append(self, operation: int, key: str, value: bytes) -> None:
+        encoded_key = key.encode()
+        body = _BODY_HEADER.pack(operation, len(encoded_key), len(value)) + encoded_key + value
+        record = _CRC.pack(zlib.crc32(body)) + body
+        if self._segment_sizes[self._active] + len(record) > self.segment_size and self._segment_sizes[self._active]:
+            self._switch_active(self._roll())
+
+        offset = self._segment_sizes[self._active]
+        os.write(self._active_fd, record)
+        self._segment_sizes[self._active] = offset + len(record)
+        self._index_record(operation, key, _Location(
+            self._active, offset + _HEADER.size + len(encoded_key), len(value), len(record)
+        ))
+
+    def _index_record(self, operation: int, key: str, location: _Location) -> None:
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self._garbage += previous.record_size
+        if operation == _SAVE:
+            self._index[key] = location
+        else:
+            self._garbage += location.record_size  # a removal record is only needed until the compaction
+
+    def _compact_if_needed(self) -> None:
+        if self._garbage < _MIN_COMPACTION_GARBAGE or self.garbage_ratio() < self.compaction_threshold:
+            return
+        if not self.background_compaction:
+            self.compact()
+            return
+        if self._compaction is not None and self._compaction.is_alive():
+            return  # it'll be triggered again by a later change, if still needed
+        self._compaction = threading.Thread(target=self._compact_in_background, name='log-compaction', daemon=True)
+        self._compaction.start()
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        except Exception:
+            logger.exception(f'Compacting {self.directory.name} failed, its garbage is kept')
+
+    def _roll(self) -> int:
+        """Creates the next segment, and returns it."""
+        segment = max(self._segment_sizes, default=0) + 1
+        self._segment_path(segment).touch()
+        self._segment_sizes[segment] = 0
+        return segment
+
+    def _switch_active(self, segment: int) -> None:
+        os.close(self._active_fd)
+        self._active = segment
+        self._active_fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+
+    def _map(self, segment: int) -> mmap.mmap:
+        # the previous map (if any) is left to be released with the views into it
+        with open(self._segment_path(segment), 'rb') as segment_file:
+            segment_map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[segment] = segment_map
+        return segment_map
+
+    def _sealed_value(self, location: _Location) -> memoryview:
+        with self._lock:
+            segment_map = self._maps.get(location.segment)
+            if segment_map is None or location.offset + location.size > len(segment_map):
+                segment_map = self._map(location.segment)
+        return memoryview(segment_map)[location.offset:location.offset + location.size]
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f'{segment:08d}{_SEGMENT_SUFFIX}'
+
+    def _load(self) -> None:
+        """Replays the segments in order, the later records of a key override the earlier ones."""
+        segments = sorted(int(path.stem) for path in self.directory.glob(f'*{_SEGMENT_SUFFIX}') if path.stem.isdigit())
+        for segment in segments:
+            data = self._segment_path(segment).read_bytes()
+            offset = 0
+            while offset + _HEADER.size <= len(data):
+                crc, operation, key_size, value_size = _HEADER.unpack_from(data, offset)
+                end = offset + _HEADER.size + key_size + value_size
+                if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+                    break
+                key = data[offset + _HEADER.size:offset + _HEADER.size + key_size].decode()
+                self._index_record(operation, key, _Location(segment, end - value_size, value_size, end - offset))
+                offset = end
+            if offset < len(data):
+                # a record torn by a crash, dropped so the segment can be appended to
+                logger.warning(f'Dropping {len(data) - offset} corrupt bytes at the end of segment {segment}')
+                os.truncate(self._segment_path(segment), offset)
+            self._segment_sizes[segment] = offset
@@ -0,0 +1,297 @@
+import fcntl
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from text_similarity.vector_utils import Vector
+from .faiss_client import FaissDistanceMethod, StoredVector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
+
+_CWD = Path(__file__).parent
+
+_MAGIC = 0x4543484F4C4C4D31  # "ECHOLLM1"
+_KEY_SIZE = 64  # bytes
+_MAX_READ_WAIT = 0.05  # seconds a reader retries without locking, before it takes the write lock
+
+
+class SharedVectorClient:
+    """
+    A fixed-capacity vector DB living in a memory-mapped file, shared by every process that maps the same path.
+
+    The file holds a small header, the slots' last-access times, the (index-space) vector matrix, keys and usage flags.
+        All processes map the same pages, so there is one copy of the vectors per host, and a reader sees new entries
+        on its very next search, without reloading anything.
+
+    Writers are serialized by an inter-process lock (`flock` on a sidecar `.lock` file), and publish every change
+        through a sequence counter in the header. Readers don't lock: they retry a search if a writer was active
+        while they were reading (seqlock). A reader still retrying after `_MAX_READ_WAIT` takes the write lock and
+        searches under it instead -- if the sequence is then still odd, its writer died mid-change, and it's repaired.
+
+    It exposes FaissClient's interface, so it can back a RequestsDB as is. When the client is full, saving evicts
+        the least recently used slot, and reports it through `last_evicted`.
+    """
+
+    _HEADER_FIELDS = 8  # magic, dim, capacity, count, sequence, distance method, reserved x2
+    _DIM, _CAPACITY, _COUNT, _SEQUENCE, _METHOD = 1, 2, 3, 4, 5
+    _METHOD_CODES = {FaissDistanceMethod.COSINE: 1, FaissDistanceMethod.INNER_PRODUCT: 2, FaissDistanceMethod.L2: 3}
+
+    def __init__(
+            self,
+            distance_method: FaissDistanceMethod,
+            capacity: int,
+            path: Path = _CWD / 'resources/requests.shm',
+    ):
+        if capacity <= 0:
+            raise ValueError('capacity must be greater than 0!')
+
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.distance_method = distance_method
+        self.capacity = capacity
+        self.last_evicted: str | None = None
+
+        # flock excludes other processes only -- threads of this process share its file description
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = open(self.path.with_suffix('.lock'), 'a+b')
+
+        # lazy-initialized attributes -- the file is created by the first save, when the vectors dim is known
+        self.dim: int | None = None
+        self._mmap: np.memmap | None = None
+        self._header: np.ndarray | None = None
+        self._used: np.ndarray | None = None
+        self._keys: np.ndarray | None = None
+        self._last_access: np.ndarray | None = None
+        self._norms: np.ndarray | None = None
+        self._vectors: np.ndarray | None = None
+
+        self._attach()
+
+    @property
+    def version(self) -> int:
+        """Changes whenever any process changes the DB, lets callers tell whether previous results are still valid."""
+        if not self._attach():
+            return 0
+        return int(self._header[self._SEQUENCE])
+
+    @contextmanager
+    def lock(self):
+        """Exclusive, re-entrant, inter-process write lock."""
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def fetch_nearest_k(self, vector: Vector, k: int = 100) -> list[StoredVector]:
+        if k <= 0:
+            raise ValueError('k must be greater than 0!')
+        if not self._attach():
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        if self.distance_method == FaissDistanceMethod.COSINE:
+            norm = float(np.linalg.norm(query))
+            query = query / norm if norm != 0.0 else query
+
+        deadline = time.monotonic() + _MAX_READ_WAIT
+        while time.monotonic() < deadline:
+            sequence = int(self._header[self._SEQUENCE])
+            if sequence % 2:  # a writer is in the middle of a change
+                time.sleep(0)
+                continue
+            results = self._search(query, k)
+            if int(self._header[self._SEQUENCE]) == sequence:
+                return results
+
+        # a writer is slow, or died mid-change -- no writer is active once the lock is taken
+        with self.lock():
+            if int(self._header[self._SEQUENCE]) % 2:
+                logger.warning(f'A writer of {self.path} died mid-change, the slot it was changing may be corrupt')
+                self._header[self._SEQUENCE] += 1
+                self._mmap.flush()
+            return self._search(query, k)
+
+    def save(self, vector: Vector, key: str) -> str:
+        with self.lock():
+            self.last_evicted = None
+            arr = np.asarray(vector, dtype=np.float32)
+            self._attach(create_dim=int(arr.size))
+            if arr.size != self.dim:
+                raise ValueError(f'Vector dim {arr.size} != index dim {self.dim}')
+            if self._slot_of(key) is not None:
+                return key
+
+            norm = None
+            if self.distance_method == FaissDistanceMethod.COSINE:
+                norm = float(np.linalg.norm(arr))
+                arr = arr / norm if norm != 0.0 else arr
+
+            free_slots = np.flatnonzero(self._used == 0)
+            if free_slots.size:
+                slot = int(free_slots[0])
+            else:
+                slot = int(np.argmin(self._last_access))  # all slots are in use
+                self.last_evicted = self._decode_key(self._keys[slot])
+
+            with self._write():
+                self._vectors[slot] = arr
+                self._norms[slot] = norm if norm is not None else np.nan
+                self._keys[slot] = self._encode_key(key)
+                self._last_access[slot] = time.time()
+                if not self._used[slot]:
+                    self._used[slot] = 1
+                    self._header[self._COUNT] += 1
+            return key
+
+    def remove(self, key: str) -> bool:
+        with self.lock():
+            if not self._attach():
+                return False
+            slot = self._slot_of(key)
+            if slot is None:
+                return False
+            with self._write():
+                self._used[slot] = 0
+                self._header[self._COUNT] -= 1
+            return True
+
+    def touch(self, key: str) -> None:
+        """Marks a key as just used. A single unlocked store -- racing touches only blur LRU order a bit."""
+        if not self._attach():
+            return
+        slot = self._slot_of(key)
+        if slot is not None:
+            self._last_access[slot] = time.time()
+
+    def contains(self, key: str) -> bool:
+        return self._attach() and self._slot_of(key) is not None
+
+    def size(self) -> int:
+        if not self._attach():
+            return 0
+        return int(self._header[self._COUNT])
+
+    def close(self) -> None:
+        self._lock_file.close()
+
+    @contextmanager
+    def _write(self):
+        # odd sequence -> readers back off until the change is complete
+        self._header[self._SEQUENCE] += 1
+        try:
+            yield
+        finally:
+            self._header[self._SEQUENCE] += 1
+            self._mmap.flush()
+
+    def _search(self, query: np.ndarray, k: int) -> list[StoredVector]:
+        slots = np.flatnonzero(self._used)
+        if slots.size == 0:
+            return []
+        vectors = self._vectors[slots]
+        if self.distance_method == FaissDistanceMethod.L2:
+            scores = np.einsum('ij,ij->i', vectors, vectors) - 2 * (vectors @ query)  # ||x-q||^2 - ||q||^2
+        else:
+            scores = -(vectors @ query)  # higher inner product is nearer
+        k_eff = min(k, slots.size)
+        nearest = np.argpartition(scores, k_eff - 1)[:k_eff]
+        nearest = nearest[np.argsort(scores[nearest])]
+        return [
+            StoredVector(key=self._decode_key(self._keys[slots[i]]), vector=self._original_vector(slots[i]))
+            for i in nearest
+        ]
+
+    def _slot_of(self, key: str) -> int | None:
+        matches = np.flatnonzero((self._keys == self._encode_key(key)) & (self._used == 1))
+        return int(matches[0]) if matches.size else None
+
+    def _original_vector(self, slot: int) -> np.ndarray:
+        """Convert stored index-space vector back to raw/original space (undo normalization, for Cosine case)."""
+        vector = self._vectors[slot]
+        norm = self._norms[slot]
+        if not np.isnan(norm) and norm != 0.0:
+            return vector * norm
+        return vector.copy()  # not a view of the shared mapping, a writer may reuse its slot
+
+    def _attach(self, create_dim: int | None = None) -> bool:
+        """Maps the shared file if not mapped yet, creating it (under the write lock) if `create_dim` is given."""
+        if self._mmap is not None:
+            return True
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            if create_dim is None:
+                return False
+            self._create(create_dim)
+
+        header = np.memmap(self.path, dtype=np.int64, mode='r', shape=(self._HEADER_FIELDS,))
+        if int(header[0]) != _MAGIC:
+            raise ValueError(f'{self.path} is not a shared vectors file.')
+        dim, capacity, method = int(header[self._DIM]), int(header[self._CAPACITY]), int(header[self._METHOD])
+        del header
+        if method != self._METHOD_CODES[self.distance_method]:
+            raise ValueError(f'Shared vectors at {self.path} were created with a different distance method.')
+        if capacity != self.capacity:
+            raise ValueError(f'Shared vectors at {self.path} were created with capacity {capacity} != {self.capacity}.')
+
+        self.dim = dim
+        self._mmap = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        offset = 0
+
+        def view(dtype, shape):
+            nonlocal offset
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            arr = self._mmap[offset:offset + size].view(dtype).reshape(shape)
+            offset += size
+            return arr
+
+        # widest items first, so every array stays aligned
+        self._header = view(np.int64, (self._HEADER_FIELDS,))
+        self._last_access = view(np.float64, (capacity,))
+        self._vectors = view(np.float32, (capacity, dim))
+        self._norms = view(np.float32, (capacity,))
+        self._keys = view(f'S{_KEY_SIZE}', (capacity,))
+        self._used = view(np.uint8, (capacity,))
+        return True
+
+    def _create(self, dim: int) -> None:
+        with self.lock():
+            if self.path.exists() and self.path.stat().st_size > 0:
+                return  # another process created it meanwhile
+            size = (
+                    self._HEADER_FIELDS * 8
+                    + self.capacity * (8 + dim * 4 + 4 + _KEY_SIZE + 1)
+            )
+            tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.truncate(size)
+            header = np.memmap(tmp_path, dtype=np.int64, mode='r+', shape=(self._HEADER_FIELDS,))
+            header[:] = [_MAGIC, dim, self.capacity, 0, 0, self._METHOD_CODES[self.distance_method], 0, 0]
+            header.flush()
+            del header
+            tmp_path.replace(self.path)
+
+    @staticmethod
+    def _encode_key(key: str) -> bytes:
+        encoded = key.encode()
+        if len(encoded) > _KEY_SIZE:
+            raise ValueError(f'Keys are limited to {_KEY_SIZE} bytes.')
+        return encoded
+
+    @staticmethod
+    def _decode_key(raw_key: bytes) -> str:
+        return bytes(raw_key).decode()
+
+    def __del__(self):
+        if getattr(self, '_lock_file', None) is not None:
+            self._lock_file.close()
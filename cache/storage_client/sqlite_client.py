@@ -17,7 +17,8 @@ class SQLiteClient:
         self._connection = self.create_connection()
 
     def create_connection(self) -> Connection:
-        return sqlite3.connect(self._db_file)
+        # the connection may be handed over to another thread (e.g. a server's worker), callers serialize its use
+        return sqlite3.connect(self._db_file, check_same_thread=False)
 
     def disconnect(self):
         if self._connection is not None:
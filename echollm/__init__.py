@@ -1,2 +1,3 @@
-from .echollm import EchoLLM
+from .echollm import EchoLLM, FallbackResponse
+from .errors import DeadlineExceededError
 from .prefix_echollm import PrefixEchoLLM
@@ -1,37 +1,278 @@
 import logging
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Optional, Iterator
 
 from cache import ICache
+from cache.namespaced_similarity_cache import Namespace
 from llm import ILLM, LLMResponse
+from .errors import DeadlineExceededError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('EchoLLM')
 
 
+class FallbackResponse(str):
+    """A cached neighbour's response, served because the LLM missed the request's deadline."""
+    is_fallback = True
+
+    def __new__(cls, response: str, distance: float):
+        fallback_response = super().__new__(cls, response)
+        fallback_response.distance = distance
+        return fallback_response
+
+
 class EchoLLM:
-    def __init__(self, cache: Optional[ICache], llm: ILLM):
+    def __init__(
+            self,
+            cache: Optional[ICache],
+            llm: ILLM,
+            fallback_distance_threshold: float | None = None,
+            max_background_requests: int = 8,
+            max_concurrent_refreshes: int = 2,
+            outcome_listener: Callable[[str], None] | None = None,
+    ):
+        """
+        :param fallback_distance_threshold: How far a cached neighbour may be to be served as a fallback when the LLM
+            misses an `ask` deadline -- usually looser than the cache's hit threshold. None disables fallbacks.
+        :param max_background_requests: The amount of LLM requests past their deadline whose responses are still
+            cached once they arrive. Requests missing their deadline while it's reached aren't cached.
+        :param max_concurrent_refreshes: The amount of stale hot entries (see `RefreshPolicy`) refreshed at once.
+            Stale hits found while it's reached are served without being refreshed.
+        :param outcome_listener: Called on the asking thread with how each request is served, 'hit' or 'miss' (the
+            LLM is asked), e.g. to measure the hit ratio.
+        """
         self._cache = cache
         self._llm = llm
+        self._fallback_distance_threshold = fallback_distance_threshold
+        self._max_background_requests = max_background_requests
+        self._background_slots = threading.BoundedSemaphore(max_background_requests)
+        self._cache_lock = threading.RLock()  # LLM requests past their deadline populate the cache in the background
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_refreshes, thread_name_prefix='echollm-refresh'
+        )
+        self._max_concurrent_refreshes = max_concurrent_refreshes
+        # (namespace, request key) of the entries being refreshed, so a popular entry is refreshed only once
+        self._refreshing: set[tuple[str, Any]] = set()
+        self.outcome_listener = outcome_listener
 
         if cache is None:
             logger.info('No Cache -- Asking LLM')
         else:
             logger.info(f'Initiated Cache - `{self._cache.policy_name}`')
 
-    def ask(self, prompt: str, force_llm: bool = False) -> str:
+    def ask(
+            self,
+            prompt: str,
+            force_llm: bool = False,
+            deadline: float | None = None,
+            tenant: str | None = None,
+            **llm_kwargs,
+    ) -> str:
+        """
+        :param deadline: How long (ms) to wait for the LLM on a miss. Past it, the nearest cached response within
+            `fallback_distance_threshold` is returned as a `FallbackResponse`, while the LLM request completes in the
+            background and populates the cache. Raises `DeadlineExceededError` if no cached response is close enough.
+        :param tenant: Together with the LLM's model and options, the namespace the response is cached in and looked up
+            from (see `Namespace`).
+        :param llm_kwargs: Passed on to the LLM on a miss, e.g. `priority` for an `LLMDispatcher`.
+        """
         if self._cache is None or force_llm:
-            return self._ask_llm(prompt).response
+            self._notify('miss')
+            return self._ask_llm(prompt, **llm_kwargs).response
 
-        if self._cache.is_hit(prompt):
-            logger.info('Cache Hit', extra={'prompt': prompt})
-            return self._cache.on_hit(prompt)
+        namespace = self._namespace(tenant)
+        with self._cache_lock:
+            response = self._cached_response(prompt, namespace)
+            if response is not None:
+                self._notify('hit')
+                self._refresh_if_stale(prompt, namespace, llm_kwargs)
+                return response
+        logger.info('Cache Miss', extra={'prompt': prompt})
+        self._notify('miss')
+        if deadline is None:
+            return self._ask_and_cache(prompt, namespace, **llm_kwargs)
+
+        # every request gets its own thread, so the deadline runs from the LLM call's start, not from a queue
+        llm_request = Future()
+        threading.Thread(
+            target=self._run_llm_request, args=(llm_request, prompt, llm_kwargs), name='echollm', daemon=True
+        ).start()
+        try:
+            llm_response = llm_request.result(timeout=deadline / 1000)
+        except FutureTimeoutError:
+            self._cache_in_background(llm_request, prompt, namespace)
         else:
-            logger.info('Cache Miss', extra={'prompt': prompt})
-            llm_response = self._ask_llm(prompt)
-            self._cache.on_miss(prompt, llm_response.response, llm_latency=llm_response.latency)
+            self._cache_llm_response(prompt, namespace, llm_response)
             return llm_response.response
+        fallback = self._fallback(prompt, namespace)
+        if fallback is None:
+            raise DeadlineExceededError(deadline)
+        logger.info(f'LLM missed the {deadline:.0f}ms deadline -- serving a fallback', extra={'prompt': prompt})
+        return fallback
+
+    def stream_ask(
+            self,
+            prompt: str,
+            force_llm: bool = False,
+            chunk_size: int = 256,
+            tenant: str | None = None,
+            **llm_kwargs,
+    ) -> Iterator[str]:
+        """
+        Streams the response: a hit is served right away as chunks of `chunk_size` characters, and a miss streams
+            the LLM's chunks as they arrive, inserting the full response into the cache once the stream completes.
+            A stream abandoned (closed) before completing stops the LLM stream and isn't cached.
+        """
+        if self._cache is None or force_llm:
+            self._notify('miss')
+            return self._stream_ask_llm(prompt, **llm_kwargs)
+
+        namespace = self._namespace(tenant)
+        with self._cache_lock:
+            response = self._cached_response(prompt, namespace)
+            if response is not None:
+                self._notify('hit')
+                self._refresh_if_stale(prompt, namespace, llm_kwargs)
+                return self._chunked(response, chunk_size)
+        logger.info('Cache Miss', extra={'prompt': prompt})
+        self._notify('miss')
+        return self._stream_ask_llm(prompt, is_on_miss_event=True, namespace=namespace, **llm_kwargs)
+
+    def _cached_response(self, prompt: str, namespace: str) -> str | None:
+        """The response a prompt hits, None on a miss."""
+        if not self._cache.is_hit(prompt, namespace=namespace):
+            return None
+        try:
+            response = self._cache.on_hit(prompt, namespace=namespace)
+        except KeyError:
+            # evicted since `is_hit` by another process sharing the cache
+            return None
+        logger.info('Cache Hit', extra={'prompt': prompt})
+        return response
+
+    def _notify(self, outcome: str) -> None:
+        if self.outcome_listener is not None:
+            self.outcome_listener(outcome)
+
+    def _namespace(self, tenant: str | None) -> str:
+        return Namespace(model=self._llm.model_name, options=self._llm.options, tenant=tenant).key
+
+    def _ask_and_cache(self, prompt: str, namespace: str, **llm_kwargs) -> str:
+        llm_response = self._ask_llm(prompt, **llm_kwargs)
+        self._cache_llm_response(prompt, namespace, llm_response)
+        return llm_response.response
+
+    def _cache_llm_response(self, prompt: str, namespace: str, llm_response: LLMResponse) -> None:
+        with self._cache_lock:
+            self._cache.on_miss(
+                prompt, llm_response.response, llm_latency=llm_response.latency, namespace=namespace
+            )
 
-    def _ask_llm(self, prompt: str) -> LLMResponse:
-        llm_response = self._llm.ask(prompt)
+    def _run_llm_request(self, llm_request: Future, prompt: str, llm_kwargs: dict[str, Any]) -> None:
+        if not llm_request.set_running_or_notify_cancel():
+            return
+        try:
+            llm_request.set_result(self._ask_llm(prompt, **llm_kwargs))
+        except Exception as e:
+            llm_request.set_exception(e)
+
+    def _cache_in_background(self, llm_request: Future, prompt: str, namespace: str) -> None:
+        """Caches the response of a request past its deadline once it arrives, if a background slot is free."""
+        if not self._background_slots.acquire(blocking=False):
+            logger.warning(
+                f'{self._max_background_requests} LLM requests past their deadline are already pending -- '
+                f'this one won\'t be cached', extra={'prompt': prompt}
+            )
+            return
+
+        def cache_response(done_request: Future) -> None:
+            try:
+                if done_request.exception() is not None:
+                    self._log_background_failure(done_request)
+                else:
+                    self._cache_llm_response(prompt, namespace, done_request.result())
+            except Exception:
+                logger.exception('Caching a background LLM response failed')
+            finally:
+                self._background_slots.release()
+
+        llm_request.add_done_callback(cache_response)
+
+    def _fallback(self, prompt: str, namespace: str) -> FallbackResponse | None:
+        if self._fallback_distance_threshold is None:
+            return None
+        with self._cache_lock:
+            nearest_response = self._cache.nearest_response(
+                prompt, self._fallback_distance_threshold, namespace=namespace
+            )
+        if nearest_response is None:
+            return None
+        response, distance = nearest_response
+        return FallbackResponse(response, distance)
+
+    def _refresh_if_stale(self, prompt: str, namespace: str, llm_kwargs: dict[str, Any]) -> None:
+        """
+        Refreshes the hit's entry in the background if it's due, the cached response is served meanwhile. The entry's
+            own prompt is asked again (not the hit prompt, which may be a paraphrase), with the hit's LLM kwargs.
+        """
+        with self._cache_lock:
+            request_key = self._cache.stale_request(prompt, namespace=namespace)
+            if (request_key is None or (namespace, request_key) in self._refreshing
+                    or len(self._refreshing) >= self._max_concurrent_refreshes):
+                return
+            request_prompt = self._cache.request_prompt(request_key, namespace=namespace)
+            if request_prompt is None:
+                return  # e.g. stored before prompts were kept -- it expires by eviction only
+            self._refreshing.add((namespace, request_key))
+        logger.info('Refreshing a stale cache entry', extra={'prompt': request_prompt})
+        self._refresh_executor.submit(
+            self._refresh, request_prompt, request_key, namespace, llm_kwargs
+        ).add_done_callback(self._log_background_failure)
+
+    def _refresh(self, prompt: str, request_key: Any, namespace: str, llm_kwargs: dict[str, Any]) -> None:
+        try:
+            llm_response = self._ask_llm(prompt, **llm_kwargs)
+            with self._cache_lock:
+                self._cache.refresh(request_key, llm_response.response, namespace=namespace)
+        finally:
+            with self._cache_lock:
+                self._refreshing.discard((namespace, request_key))
+
+    @staticmethod
+    def _log_background_failure(llm_request: Future) -> None:
+        if llm_request.exception() is not None:
+            logger.error('Background LLM request failed', exc_info=llm_request.exception())
+
+    def _ask_llm(self, prompt: str, **llm_kwargs) -> LLMResponse:
+        llm_response = self._llm.ask(prompt, **llm_kwargs)
         logger.info(f'LLM response took {llm_response.latency:.2f}ms')
         return llm_response
+
+    def _stream_ask_llm(
+            self, prompt: str, is_on_miss_event: bool = False, namespace: str | None = None, **llm_kwargs
+    ) -> Iterator[str]:
+        llm_stream = self._llm.stream_ask(prompt, **llm_kwargs)
+        chunk, response_chunks, completed = None, [], False
+        try:
+            for chunk in llm_stream:
+                if chunk.is_first:
+                    logger.info(f'LLM first token response took {chunk.delay:.2f}ms')
+                response_chunks.append(chunk.response_chunk)
+                yield chunk.response_chunk
+            completed = True
+        finally:
+            if not completed and hasattr(llm_stream, 'close'):
+                llm_stream.close()  # the caller abandoned the stream -- stop generating
+        if chunk is None:
+            return
+        logger.info(f'LLM full response took {chunk.delay:.2f}ms')
+
+        if is_on_miss_event:
+            with self._cache_lock:
+                self._cache.on_miss(prompt, ''.join(response_chunks), llm_latency=chunk.delay, namespace=namespace)
+
+    @staticmethod
+    def _chunked(response: str, chunk_size: int) -> Iterator[str]:
+        for i in range(0, len(response), chunk_size):
+            yield response[i:i + chunk_size]
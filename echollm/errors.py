@@ -0,0 +1,5 @@
+class DeadlineExceededError(TimeoutError):
+    def __init__(self, deadline: float):
+        super().__init__(
+            f'LLM did not respond within the {deadline:.0f}ms deadline, and no cached fallback is close enough'
+        )
@@ -1,12 +1,13 @@
 import logging
-from itertools import chain
+import threading
 from pathlib import Path
-from typing import Optional, Iterator
+from typing import Callable, Optional, Iterator
 
 from jinja2 import Template
 
 from cache.prefix_based.prefix_similarity_cache import IPrefixSimilarityCache
 from llm import ILLM
+from llm.streaming import PrefetchedStream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('EchoLLM')
@@ -15,9 +16,20 @@ _CWD = Path(__file__).parent
 
 
 class PrefixEchoLLM:
-    def __init__(self, cache: Optional[IPrefixSimilarityCache], llm: ILLM):
+    def __init__(
+            self,
+            cache: Optional[IPrefixSimilarityCache],
+            llm: ILLM,
+            outcome_listener: Callable[[str], None] | None = None,
+    ):
+        """
+        :param outcome_listener: Called on the asking thread with how each request is served: 'hit' (the whole cached
+            response), 'prefix_hit' (a cached prefix, continued by the LLM) or 'miss'.
+        """
         self._cache = cache
         self._llm = llm
+        self._cache_lock = threading.RLock()  # the continuation of a hit is streamed, and tracked, on another thread
+        self.outcome_listener = outcome_listener
 
         if cache is None:
             logger.info('No Cache -- Asking LLM')
@@ -26,40 +38,83 @@ class PrefixEchoLLM:
 
     def stream_ask(self, prompt: str, force_llm: bool = False) -> Iterator[str]:
         if self._cache is None or force_llm:
+            self._notify('miss')
             return self._stream_ask_llm(prompt)
 
-        if self._cache.is_hit(prompt):
+        with self._cache_lock:
+            hit = self._cache.lookup(prompt)
+            if hit is None:
+                logger.info('Cache Miss', extra={'prompt': prompt})
+                self._notify('miss')
+                return self._stream_ask_llm(prompt, is_on_miss_event=True)
+
+            # resolved once, the continuation's stats are tracked for the item the prefix is served from
+            hit_request_key, distance = hit
+            if self._cache.is_full_hit(prompt, distance):
+                logger.info('Cache Full Hit', extra={'prompt': prompt})
+                self._notify('hit')
+                return iter([self._cache.on_hit(prompt, request_key=hit_request_key, retrieve_only=True, full=True)])
+
             logger.info('Cache Hit', extra={'prompt': prompt})
-            # query the cache and ask the llm simultaneously
-            prefix_response = self._cache.on_hit(prompt, retrieve_only=True)
-            prefix_prompt = Template(
-                (_CWD.parent / 'cache' / 'prefix_based' / 'prompt_template.j2').read_text()
-            ).render(prompt=prompt, prefix=prefix_response)
-            llm_stream = self._stream_ask_llm(prefix_prompt, False, True)
-            return chain([prefix_response], llm_stream)
-        else:
-            logger.info('Cache Miss', extra={'prompt': prompt})
-            return self._stream_ask_llm(prompt, True, False)
+            self._notify('prefix_hit')
+            prefix_response = self._cache.on_hit(
+                prompt, request_key=hit_request_key, retrieve_only=True, llm_model=self._llm.model_name
+            )
+
+        # query the cache and ask the llm simultaneously
+        prefix_prompt = Template(
+            (_CWD.parent / 'cache' / 'prefix_based' / 'prompt_template.j2').read_text()
+        ).render(prompt=prompt, prefix=prefix_response)
+        # the continuation request is sent right away, while the caller is still consuming the prefix
+        llm_stream = PrefetchedStream(self._stream_ask_llm(prefix_prompt, hit_request_key=hit_request_key))
+        return self._serve_prefix(prefix_response, llm_stream)
+
+    def _notify(self, outcome: str) -> None:
+        if self.outcome_listener is not None:
+            self.outcome_listener(outcome)
+
+    @staticmethod
+    def _serve_prefix(prefix_response: str, llm_stream: PrefetchedStream[str]) -> Iterator[str]:
+        try:
+            yield prefix_response
+            yield from llm_stream
+        finally:
+            llm_stream.close()  # stop consuming the continuation if the caller abandoned the stream
 
     def _stream_ask_llm(
-            self, prompt: str, is_on_miss_event: bool = False, should_update_item_stats: bool = True
+            self, prompt: str, is_on_miss_event: bool = False, hit_request_key: str | None = None
     ) -> Iterator[str]:
-        if is_on_miss_event and should_update_item_stats:
-            raise ValueError(
-                '`is_on_miss` and `should_update_item_stats` are mutually exclusive! (on_miss already update item stats)'
-            )
+        """
+        :param is_on_miss_event: Inserts the full response into the cache once the stream completes.
+        :param hit_request_key: The key of the cached item whose prefix `prompt` asks the continuation of.
+            The continuation's first token delay is then tracked for that item.
+        """
+        if is_on_miss_event and hit_request_key is not None:
+            raise ValueError('`is_on_miss_event` and `hit_request_key` are mutually exclusive!')
 
         llm_stream = self._llm.stream_ask(prompt)
-        chunk, full_response, llm_delay = None, '', None
+        chunk, response_chunks, llm_delay = None, [], None
         for chunk in llm_stream:
             if chunk.is_first:
                 llm_delay = chunk.delay
                 logger.info(f'LLM first token response took {llm_delay:.2f}ms')
-                if self._cache and should_update_item_stats:
-                    self._cache.update_item_stats(prompt, llm_delay=chunk.delay)
-            full_response += chunk.response_chunk
+                if self._cache and hit_request_key is not None:
+                    with self._cache_lock:
+                        if hit_request_key in self._cache.itemwise_stats:  # else evicted meanwhile
+                            self._cache.update_item_stats(hit_request_key, llm_delay=chunk.delay)
+            response_chunks.append(chunk.response_chunk)
             yield chunk.response_chunk
+        if chunk is None:
+            return
         logger.info(f'LLM full response took {chunk.delay:.2f}ms')
 
-        if is_on_miss_event:
-            self._cache.on_miss(prompt, full_response, llm_delay=llm_delay)
+        if self._cache:
+            with self._cache_lock:
+                # the streaming rate, after the first token, sizes the prefixes
+                self._cache.update_throughput_stats(
+                    self._llm.model_name, sum(len(c) for c in response_chunks[1:]), chunk.delay - llm_delay
+                )
+                if is_on_miss_event:
+                    self._cache.on_miss(
+                        prompt, ''.join(response_chunks), llm_delay=llm_delay, llm_model=self._llm.model_name
+                    )
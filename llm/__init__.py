@@ -1,2 +1,20 @@
+from .dispatcher import LLMDispatcher, OverloadPolicy, DispatcherMetrics
+from .errors import LLMOverloadedError
+from .hedged_llm import HedgedLLM
 from .illm import ILLM, LLMResponse
-from .ollama_llm import Ollama
+
+_LAZY_EXPORTS = {
+    'Ollama': ('.ollama_llm', 'Ollama'),
+    'ChatGPT': ('.chatgpt_llm', 'ChatGPT'),
+}
+
+
+def __getattr__(name: str):
+    # backends are imported at first use, so importing `llm` doesn't import every backend's client library
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    import importlib
+    module_name, attribute = _LAZY_EXPORTS[name]
+    value = getattr(importlib.import_module(module_name, __name__), attribute)
+    globals()[name] = value
+    return value
@@ -4,6 +4,7 @@ from typing import Any, Iterator, Optional
 from openai import OpenAI, BaseModel
 from openai.types import ChatModel
 
+from transport import SharedTransport, default_transport
 from .illm import ILLM, LLMResponse, LLMResponseChunk
 
 
@@ -35,11 +36,22 @@ class ChatGPT(ILLM):
             api_key: str,
             base_url: str,
             options: dict[str, Any] | None = None,
+            transport: SharedTransport | None = None,
     ):
-        self._client = OpenAI(api_key=api_key, base_url=base_url)
+        """:param transport: The connection pool to send requests through. Defaults to the process-wide one."""
+        transport = transport or default_transport()
+        self._client = OpenAI(api_key=api_key, base_url=base_url, http_client=transport.client())
         self._model = model
         self._options = options or {}
 
+    @property
+    def model_name(self) -> str:
+        return str(self._model)
+
+    @property
+    def options(self) -> dict[str, Any]:
+        return dict(self._options)
+
     def ask(self, prompt: str) -> ChatGPTResponse:
         start_time = time.perf_counter()
         response = self._client.chat.completions.create(
@@ -69,11 +81,13 @@ class ChatGPT(ILLM):
         for i, chunk in enumerate(stream, start=1):
             prompt_tokens = chunk.usage.prompt_tokens if chunk.usage else None
             response_tokens = chunk.usage.completion_tokens if chunk.usage else None
-            chunk_response = chunk.choices[0].delta.content
+            # the last (usage) chunk has no choices, and role/finish chunks have no content
+            chunk_response = (chunk.choices[0].delta.content if chunk.choices else None) or ''
             current_time = time.perf_counter()
 
             yield ChatGPTResponseChunk(
                 response_chunk=chunk_response,
+                chunk_number=i,
                 delay=(current_time - start_time) * 1000,
                 prompt_tokens=prompt_tokens,
                 response_tokens=response_tokens,
@@ -0,0 +1,234 @@
+import heapq
+import itertools
+import threading
+import time
+from enum import StrEnum
+from typing import Any, Iterator
+
+from pydantic import BaseModel
+
+from .errors import LLMOverloadedError
+from .illm import ILLM, LLMResponse, LLMResponseChunk
+
+_CHARS_PER_TOKEN = 4  # a rough estimate, corrected once the response reports its actual token counts
+
+
+class OverloadPolicy(StrEnum):
+    FAIL_FAST = 'fail_fast'  # a full queue rejects the new request
+    SHED_LOAD = 'shed_load'  # a full queue drops its lowest priority request, if it's lower than the new one
+
+
+class DispatcherMetrics(BaseModel):
+    queue_depth: int = 0
+    peak_queue_depth: int = 0
+    in_flight: int = 0
+    dispatched: int = 0
+    rejected: int = 0  # turned away on arrival (full queue)
+    shed: int = 0  # dropped from the queue for a higher priority request
+    timed_out: int = 0  # waited longer than `max_queue_wait`
+    total_queue_wait: float = 0  # ms
+
+    @property
+    def mean_queue_wait(self) -> float:
+        return self.total_queue_wait / self.dispatched if self.dispatched else 0.0
+
+
+class TokenBucket:
+    """Allows `per_minute` units per minute, in bursts of up to a minute's worth. Not thread-safe."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self._refill_rate = per_minute / 60  # units per second
+        self._tokens = per_minute
+        self._last_refill = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they already are)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self._tokens
+        return max(missing, 0) / self._refill_rate
+
+    def take(self, amount: float) -> None:
+        """Takes units, possibly going into debt (which delays the next requests)."""
+        self._refill()
+        self._tokens -= amount
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self._refill_rate)
+        self._last_refill = now
+
+
+class _Ticket:
+    def __init__(self, priority: int, sequence: int, estimated_tokens: int):
+        self.priority = priority
+        self.sequence = sequence
+        self.estimated_tokens = estimated_tokens
+        self.enqueued_at = time.perf_counter()
+        self.shed = False
+
+    def __lt__(self, other: '_Ticket') -> bool:
+        # higher priority first, then first come first served
+        return (-self.priority, self.sequence) < (-other.priority, other.sequence)
+
+
+class LLMDispatcher(ILLM):
+    """
+    Sits between EchoLLM and an LLM backend, and admits requests to it: at most `max_concurrency` at a time, within
+        the requests and tokens per minute limits, highest priority first. Requests which can't be admitted yet wait in
+        a bounded queue, and when it's full the dispatcher fails fast or sheds the lowest priority requests.
+
+    Usage:
+        llm = LLMDispatcher(ChatGPT(...), max_concurrency=8, requests_per_minute=500, tokens_per_minute=200_000)
+        echo_llm = EchoLLM(cache, llm)
+        echo_llm.ask(prompt, priority=10)  # kwargs are passed on to the dispatcher
+    """
+
+    def __init__(
+            self,
+            llm: ILLM,
+            max_concurrency: int = 4,
+            requests_per_minute: float | None = None,
+            tokens_per_minute: float | None = None,
+            max_queue_size: int = 100,
+            overload_policy: OverloadPolicy = OverloadPolicy.FAIL_FAST,
+            max_queue_wait: float | None = None,
+            estimated_response_tokens: int = 256,
+    ):
+        """
+        :param tokens_per_minute: Requests are charged an estimate of their tokens up front (the prompt's length and
+            `estimated_response_tokens`), corrected by the tokens the response reports (e.g. `ChatGPTResponse`).
+        :param max_queue_wait: Seconds a request may wait in the queue before failing. Unbounded if None.
+        """
+        if max_concurrency <= 0:
+            raise ValueError('max_concurrency must be greater than 0!')
+        self._llm = llm
+        self._max_concurrency = max_concurrency
+        self._requests_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._max_queue_size = max_queue_size
+        self._overload_policy = overload_policy
+        self._max_queue_wait = max_queue_wait
+        self._estimated_response_tokens = estimated_response_tokens
+
+        self._condition = threading.Condition()
+        self._queue: list[_Ticket] = []
+        self._sequence = itertools.count()
+        self._metrics = DispatcherMetrics()
+
+    @property
+    def model_name(self) -> str:
+        return self._llm.model_name
+
+    @property
+    def options(self) -> dict[str, Any]:
+        return self._llm.options
+
+    def metrics(self) -> DispatcherMetrics:
+        with self._condition:
+            return self._metrics.model_copy()
+
+    def ask(self, prompt: str, priority: int = 0, **kwargs) -> LLMResponse:
+        ticket = self._acquire(prompt, priority)
+        try:
+            response = self._llm.ask(prompt, **kwargs)
+        finally:
+            self._release()
+        # token counts are reported by some backends only, e.g. `ChatGPTResponse`
+        self._settle_tokens(
+            ticket, getattr(response, 'prompt_tokens', None), getattr(response, 'response_tokens', None)
+        )
+        return response
+
+    def stream_ask(self, prompt: str, priority: int = 0, **kwargs) -> Iterator[LLMResponseChunk]:
+        # admitted when first iterated (like the backends' streams, which send the request then), so a stream that's
+        #   never iterated doesn't hold a slot
+        ticket = self._acquire(prompt, priority)
+        prompt_tokens = response_tokens = None
+        try:
+            for chunk in self._llm.stream_ask(prompt, **kwargs):
+                # token counts are only reported by (some backends') last chunk
+                prompt_tokens = getattr(chunk, 'prompt_tokens', None) or prompt_tokens
+                response_tokens = getattr(chunk, 'response_tokens', None) or response_tokens
+                yield chunk
+        finally:
+            self._release()
+            self._settle_tokens(ticket, prompt_tokens, response_tokens)
+
+    def _acquire(self, prompt: str, priority: int) -> _Ticket:
+        estimated_tokens = len(prompt) // _CHARS_PER_TOKEN + self._estimated_response_tokens
+        with self._condition:
+            ticket = _Ticket(priority, next(self._sequence), estimated_tokens)
+            self._enqueue(ticket)
+            deadline = None if self._max_queue_wait is None else time.monotonic() + self._max_queue_wait
+            while True:
+                if ticket.shed:
+                    raise LLMOverloadedError('request was shed for a higher priority one')
+                wait_time = self._admission_wait_time(ticket)
+                if wait_time == 0:
+                    self._admit(ticket)
+                    return ticket
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._dequeue(ticket)
+                        self._metrics.timed_out += 1
+                        raise LLMOverloadedError(f'request waited more than {self._max_queue_wait}s in the queue')
+                    wait_time = remaining if wait_time is None else min(wait_time, remaining)
+                self._condition.wait(wait_time)
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        if len(self._queue) >= self._max_queue_size:
+            lowest = max(self._queue) if self._queue else None  # the last to be served
+            if self._overload_policy == OverloadPolicy.SHED_LOAD and lowest is not None and ticket < lowest:
+                self._dequeue(lowest)
+                lowest.shed = True
+                self._metrics.shed += 1
+                self._condition.notify_all()
+            else:
+                self._metrics.rejected += 1
+                raise LLMOverloadedError(f'{len(self._queue)} requests are already queued')
+        heapq.heappush(self._queue, ticket)
+        self._metrics.queue_depth = len(self._queue)
+        self._metrics.peak_queue_depth = max(self._metrics.peak_queue_depth, len(self._queue))
+
+    def _dequeue(self, ticket: _Ticket) -> None:
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._metrics.queue_depth = len(self._queue)
+
+    def _admission_wait_time(self, ticket: _Ticket) -> float | None:
+        """0 if the ticket can be admitted now, else seconds until it might be (None -- until notified)."""
+        if self._queue[0] is not ticket or self._metrics.in_flight >= self._max_concurrency:
+            return None
+        wait_time = 0.0
+        if self._requests_bucket is not None:
+            wait_time = max(wait_time, self._requests_bucket.wait_time(1))
+        if self._tokens_bucket is not None:
+            wait_time = max(wait_time, self._tokens_bucket.wait_time(ticket.estimated_tokens))
+        return wait_time
+
+    def _admit(self, ticket: _Ticket) -> None:
+        heapq.heappop(self._queue)
+        if self._requests_bucket is not None:
+            self._requests_bucket.take(1)
+        if self._tokens_bucket is not None:
+            self._tokens_bucket.take(ticket.estimated_tokens)
+        self._metrics.queue_depth = len(self._queue)
+        self._metrics.in_flight += 1
+        self._metrics.dispatched += 1
+        self._metrics.total_queue_wait += (time.perf_counter() - ticket.enqueued_at) * 1000
+        self._condition.notify_all()  # the next request may be admitted too
+
+    def _release(self) -> None:
+        with self._condition:
+            self._metrics.in_flight -= 1
+            self._condition.notify_all()
+
+    def _settle_tokens(self, ticket: _Ticket, prompt_tokens: int | None, response_tokens: int | None) -> None:
+        """Corrects the up-front estimate with the tokens the backend reported, if it did."""
+        if self._tokens_bucket is None or prompt_tokens is None or response_tokens is None:
+            return
+        with self._condition:
+            self._tokens_bucket.take(prompt_tokens + response_tokens - ticket.estimated_tokens)
+            self._condition.notify_all()
@@ -0,0 +1,5 @@
+class LLMOverloadedError(RuntimeError):
+    """The request was rejected (or shed from the queue) rather than adding to an overloaded backend's backlog."""
+
+    def __init__(self, reason: str):
+        super().__init__(f'LLM backend is overloaded: {reason}')
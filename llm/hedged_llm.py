@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Iterator
+
+import numpy as np
+from pydantic import BaseModel
+
+from .illm import ILLM, LLMResponse, LLMResponseChunk
+from .streaming import PrefetchedStream
+
+
+class HedgingMetrics(BaseModel):
+    requests: int = 0
+    hedged: int = 0  # requests which sent a duplicate (hedge) request
+    hedge_wins: int = 0  # hedged requests answered first by the hedge
+    primary_wins: int = 0  # hedged requests answered first by the primary anyway
+    budget_exhausted: int = 0  # requests which were slow enough to hedge, but the extra load cap was reached
+    hedge_delay: float = 0  # ms, the current hedging delay
+
+
+class HedgedLLM(ILLM):
+    """
+    Cuts an LLM backend's latency tail by hedging: when a request hasn't answered (or, when streaming, sent its first
+        chunk) within a percentile of the recently observed latencies, a duplicate request is sent to the same or an
+        alternate backend, and the first to answer wins. The loser is cancelled -- a stream is closed, a blocking call
+        which already started can't be interrupted, so its response is discarded.
+
+    The extra load is capped: at most `max_hedge_ratio` of the recent requests are hedged.
+
+    Usage:
+        llm = HedgedLLM(ChatGPT(...), alternate_llm=ChatGPT(..., base_url=other_region), latency_percentile=95)
+        echo_llm = EchoLLM(cache, llm)
+    """
+
+    def __init__(
+            self,
+            llm: ILLM,
+            alternate_llm: ILLM | None = None,
+            latency_percentile: float = 95,
+            max_hedge_ratio: float = 0.05,
+            window_size: int = 500,
+            min_observations: int = 20,
+            initial_hedge_delay: float = 2000,
+            max_workers: int = 32,
+    ):
+        """
+        :param alternate_llm: The backend hedges are sent to. Defaults to the primary backend.
+        :param latency_percentile: Hedge requests slower than this percentile of the primary's recent latencies
+            (time-to-first-chunk for streams).
+        :param max_hedge_ratio: The share of the last `window_size` requests which may be hedged.
+        :param initial_hedge_delay: The hedging delay (ms) until `min_observations` latencies are observed.
+        :param max_workers: The amount of threads running blocking (`ask`) requests.
+        """
+        if not 0 < latency_percentile < 100:
+            raise ValueError('latency_percentile must be between 0 and 100')
+        self._llm = llm
+        self._alternate_llm = alternate_llm or llm
+        self._latency_percentile = latency_percentile
+        self._max_hedge_ratio = max_hedge_ratio
+        self._min_observations = min_observations
+        self._initial_hedge_delay = initial_hedge_delay
+        self._latencies: deque[float] = deque(maxlen=window_size)
+        self._recent_hedges: deque[bool] = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._metrics = HedgingMetrics(hedge_delay=initial_hedge_delay)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedged-llm')
+
+    @property
+    def model_name(self) -> str:
+        return self._llm.model_name
+
+    @property
+    def options(self) -> dict[str, Any]:
+        return self._llm.options
+
+    def metrics(self) -> HedgingMetrics:
+        with self._lock:
+            return self._metrics.model_copy(update={'hedge_delay': self._hedge_delay()})
+
+    def ask(self, prompt: str, **kwargs) -> LLMResponse:
+        start_time = time.perf_counter()
+        primary = self._executor.submit(self._llm.ask, prompt, **kwargs)
+        primary.add_done_callback(lambda _: self._observe_latency(start_time))
+        is_due = not wait([primary], timeout=self._hedge_delay() / 1000).done
+        if not self._try_hedge(is_due):
+            return primary.result()
+
+        hedge = self._executor.submit(self._alternate_llm.ask, prompt, **kwargs)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next(iter(done))
+            if winner.exception() is None or not pending:
+                break  # the first response wins, unless it failed and the other may still succeed
+        for loser in pending:
+            loser.cancel()
+        self._record_winner(winner is primary)
+        return winner.result()
+
+    def stream_ask(self, prompt: str, **kwargs) -> Iterator[LLMResponseChunk]:
+        start_time = time.perf_counter()
+        ready = threading.Event()
+
+        def on_primary_ready():
+            self._observe_latency(start_time)
+            ready.set()
+
+        primary = PrefetchedStream(self._llm.stream_ask(prompt, **kwargs), on_ready=on_primary_ready)
+        is_due = not ready.wait(self._hedge_delay() / 1000)
+        if not self._try_hedge(is_due):
+            return self._serve(primary)
+
+        hedge = PrefetchedStream(self._alternate_llm.stream_ask(prompt, **kwargs), on_ready=ready.set)
+        streams = [primary, hedge]
+        while True:
+            ready.wait()
+            ready.clear()  # before checking, so a stream getting ready meanwhile sets it for the next wait
+            answered = [stream for stream in streams if stream.is_ready and not stream.failed]
+            if answered:
+                winner = answered[0]
+                break
+            if all(stream.is_ready for stream in streams):
+                winner = primary  # both failed, the primary's error is raised
+                break
+        for stream in streams:
+            if stream is not winner:
+                stream.close()
+        self._record_winner(winner is primary)
+        return self._serve(winner)
+
+    @staticmethod
+    def _serve(stream: PrefetchedStream[LLMResponseChunk]) -> Iterator[LLMResponseChunk]:
+        try:
+            yield from stream
+        finally:
+            stream.close()  # stop the backend's stream if the caller abandoned it
+
+    def _hedge_delay(self) -> float:
+        latencies = list(self._latencies)  # a snapshot, they're appended to by other threads
+        if len(latencies) < self._min_observations:
+            return self._initial_hedge_delay
+        return float(np.percentile(latencies, self._latency_percentile))
+
+    def _observe_latency(self, start_time: float) -> None:
+        with self._lock:
+            self._latencies.append((time.perf_counter() - start_time) * 1000)
+
+    def _try_hedge(self, is_due: bool) -> bool:
+        """Counts a request, and returns whether to hedge it: if it's due for a hedge and within the extra load cap."""
+        with self._lock:
+            self._metrics.requests += 1
+            hedges_cap = self._max_hedge_ratio * (len(self._recent_hedges) + 1)
+            allowed = is_due and sum(self._recent_hedges) + 1 <= hedges_cap
+            self._recent_hedges.append(allowed)
+            if allowed:
+                self._metrics.hedged += 1
+            elif is_due:
+                self._metrics.budget_exhausted += 1
+            return allowed
+
+    def _record_winner(self, is_primary: bool) -> None:
+        with self._lock:
+            if is_primary:
+                self._metrics.primary_wins += 1
+            else:
+                self._metrics.hedge_wins += 1
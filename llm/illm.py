@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Iterator
+from typing import Any, Iterator
 
 from pydantic import BaseModel, Field
 
@@ -20,6 +20,16 @@ class LLMResponseChunk(BaseModel):
 
 
 class ILLM(ABC):
+    @property
+    def model_name(self) -> str:
+        """Identifies the model behind the backend, e.g. for tracking per-model statistics."""
+        return type(self).__name__
+
+    @property
+    def options(self) -> dict[str, Any]:
+        """The generation options the backend sends with every request, which its responses depend on."""
+        return {}
+
     @abstractmethod
     def ask(self, prompt: str, **kwargs) -> LLMResponse:
         raise NotImplementedError
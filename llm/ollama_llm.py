@@ -1,3 +1,5 @@
+import logging
+import threading
 import time
 from enum import StrEnum
 from typing import Any, Iterator
@@ -5,8 +7,12 @@ from typing import Any, Iterator
 import ollama
 from tqdm import tqdm
 
+from transport import SharedTransport, default_transport
 from .illm import ILLM, LLMResponse, LLMResponseChunk
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('EchoLLM')
+
 
 class OllamaModel(StrEnum):
     QWEN3_4B = "qwen3:4b"
@@ -37,13 +43,68 @@ class OllamaResponseChunk(LLMResponseChunk):
 
 
 class Ollama(ILLM):
-    def __init__(self, model: OllamaModel, host: str, options: dict[str, Any] | None = None):
-        self._client = ollama.Client(host=host)
-        self._pull_model(model)
+    def __init__(
+            self,
+            model: OllamaModel,
+            host: str,
+            options: dict[str, Any] | None = None,
+            transport: SharedTransport | None = None,
+            keep_alive: float | str | None = None,
+            warm_up: bool = True,
+            provision_in_background: bool = False,
+    ):
+        """
+        Provisions the model: pulls it only if the server doesn't have it yet, then preloads it with a warm-up
+            request, so the first real request doesn't pay for the model load.
+
+        :param transport: The connection pool to send requests through. Defaults to the process-wide one.
+        :param keep_alive: How long the server keeps the model loaded after a request, e.g. '30m', or -1 to keep it
+            loaded. Defaults to the server's setting (5 minutes).
+        :param warm_up: Whether to preload the model once it's available.
+        :param provision_in_background: Whether to provision on a background thread instead of blocking the
+            constructor. Requests wait until provisioning completes, see `is_ready` and `wait_until_ready`.
+        """
+        transport = transport or default_transport()
+        self._client = ollama.Client(host=host, transport=transport, timeout=transport.timeout)
         self._model = model
         self._options = options or {}
+        self._keep_alive = keep_alive
+        self._provisioned = threading.Event()
+        self._provisioning_error: Exception | None = None
+        if provision_in_background:
+            threading.Thread(
+                target=self._provision, args=(warm_up,), name=f'ollama-provision-{model}', daemon=True
+            ).start()
+        else:
+            self._provision(warm_up)
+            self.wait_until_ready()
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the model is available (and preloaded, if warm up is on)."""
+        return self._provisioned.is_set() and self._provisioning_error is None
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until provisioning completes, or `timeout` seconds pass. Returns whether the model is ready.
+            Raises the provisioning's error if it failed.
+        """
+        if not self._provisioned.wait(timeout):
+            return False
+        if self._provisioning_error is not None:
+            raise self._provisioning_error
+        return True
+
+    @property
+    def model_name(self) -> str:
+        return str(self._model)
+
+    @property
+    def options(self) -> dict[str, Any]:
+        return dict(self._options)
 
     def ask(self, prompt: str, think: bool = False) -> OllamaResponse:
+        self.wait_until_ready()
         start_time = time.perf_counter()
         result = self._client.generate(
             model=self._model,
@@ -51,12 +112,14 @@ class Ollama(ILLM):
             options=self._options,
             think=think,
             stream=False,
+            keep_alive=self._keep_alive,
         )
         end_time = time.perf_counter()
         elapsed_ms = (end_time - start_time) * 1000
         return OllamaResponse(response=result.response, latency=elapsed_ms)
 
     def stream_ask(self, prompt: str, think: bool = False) -> Iterator[OllamaResponseChunk]:
+        self.wait_until_ready()
         start_time = time.perf_counter()
         stream = self._client.generate(
             model=self._model,
@@ -64,6 +127,7 @@ class Ollama(ILLM):
             options=self._options,
             think=think,
             stream=True,
+            keep_alive=self._keep_alive,
         )
         for i, chunk in enumerate(stream, start=1):
             current_time = time.perf_counter()
@@ -73,6 +137,31 @@ class Ollama(ILLM):
                 delay=(current_time - start_time) * 1000,
             )
 
+    def _provision(self, warm_up: bool):
+        try:
+            if self._is_model_available():
+                logger.info(f'Model "{self._model}" is already available')
+            else:
+                self._pull_model(self._model)
+            if warm_up:
+                self._warm_up()
+        except Exception as e:
+            logger.exception(f'Provisioning model "{self._model}" failed')
+            self._provisioning_error = e
+        finally:
+            self._provisioned.set()
+
+    def _is_model_available(self) -> bool:
+        # the server lists models with their tag, and a model requested without one is the `latest` tag
+        model = self._model if ':' in self._model else f'{self._model}:latest'
+        return any(m.model == model for m in self._client.list().models)
+
+    def _warm_up(self):
+        start_time = time.perf_counter()
+        # an empty prompt only loads the model
+        self._client.generate(model=self._model, prompt='', keep_alive=self._keep_alive)
+        logger.info(f'Model "{self._model}" loaded in {(time.perf_counter() - start_time) * 1000:.0f}ms')
+
     def _pull_model(self, model: str):
         pbar = None
         for c in self._client.pull(model, stream=True):
@@ -0,0 +1,80 @@
+import queue
+import threading
+from typing import Callable, Iterator, TypeVar, Generic
+
+T = TypeVar('T')
+
+_END = object()
+
+
+class PrefetchedStream(Generic[T]):
+    """
+    Starts consuming an iterator on a background thread as soon as it's created, buffering its items until read.
+
+    Wrapping a lazy generator (e.g. an LLM stream) with it sends the underlying request right away, instead of
+        when the caller asks for the first item. Closing it stops the background consumption (if abandoned early).
+    """
+
+    def __init__(self, iterator: Iterator[T], on_ready: Callable[[], None] | None = None):
+        """:param on_ready: Called (on the background thread) once the first item, or the end, is buffered."""
+        self._buffer: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        self._failed = False
+        self._on_ready = on_ready
+        self._thread = threading.Thread(target=self._consume, args=(iterator,), daemon=True)
+        self._thread.start()
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the first item (or the end) is buffered, i.e. reading won't block."""
+        return self._ready.is_set()
+
+    @property
+    def failed(self) -> bool:
+        """Whether the stream ended with an error before its first item."""
+        return self._failed
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def __iter__(self) -> 'PrefetchedStream[T]':
+        return self
+
+    def __next__(self) -> T:
+        item, error = self._buffer.get()
+        if item is _END:
+            self._buffer.put((_END, error))  # keep the stream exhausted for later calls
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def close(self) -> None:
+        self._stopped.set()
+
+    def _consume(self, iterator: Iterator[T]) -> None:
+        error = None
+        try:
+            for item in iterator:
+                if self._stopped.is_set():
+                    break
+                self._buffer.put((item, None))
+                self._set_ready()
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()  # a generator can only be closed by the thread iterating it
+            self._buffer.put((_END, error))
+            if not self._ready.is_set():
+                self._failed = error is not None
+                self._set_ready()
+
+    def _set_ready(self) -> None:
+        if self._ready.is_set():
+            return
+        self._ready.set()
+        if self._on_ready is not None:
+            self._on_ready()
@@ -1 +1,2 @@
-from .embedders import openai_embedder, sbert_embedder
+from .embedders import openai_embedder, sbert_embedder, onnx_embedder
+from .persistent_embedding_cache import PersistentEmbeddingCache
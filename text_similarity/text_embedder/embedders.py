@@ -1,19 +1,38 @@
 from functools import lru_cache
+from typing import TYPE_CHECKING
 
 import numpy as np
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
+
+from text_similarity.vector_utils import Vector, as_vector
+from transport import SharedTransport, default_transport
+
+if TYPE_CHECKING:
+    # imported at first use, a process embedding with one backend shouldn't pay for importing the other (e.g. torch)
+    from openai import OpenAI
+    from sentence_transformers import SentenceTransformer
+    from .onnx_encoder import OnnxEncoder
+
+
+@lru_cache
+def _load_openai_client(transport: SharedTransport) -> 'OpenAI':
+    from openai import OpenAI
+    return OpenAI(http_client=transport.client())
 
 
 @lru_cache
-def openai_embedder(text: str, model='text-embedding-3-small') -> list[float]:
-    openai_client = OpenAI()
+def openai_embedder(
+    text: str,
+    model='text-embedding-3-small',
+    transport: SharedTransport | None = None,
+) -> Vector:
+    openai_client = _load_openai_client(transport or default_transport())
     response = openai_client.embeddings.create(model=model, input=text)
-    return response.data[0].embedding
+    return _read_only(as_vector(response.data[0].embedding))
 
 
 @lru_cache
-def _load_sbert_model(model: str) -> SentenceTransformer:
+def _load_sbert_model(model: str) -> 'SentenceTransformer':
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer(model)
 
 
@@ -22,11 +41,46 @@ def sbert_embedder(
     text: str,
     model: str = "sentence-transformers/all-MiniLM-L6-v2",
     normalize: bool = False,
-) -> list[float]:
+) -> Vector:
     model = _load_sbert_model(model)
     emb = model.encode(
         text,
         convert_to_numpy=True,
         normalize_embeddings=normalize,  # set True if you want cosine-friendly vectors
     )
-    return np.asarray(emb, dtype=np.float32).tolist()
+    return _read_only(as_vector(emb))
+
+
+@lru_cache
+def _load_onnx_encoder(
+        model: str, file_name: str, intra_op_threads: int | None, inter_op_threads: int
+) -> 'OnnxEncoder':
+    from .onnx_encoder import OnnxEncoder
+    return OnnxEncoder(model, file_name, intra_op_threads, inter_op_threads)
+
+
+@lru_cache
+def onnx_embedder(
+    text: str,
+    model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    file_name: str = "onnx/model.onnx",
+    normalize: bool = False,
+    intra_op_threads: int | None = None,
+    inter_op_threads: int = 1,
+) -> Vector:
+    """
+    A drop-in replacement of `sbert_embedder` for CPU-only hosts: the same model and vectors, run by ONNX Runtime
+        instead of torch. See `OnnxEncoder`.
+
+    The default file is the float32 export, which runs on any CPU. The int8-quantized ones are faster, at the cost of
+        some quantization error, but CPU-specific -- e.g. `onnx/model_qint8_avx512.onnx` for AVX-512 VNNI hosts, or
+        `onnx/model_qint8_arm64.onnx`; check their agreement with `_benchmarks/embedder_benchmark.py` first.
+    """
+    encoder = _load_onnx_encoder(model, file_name, intra_op_threads, inter_op_threads)
+    return _read_only(encoder.encode([text], normalize)[0])
+
+
+def _read_only(vector: np.ndarray) -> np.ndarray:
+    # the embedders are memoized, so callers share the returned arrays -- make sure no one changes them in place
+    vector.setflags(write=False)
+    return vector
@@ -0,0 +1,198 @@
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    # imported at first use, like the other backends
+    import onnxruntime
+    from tokenizers import Tokenizer
+
+_TOKENIZER_FILE = 'tokenizer.json'
+_MODULES_FILE = 'modules.json'
+# the pooling modes OnnxEncoder implements, in the order sentence-transformers concatenates them in
+_POOLING_MODES = ('cls_token', 'max_tokens', 'mean_tokens', 'mean_sqrt_len_tokens')
+
+
+class OnnxEncoder:
+    """
+    Runs an exported sentence-transformers model with ONNX Runtime on the CPU, without torch. The transformer is the
+        ONNX file, the pooling and normalization after it are read from the model's `modules.json` (and its Pooling
+        module's config), so the vectors are those of `SentenceTransformer.encode`. A model without `modules.json` is
+        mean pooled, like sentence-transformers does.
+
+    Int8-quantized exports cut the latency further -- the hub repos of the popular models ship them, e.g.
+        `onnx/model_qint8_avx512.onnx` in `sentence-transformers/all-MiniLM-L6-v2` (for CPUs with AVX-512 VNNI, others
+        run it slower, if at all), else see `export_onnx_model`.
+
+    The threads are set explicitly: `intra_op_threads` parallelize a single forward pass (what a lookup waits for),
+        `inter_op_threads` run independent graph nodes concurrently (rarely worth more than 1 for these models).
+    """
+
+    def __init__(
+            self,
+            model: str | Path,
+            file_name: str = 'onnx/model.onnx',
+            intra_op_threads: int | None = None,
+            inter_op_threads: int = 1,
+            max_length: int = 256,
+    ):
+        """
+        :param model: A local directory, or a hub repo id, holding the ONNX file, `tokenizer.json` and (optionally)
+            `modules.json`.
+        :param file_name: The ONNX file, relative to the model's directory.
+        :param intra_op_threads: Defaults to up to 4 -- beyond that, short prompts gain little from more threads.
+        :param max_length: Longer texts are truncated, in tokens.
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or min(4, os.cpu_count() or 1)
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session: 'onnxruntime.InferenceSession' = onnxruntime.InferenceSession(
+            _model_file(model, file_name), options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+
+        self._tokenizer: 'Tokenizer' = Tokenizer.from_file(_model_file(model, _TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length)
+        self._tokenizer.enable_padding()
+
+        self._pooling_modes, self._normalize = _load_pooling(model)
+
+    def encode(self, texts: list[str], normalize: bool = False) -> np.ndarray:
+        """
+        Returns the texts' embeddings, a float32 row per text.
+
+        :param normalize: Whether to scale the embeddings to unit length, they are anyway if the model normalizes them.
+        """
+        encodings = self._tokenizer.encode_batch(texts)
+        attention_mask = np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            'input_ids': np.asarray([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': attention_mask,
+            'token_type_ids': np.asarray([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self._session.run(
+            None, {name: value for name, value in inputs.items() if name in self._input_names}
+        )[0]
+
+        embeddings = _pool(token_embeddings, attention_mask, self._pooling_modes)
+        if normalize or self._normalize:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings.astype(np.float32, copy=False)
+
+
+def export_onnx_model(model: str, output_dir: Path, quantize: bool = True) -> Path:
+    """
+    Exports a sentence-transformers model's transformer to `output_dir/onnx/model.onnx` (and its int8 dynamically
+        quantized version to `onnx/model_qint8.onnx`), with its `tokenizer.json` and the modules after the transformer
+        (`modules.json`, the pooling config), for models whose hub repo doesn't ship ONNX files. Needs torch and the
+        `onnx` package, the exported model doesn't.
+
+    Returns the directory, to pass as `OnnxEncoder`'s model.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    sentence_transformer = SentenceTransformer(model, device='cpu')
+    transformer = sentence_transformer[0]
+    onnx_dir = output_dir / 'onnx'
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    transformer.tokenizer.save_pretrained(output_dir)
+
+    # the layout of `SentenceTransformer.save`, the transformer's own files aside (it's the ONNX file)
+    modules = []
+    for index, (name, module) in enumerate(sentence_transformer.named_children()):
+        module_type = type(module).__name__
+        path = f'{index}_{module_type}' if index > 0 else ''
+        if index > 0:
+            (output_dir / path).mkdir(exist_ok=True)
+            module.save(str(output_dir / path))
+        modules.append({'idx': index, 'name': name, 'path': path, 'type': f'sentence_transformers.models.{module_type}'})
+    (output_dir / _MODULES_FILE).write_text(json.dumps(modules, indent=2), encoding='utf-8')
+
+    auto_model = transformer.auto_model.eval()
+    sample = transformer.tokenizer(['an example'], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            tuple(sample[name] for name in input_names),
+            onnx_dir / 'model.onnx',
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes={**dynamic_axes, 'last_hidden_state': {0: 'batch', 1: 'sequence'}},
+            dynamo=False,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(onnx_dir / 'model.onnx', onnx_dir / 'model_qint8.onnx', weight_type=QuantType.QInt8)
+    return output_dir
+
+
+def _load_pooling(model: str | Path) -> tuple[list[str], bool]:
+    """Returns the model's pooling modes, and whether it normalizes the pooled embeddings."""
+    modules_file = _optional_model_file(model, _MODULES_FILE)
+    if modules_file is None:
+        return ['mean_tokens'], False
+
+    pooling_modes, normalize = ['mean_tokens'], False
+    for module in json.loads(Path(modules_file).read_text(encoding='utf-8')):
+        module_type = module['type'].rsplit('.', 1)[-1]
+        if module_type == 'Transformer':
+            continue
+        if module_type == 'Normalize':
+            normalize = True
+        elif module_type == 'Pooling':
+            config_path = f'{module["path"]}/config.json' if module['path'] else 'config.json'
+            config = json.loads(Path(_model_file(model, config_path)).read_text(encoding='utf-8'))
+            enabled = {key.removeprefix('pooling_mode_') for key, value in config.items()
+                       if key.startswith('pooling_mode_') and value is True}
+            if unsupported := enabled - set(_POOLING_MODES):
+                raise ValueError(f'Pooling modes {sorted(unsupported)} of {model} are not supported')
+            pooling_modes = [mode for mode in _POOLING_MODES if mode in enabled]
+        else:
+            raise ValueError(f'The {module["type"]} module of {model} is not supported')
+    return pooling_modes, normalize
+
+
+def _pool(token_embeddings: np.ndarray, attention_mask: np.ndarray, modes: list[str]) -> np.ndarray:
+    """Pools the real (not padding) tokens' embeddings like sentence-transformers' Pooling module."""
+    mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+    token_counts = np.maximum(mask.sum(axis=1), 1e-9)
+    pooled = []
+    for mode in modes:
+        if mode == 'cls_token':
+            pooled.append(token_embeddings[:, 0])
+        elif mode == 'max_tokens':
+            pooled.append(np.where(mask > 0, token_embeddings, -1e9).max(axis=1))
+        else:
+            sums = (token_embeddings * mask).sum(axis=1)
+            pooled.append(sums / token_counts if mode == 'mean_tokens' else sums / np.sqrt(token_counts))
+    return np.concatenate(pooled, axis=1)
+
+
+def _model_file(model: str | Path, file_name: str) -> str:
+    if Path(model).is_dir():
+        return str(Path(model) / file_name)
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(str(model), file_name)
+
+
+def _optional_model_file(model: str | Path, file_name: str) -> str | None:
+    if Path(model).is_dir():
+        path = Path(model) / file_name
+        return str(path) if path.exists() else None
+    from huggingface_hub.utils import EntryNotFoundError
+    try:
+        return _model_file(model, file_name)
+    except EntryNotFoundError:
+        return None
@@ -0,0 +1,198 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from text_similarity.vector_utils import Vector, as_vector
+
+_CWD = Path(__file__).parent
+
+
+class PersistentEmbeddingCache:
+    """
+    Disk-backed, byte-bounded LRU store of embeddings, wrapping any embedder callable.
+
+    Vectors are stored as float32 blobs in a SQLite file (WAL mode), keyed by (model, normalized text hash),
+        so they survive restarts and are shared between every process pointing at the same file.
+        WAL lets any number of readers run concurrently with a single writer across processes.
+        Within a process, the connection is shared by every thread calling the embedder, and its use is serialized.
+
+    Usage:
+        embedder = PersistentEmbeddingCache(text_embedder.openai_embedder, model='text-embedding-3-small')
+        cache = LRUSimilarityCache(..., prompt_embedder=embedder)
+    """
+
+    _TABLE = 'embeddings'
+
+    def __init__(
+            self,
+            embedder: Callable[[str], Vector],
+            model: str,
+            max_bytes: int = 256 * 1024 * 1024,
+            db_path: Path = _CWD / 'resources/embeddings.db',
+            touch_resolution: float = 60.0,
+            busy_timeout: float = 30.0,
+    ):
+        """
+        :param embedder: The wrapped embedder, called on cache misses only.
+        :param model: The embedding model name. Part of the key, so different models never share vectors.
+        :param max_bytes: Upper bound on the total size of stored vectors. Least recently used vectors are evicted
+            once it is exceeded.
+        :param db_path: The SQLite file holding the vectors. Point every process at the same file to share them.
+        :param touch_resolution: Minimal time (in seconds) between two last-access updates of the same vector.
+            Keeps hits read-only most of the time, so readers rarely contend for the write lock.
+        :param busy_timeout: Time (in seconds) to wait for another process holding the write lock.
+        """
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be greater than 0!')
+
+        self._embedder = embedder
+        self.model = model
+        self.max_bytes = max_bytes
+        self._touch_resolution = touch_resolution
+
+        self._db_file = db_path
+        self._db_file.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit mode -- transactions are opened explicitly where atomicity is needed
+        # the embedder is called from other threads too (e.g. a server's worker), `_lock` serializes the connection's use
+        self._connection = sqlite3.connect(
+            self._db_file, timeout=busy_timeout, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {self._TABLE} ('
+            'key TEXT PRIMARY KEY,'
+            'model TEXT NOT NULL,'
+            'vector BLOB NOT NULL,'
+            'nbytes INTEGER NOT NULL,'
+            'last_access REAL NOT NULL'
+            ');'
+        )
+        self._connection.execute(
+            f'CREATE INDEX IF NOT EXISTS {self._TABLE}_last_access ON {self._TABLE} (last_access);'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), nbytes INTEGER NOT NULL);'
+        )
+        self._connection.execute('INSERT OR IGNORE INTO usage (id, nbytes) VALUES (0, 0);')
+
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, text: str) -> Vector:
+        key = self._generate_key(self.model, text)
+
+        vector = self._fetch(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        self.misses += 1
+        vector = as_vector(self._embedder(text))  # a float32 ndarray, like the hits
+        self._save(key, vector)
+        return vector
+
+    def size(self) -> int:
+        """Returns the amount of stored vectors."""
+        with self._lock:
+            row = self._connection.execute(f'SELECT COUNT(*) FROM {self._TABLE}').fetchone()
+        return int(row[0])
+
+    def used_bytes(self) -> int:
+        """Returns the total size of stored vectors."""
+        with self._lock:
+            row = self._connection.execute('SELECT nbytes FROM usage WHERE id = 0').fetchone()
+        return int(row[0])
+
+    def clear(self) -> None:
+        with self._write_transaction():
+            self._connection.execute(f'DELETE FROM {self._TABLE}')
+            self._connection.execute('UPDATE usage SET nbytes = 0 WHERE id = 0')
+
+    def disconnect(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _fetch(self, key: str) -> Vector | None:
+        with self._lock:
+            row = self._connection.execute(
+                f'SELECT vector, last_access FROM {self._TABLE} WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            blob, last_access = row
+            now = time.time()
+            if now - last_access >= self._touch_resolution:
+                # best-effort recency update; losing it to a concurrent writer only makes eviction slightly less exact
+                try:
+                    self._connection.execute(f'UPDATE {self._TABLE} SET last_access = ? WHERE key = ?', (now, key))
+                except sqlite3.OperationalError:
+                    pass
+        return np.frombuffer(blob, dtype=np.float32)  # read-only, and without a copy of the blob
+
+    def _save(self, key: str, vector: Vector) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        if len(blob) > self.max_bytes:
+            return  # would evict everything else and still not fit
+
+        with self._write_transaction():
+            # another process may have stored the same vector meanwhile -- count its bytes only once
+            cur = self._connection.execute(
+                f'INSERT OR IGNORE INTO {self._TABLE} (key, model, vector, nbytes, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, self.model, blob, len(blob), time.time()),
+            )
+            if cur.rowcount > 0:
+                self._connection.execute('UPDATE usage SET nbytes = nbytes + ? WHERE id = 0', (len(blob),))
+            self._evict()
+
+    def _evict(self) -> None:
+        """Evicts least recently used vectors until the store fits `max_bytes`. Must run inside a write transaction."""
+        used = self._connection.execute('SELECT nbytes FROM usage WHERE id = 0').fetchone()[0]
+        while used > self.max_bytes:
+            victims = self._connection.execute(
+                f'SELECT key, nbytes FROM {self._TABLE} ORDER BY last_access LIMIT 64'
+            ).fetchall()
+            if not victims:
+                break
+            for victim_key, nbytes in victims:
+                self._connection.execute(f'DELETE FROM {self._TABLE} WHERE key = ?', (victim_key,))
+                used -= nbytes
+                if used <= self.max_bytes:
+                    break
+        self._connection.execute('UPDATE usage SET nbytes = ? WHERE id = 0', (max(used, 0),))
+
+    @contextmanager
+    def _write_transaction(self):
+        # `BEGIN IMMEDIATE` takes the write lock up front, so concurrent writers queue instead of failing mid-way
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return ' '.join(unicodedata.normalize('NFC', text).split())
+
+    @classmethod
+    def _generate_key(cls, model: str, text: str) -> str:
+        return hashlib.sha256(f'{model}\0{cls._normalize(text)}'.encode()).hexdigest()
+
+    def __del__(self):
+        self.disconnect()
+
@@ -1 +1,11 @@
 from .calculators import euclidean_distance, manhattan_distance, cosine_distance, normalize
+from .kernels import (
+    euclidean_distances,
+    manhattan_distances,
+    cosine_distances,
+    pairwise_euclidean_distances,
+    pairwise_manhattan_distances,
+    pairwise_cosine_distances,
+    normalized,
+)
+from .vector import Vector, as_vector, as_matrix
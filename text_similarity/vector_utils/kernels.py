@@ -0,0 +1,64 @@
+"""
+Vectorized distance kernels over float32 arrays: one query against the rows of a matrix (`*_distances`), and every
+    row of one matrix against every row of another (`pairwise_*_distances`). They match the scalar functions in
+    `calculators` (including the cosine convention for zero vectors), without per-element Python overhead.
+"""
+import numpy as np
+
+from .vector import as_vector, as_matrix
+
+
+def euclidean_distances(query, vectors) -> np.ndarray:
+    differences = as_matrix(vectors) - as_vector(query)
+    return np.sqrt(np.einsum('ij,ij->i', differences, differences))
+
+
+def manhattan_distances(query, vectors) -> np.ndarray:
+    return np.abs(as_matrix(vectors) - as_vector(query)).sum(axis=1)
+
+
+def cosine_distances(query, vectors) -> np.ndarray:
+    query, vectors = as_vector(query), as_matrix(vectors)
+    return _cosine_from_dots(vectors @ query, np.linalg.norm(query), np.linalg.norm(vectors, axis=1))
+
+
+def pairwise_euclidean_distances(vectors1, vectors2) -> np.ndarray:
+    vectors1, vectors2 = as_matrix(vectors1), as_matrix(vectors2)
+    # ||a-b||^2 = ||a||^2 + ||b||^2 - 2a.b, clipped as rounding may make it slightly negative
+    squared = (np.einsum('ij,ij->i', vectors1, vectors1)[:, None]
+               + np.einsum('ij,ij->i', vectors2, vectors2)[None, :]
+               - 2 * (vectors1 @ vectors2.T))
+    return np.sqrt(np.maximum(squared, 0))
+
+
+def pairwise_manhattan_distances(vectors1, vectors2) -> np.ndarray:
+    vectors1, vectors2 = as_matrix(vectors1), as_matrix(vectors2)
+    # row by row -- broadcasting all the pairs at once allocates an (n, m, dim) array, and is slower for it
+    distances = np.empty((len(vectors1), len(vectors2)), dtype=np.float32)
+    for i, vector in enumerate(vectors1):
+        distances[i] = np.abs(vectors2 - vector).sum(axis=1)
+    return distances
+
+
+def pairwise_cosine_distances(vectors1, vectors2) -> np.ndarray:
+    vectors1, vectors2 = as_matrix(vectors1), as_matrix(vectors2)
+    return _cosine_from_dots(
+        vectors1 @ vectors2.T, np.linalg.norm(vectors1, axis=1)[:, None], np.linalg.norm(vectors2, axis=1)[None, :]
+    )
+
+
+def normalized(vector) -> np.ndarray:
+    """L2-normalized copy of a vector. An all zeros vector is returned as is."""
+    vector = as_vector(vector)
+    norm = np.linalg.norm(vector)
+    return vector if norm == 0 else vector / norm
+
+
+def _cosine_from_dots(dots: np.ndarray, norms1, norms2) -> np.ndarray:
+    norms_products = norms1 * norms2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = 1 - dots / norms_products
+    # convention: two zero vectors are identical, a zero vector and a non-zero one are maximally distant
+    zeros1, zeros2 = np.asarray(norms1 == 0), np.asarray(norms2 == 0)
+    distances = np.where(zeros1 & zeros2, 0, np.where(zeros1 | zeros2, 1, distances))
+    return distances.astype(np.float32, copy=False)
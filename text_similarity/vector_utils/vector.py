@@ -0,0 +1,30 @@
+from typing import Annotated, Any
+
+import numpy as np
+from pydantic import PlainSerializer, PlainValidator
+
+
+def as_vector(vector: Any) -> np.ndarray:
+    """A 1-D float32 array of the vector, which is the vector itself (no copy) if it already is one."""
+    array = np.asarray(vector, dtype=np.float32)
+    if array.ndim != 1:
+        raise ValueError(f'Expected a 1-D vector, got shape {array.shape}')
+    return array
+
+
+def as_matrix(vectors: Any) -> np.ndarray:
+    """A 2-D float32 array of the vectors (one per row), without a copy if it already is one."""
+    if isinstance(vectors, (list, tuple)) and vectors and isinstance(vectors[0], np.ndarray):
+        return np.stack(vectors).astype(np.float32, copy=False)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        raise ValueError(f'Expected a 2-D matrix, got shape {matrix.shape}')
+    return matrix
+
+
+# a float32 vector field of pydantic models -- validated from any sequence, dumped to a list only for JSON
+Vector = Annotated[
+    np.ndarray,
+    PlainValidator(as_vector),
+    PlainSerializer(lambda vector: vector.tolist(), return_type=list[float], when_used='json'),
+]
@@ -0,0 +1 @@
+from .shared_transport import TransportConfig, HostConnectionStats, SharedTransport, default_transport
@@ -0,0 +1,114 @@
+import threading
+from functools import lru_cache
+from typing import Any, Callable
+
+import httpx
+from pydantic import BaseModel
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class TransportConfig(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0  # seconds an idle connection is kept open for reuse
+    http2: bool = False  # requires the `h2` package (`pip install httpx[http2]`)
+    connect_timeout: float = 5.0  # seconds
+    read_timeout: float = 600.0  # seconds between received bytes, generations can be slow to start
+    write_timeout: float = 30.0  # seconds
+    pool_timeout: float = 10.0  # seconds waiting for a free connection when the pool is exhausted
+
+
+class HostConnectionStats(BaseModel):
+    requests: int = 0
+    new_connections: int = 0  # requests which had to open (and TLS handshake) a connection
+
+    @property
+    def reused_connections(self) -> int:
+        return self.requests - self.new_connections
+
+    @property
+    def reuse_ratio(self) -> float:
+        return self.reused_connections / self.requests if self.requests else 0.0
+
+
+class SharedTransport(httpx.BaseTransport):
+    """
+    One connection pool shared by every HTTP client in the process (LLM backends, embedders), so connections and
+        TLS sessions opened by one component are reused by the others instead of each component paying for its own.
+
+    Usage:
+        transport = SharedTransport(TransportConfig(max_keepalive_connections=50))
+        llm = ChatGPT(model, api_key, base_url, transport=transport)
+        embedder = partial(text_embedder.openai_embedder, transport=transport)
+        transport.host_stats()  # {'api.openai.com:443': HostConnectionStats(requests=..., new_connections=...)}
+
+    Closing a client built on it (e.g. when an OpenAI client is garbage collected) leaves the pool open,
+        as other clients still use it -- call `shutdown` to close it.
+    """
+
+    def __init__(self, config: TransportConfig | None = None):
+        self.config = config or TransportConfig()
+        self._transport = httpx.HTTPTransport(
+            http2=self.config.http2,
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+                keepalive_expiry=self.config.keepalive_expiry,
+            ),
+        )
+        self._host_stats: dict[str, HostConnectionStats] = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        """The timeouts for clients built on this transport (timeouts are set per request, by the client)."""
+        return httpx.Timeout(
+            connect=self.config.connect_timeout,
+            read=self.config.read_timeout,
+            write=self.config.write_timeout,
+            pool=self.config.pool_timeout,
+        )
+
+    def client(self, **kwargs: Any) -> httpx.Client:
+        return httpx.Client(transport=self, timeout=self.timeout, **kwargs)
+
+    def host_stats(self) -> dict[str, HostConnectionStats]:
+        with self._stats_lock:
+            return {host: stats.model_copy() for host, stats in self._host_stats.items()}
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        is_new_connection = False
+        user_trace: Callable[[str, dict[str, Any]], None] | None = request.extensions.get('trace')
+
+        def trace(event_name: str, info: dict[str, Any]) -> None:
+            nonlocal is_new_connection
+            if event_name == 'connection.connect_tcp.complete':
+                is_new_connection = True
+            if user_trace is not None:
+                user_trace(event_name, info)
+
+        request.extensions = {**request.extensions, 'trace': trace}
+        try:
+            return self._transport.handle_request(request)
+        finally:
+            port = request.url.port or _DEFAULT_PORTS.get(request.url.scheme)
+            self._record(f'{request.url.host}:{port}', is_new_connection)
+
+    def close(self) -> None:
+        pass  # shared by other clients, see `shutdown`
+
+    def shutdown(self) -> None:
+        self._transport.close()
+
+    def _record(self, host: str, is_new_connection: bool) -> None:
+        with self._stats_lock:
+            stats = self._host_stats.setdefault(host, HostConnectionStats())
+            stats.requests += 1
+            stats.new_connections += is_new_connection
+
+
+@lru_cache(maxsize=1)
+def default_transport() -> SharedTransport:
+    """The process-wide transport used by LLM backends and embedders which aren't given one."""
+    return SharedTransport()